@@ -0,0 +1,192 @@
+"""Per-year archives of old, closed clocktimes
+
+archive() moves closed clocktimes that ended before a cutoff out of the
+hot database file into one SQLite file per year of time_in, next to it:
+timesheet.db keeps recent and open shifts, timesheet-2013.db holds 2013.
+Employees, jobs and the daily rollup all stay in the hot file, so the
+menu's reports never look at the archives.
+
+Queries over arbitrary date ranges select from clocktimes(connection,
+start, end) instead of the clocktimes table. That's the table itself
+unless archives overlap the range, in which case they're ATTACHed to
+the connection and it's a UNION ALL of all of them, aliased as
+clocktimes:
+
+    table = archive.clocktimes(connection, start, end)
+    select([table.c.id, ...]).where(table.c.time_in >= start)
+"""
+
+import datetime
+import glob
+import logging
+import os
+import re
+from collections import Counter
+
+from sqlalchemy import Column, MetaData, Table, and_, func, select, union_all
+
+from models import Clocktime
+
+
+def _database_path(connectable):
+    """The hot database's file name, or None for an in-memory database"""
+    return connectable.engine.url.database or None
+
+
+def archive_path(database_path, year):
+    """timesheet.db -> timesheet-2013.db"""
+    root, ext = os.path.splitext(database_path)
+    return "{}-{:d}{}".format(root, year, ext or ".db")
+
+
+def archive_years(database_path):
+    """Returns the years archives exist for, in order"""
+    root, ext = os.path.splitext(database_path)
+    ext = ext or ".db"
+    pattern = re.compile(re.escape(root) + r"-(\d{4})" + re.escape(ext) + "$")
+    years = []
+    for path in glob.glob("{}-[0-9][0-9][0-9][0-9]{}".format(root, ext)):
+        match = pattern.match(path)
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+# the columns archives keep: not change_seq, as sync only looks at the hot
+# file (and archives made before it was added don't have it)
+ARCHIVE_COLUMNS = [column for column in Clocktime.__table__.columns
+                   if column.name != 'change_seq']
+
+# the hot table's time range indexes, for reports on archived years
+ARCHIVE_INDEXES = [(index.name, [column.name for column in index.columns])
+                   for index in Clocktime.__table__.indexes
+                   if 'time_in' in index.columns]
+
+
+def _schema(year):
+    return "archive_{:d}".format(year)
+
+
+def archive_table(year):
+    """The clocktimes Table in the archive for year, once attached
+
+    The hot table's ARCHIVE_COLUMNS, but no foreign keys: employees and
+    jobs live in the hot file.
+    """
+    return Table(Clocktime.__tablename__, MetaData(),
+                 *[Column(column.name, column.type,
+                          primary_key=column.primary_key)
+                   for column in ARCHIVE_COLUMNS],
+                 schema=_schema(year))
+
+
+def attach(connection, year, create=False):
+    """ATTACHes year's archive to connection if it isn't already
+
+    Returns its archive_table(). With create, a missing archive is
+    created; otherwise it's an error. Can't run inside a transaction.
+    """
+    table = archive_table(year)
+    attached = set(row[1] for row in
+                   connection.execute("PRAGMA database_list"))
+    if table.schema not in attached:
+        path = archive_path(_database_path(connection), year)
+        if not create and not os.path.exists(path):
+            raise ValueError("No archive for {} at {}".format(year, path))
+        connection.execute("ATTACH DATABASE ? AS {}".format(table.schema),
+                           (path,))
+    if create:
+        table.create(connection, checkfirst=True)
+        # SQLAlchemy doesn't schema-qualify index names for SQLite, which
+        # the attached database needs
+        for name, columns in ARCHIVE_INDEXES:
+            connection.execute("CREATE INDEX IF NOT EXISTS {}.{} ON {} ({})"
+                               .format(table.schema, name, table.name,
+                                       ", ".join(columns)))
+    return table
+
+
+def _year_start(year):
+    return datetime.datetime(year, 1, 1)
+
+
+def clocktimes(connection, start=None, end=None):
+    """Returns the table to select clocktimes with start <= time_in < end
+
+    Archives that can hold rows in the range are attached to connection.
+    """
+    hot = Clocktime.__table__
+    path = _database_path(connection)
+    if path is None:
+        return hot
+    tables = [attach(connection, year) for year in archive_years(path)
+              if (start is None or start < _year_start(year + 1)) and
+              (end is None or end > _year_start(year))]
+    if not tables:
+        return hot
+    return union_all(select(ARCHIVE_COLUMNS),
+                     *[select(list(table.c)) for table in tables])\
+        .alias(hot.name)
+
+
+def archive(engine, before, chunk_size=10000, vacuum=False):
+    """Moves closed clocktimes that ended before `before` into archives
+
+    Rows go to the archive for their time_in year, chunk_size at a time,
+    each chunk copied and deleted in one transaction. Returns a Counter
+    of rows moved per year. The newest clocktime always stays, so SQLite
+    never hands out an archived id again.
+
+    The copy uses INSERT OR IGNORE: in WAL mode a transaction spanning
+    attached files isn't atomic across them, so a crash can leave a
+    chunk in both, and running archive() again finishes moving it.
+
+    With vacuum, the hot file is VACUUMed afterwards to give the freed
+    pages back and keep the remaining rows together.
+    """
+    path = _database_path(engine)
+    if path is None:
+        raise ValueError("Only database files can be archived")
+    hot = Clocktime.__table__
+    moved = Counter()
+    with engine.connect() as connection:
+        newest = connection.execute(select([func.max(hot.c.id)])).scalar()
+        if newest is None:
+            return moved
+        closed = and_(hot.c.time_out != None, hot.c.time_out < before,
+                      hot.c.id < newest)
+        years = sorted(int(year) for (year,) in connection.execute(
+            select([func.strftime('%Y', hot.c.time_in)])
+            .where(closed).distinct()))
+        for year in years:
+            archived = attach(connection, year, create=True)
+            in_year = and_(closed,
+                           hot.c.time_in >= _year_start(year),
+                           hot.c.time_in < _year_start(year + 1))
+            last_id = 0
+            while True:
+                remaining = and_(in_year, hot.c.id > last_id)
+                # the last id of the next chunk, or None for the final one
+                chunk_end = connection.execute(
+                    select([hot.c.id]).where(remaining)
+                    .order_by(hot.c.id)
+                    .offset(chunk_size - 1).limit(1)).scalar()
+                chunk = remaining if chunk_end is None else \
+                    and_(remaining, hot.c.id <= chunk_end)
+                with connection.begin():
+                    connection.execute(
+                        archived.insert().prefix_with('OR IGNORE')
+                        .from_select([column.name
+                                      for column in ARCHIVE_COLUMNS],
+                                     select(ARCHIVE_COLUMNS).where(chunk)))
+                    count = connection.execute(
+                        hot.delete().where(chunk)).rowcount
+                moved[year] += count
+                if chunk_end is None:
+                    break
+                last_id = chunk_end
+            logging.info("Archived {} clocktimes from {} to {}".format(
+                moved[year], year, archive_path(path, year)))
+        if vacuum and moved:
+            connection.execute("VACUUM")
+    return moved
@@ -0,0 +1,124 @@
+"""Overlap, gap and bad duration checks over clocktime history
+
+audit() sweeps each employee's clocktimes in time_in order, as read
+straight off the (employee_id, time_in) index, remembering only the
+latest end time seen so far. So a whole database is checked in one
+streaming pass, in memory that doesn't grow with the number of rows:
+
+    for issue in audit(connection, max_gap=timedelta(hours=2)):
+        print(issue)
+
+check_interval() is the insert-time counterpart: whether a new or edited
+shift would overlap one already recorded, found with an index lookup
+rather than a scan.
+"""
+
+import datetime
+from collections import namedtuple
+
+from sqlalchemy import and_, select
+
+from models import Clocktime
+
+# kind is 'overlap', 'gap' or 'duration' (time_out not after time_in).
+# other_id is the clocktime overlapped, or the one before the gap.
+Issue = namedtuple('Issue', ['kind', 'employee_id', 'clocktime_id',
+                             'other_id', 'start', 'end'])
+
+# an open shift overlaps everything after it
+_FOREVER = datetime.datetime.max
+
+
+def _time_out(end):
+    """Back from _FOREVER to None for open shifts"""
+    return None if end == _FOREVER else end
+
+
+def sweep(rows, max_gap=None):
+    """Yields the Issues in rows of (id, employee_id, time_in, time_out)
+
+    rows must be ordered by employee_id and time_in. Gaps are only
+    reported if they're longer than max_gap and fall within one day,
+    since the gaps between days are expected.
+    """
+    employee_id = latest_id = latest_end = None
+    for id_, row_employee_id, time_in, time_out in rows:
+        if row_employee_id != employee_id:
+            employee_id, latest_id, latest_end = row_employee_id, None, None
+        end = _FOREVER if time_out is None else time_out
+        if end <= time_in:
+            yield Issue('duration', employee_id, id_, None, time_in,
+                        time_out)
+        if latest_end is not None:
+            if time_in < latest_end:
+                yield Issue('overlap', employee_id, id_, latest_id,
+                            time_in, _time_out(min(end, latest_end)))
+            elif max_gap is not None and \
+                    time_in - latest_end > max_gap and \
+                    time_in.date() == latest_end.date():
+                yield Issue('gap', employee_id, id_, latest_id, latest_end,
+                            time_in)
+        if latest_end is None or end > latest_end:
+            latest_id, latest_end = id_, end
+
+
+def audit(connection, start=None, end=None, employee_id=None, max_gap=None):
+    """Yields every Issue in the clocktimes with start <= time_in < end
+
+    Rows are streamed from the database in index order, not loaded.
+    """
+    clocktimes = Clocktime.__table__
+    conditions = []
+    if start is not None:
+        conditions.append(clocktimes.c.time_in >= start)
+    if end is not None:
+        conditions.append(clocktimes.c.time_in < end)
+    if employee_id is not None:
+        conditions.append(clocktimes.c.employee_id == employee_id)
+    query = select([clocktimes.c.id, clocktimes.c.employee_id,
+                    clocktimes.c.time_in, clocktimes.c.time_out])\
+        .where(and_(*conditions))\
+        .order_by(clocktimes.c.employee_id, clocktimes.c.time_in,
+                  clocktimes.c.id)
+    return sweep(connection.execute(query), max_gap)
+
+
+def check_interval(connection, employee_id, time_in, time_out=None,
+                   clocktime_id=None):
+    """Returns the Issues a shift from time_in to time_out would cause
+
+    time_out None is an open shift. clocktime_id is the shift's own id
+    when editing one, so it isn't compared with itself. This takes two
+    index lookups -- the last shift starting at or before time_in and
+    the first starting after it -- which detects whether any conflict
+    exists, as long as the existing history has no overlaps of its own.
+    A long shift overlapping several others reports only the nearest.
+    """
+    issues = []
+    end = _FOREVER if time_out is None else time_out
+    if end <= time_in:
+        issues.append(Issue('duration', employee_id, clocktime_id, None,
+                            time_in, time_out))
+    clocktimes = Clocktime.__table__
+    columns = [clocktimes.c.id, clocktimes.c.time_in, clocktimes.c.time_out]
+    same_employee = [clocktimes.c.employee_id == employee_id]
+    if clocktime_id is not None:
+        same_employee.append(clocktimes.c.id != clocktime_id)
+    before = connection.execute(
+        select(columns)
+        .where(and_(clocktimes.c.time_in <= time_in, *same_employee))
+        .order_by(clocktimes.c.time_in.desc()).limit(1)).first()
+    after = connection.execute(
+        select(columns)
+        .where(and_(clocktimes.c.time_in > time_in, *same_employee))
+        .order_by(clocktimes.c.time_in).limit(1)).first()
+    for row in (before, after):
+        if row is None:
+            continue
+        other_end = _FOREVER if row.time_out is None else row.time_out
+        overlap_start = max(time_in, row.time_in)
+        overlap_end = min(end, other_end)
+        if overlap_start < overlap_end:
+            issues.append(Issue('overlap', employee_id, clocktime_id, row.id,
+                                overlap_start, _time_out(overlap_end)))
+    return issues
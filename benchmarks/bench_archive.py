@@ -0,0 +1,86 @@
+"""Hot-file clock-in and report speed as total history grows
+
+For each history size, builds a synthetic database, times clock-ins and
+a week's payroll, archives everything but the last 30 days (with
+VACUUM) and times them again. After archiving the hot file holds about
+the same rows whatever the total, and so should the timings.
+
+usage: python -m benchmarks.bench_archive [rows,rows,...] [path]
+"""
+
+import datetime
+import os
+import sys
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+import archive
+import database
+import payroll
+import punchd
+import update_metadata
+from benchmarks.bench_indexes import EMPLOYEES, START, build
+from models import Employee
+
+PUNCHERS = 100
+
+
+def measure(path, now):
+    """Returns (ms per clock-in/out pair, ms per week of payroll)"""
+    engine = database.make_engine(path)
+    session = sessionmaker(bind=engine)()
+    started = time.time()
+    for n, employee_id in enumerate(range(EMPLOYEES + 1,
+                                          EMPLOYEES + PUNCHERS + 1)):
+        at = now + datetime.timedelta(minutes=n)
+        for op in ('clock-in', 'clock-out'):
+            reply = punchd.commit_punch(session, punchd.punch_request(
+                op, employee_id, 'J0001', at))
+            assert reply['ok'], reply
+            at += datetime.timedelta(seconds=30)
+    punch_ms = (time.time() - started) / PUNCHERS * 1000
+    with engine.connect() as connection:
+        started = time.time()
+        payroll.payroll(connection, now - datetime.timedelta(days=7), now)
+        report_ms = (time.time() - started) * 1000
+    session.close()
+    engine.dispose()
+    return punch_ms, report_ms
+
+
+def main(argv):
+    sizes = [int(size) for size in
+             (argv[1] if len(argv) > 1 else "100000,300000,1000000")
+             .split(",")]
+    path = argv[2] if len(argv) > 2 else "bench_archive.db"
+    print("{:>9} {:>9} {:>10} {:>10} {:>10} {:>10}".format(
+        "history", "hot rows", "punch ms", "report ms", "punch ms",
+        "report ms"))
+    print("{:>19} {:>21} {:>21}".format("", "before archiving",
+                                        "after archiving"))
+    for rows in sizes:
+        for year in archive.archive_years(path):
+            os.remove(archive.archive_path(path, year))
+        build(path, rows)
+        engine = database.make_engine(path)
+        update_metadata.migrate(engine)
+        session = sessionmaker(bind=engine)()
+        session.add_all([Employee(id=employee_id, firstname="Puncher",
+                                  lastname=str(employee_id))
+                         for employee_id in range(EMPLOYEES + 1,
+                                                  EMPLOYEES + PUNCHERS + 1)])
+        session.commit()
+        session.close()
+        end = START + datetime.timedelta(minutes=rows * 3)
+        before = measure(path, end)
+        archive.archive(engine, end - datetime.timedelta(days=30), vacuum=True)
+        hot = engine.execute("SELECT count(*) FROM clocktimes").scalar()
+        engine.dispose()
+        after = measure(path, end + datetime.timedelta(hours=1))
+        print("{:>9} {:>9} {:>10.2f} {:>10.1f} {:>10.2f} {:>10.1f}".format(
+            rows, hot, before[0], before[1], after[0], after[1]))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,72 @@
+"""Timing and peak memory of audit.audit and audit.check_interval
+
+Audits a synthetic database (whose random shifts overlap a lot) in one
+streaming pass, then times insert-time checks against it.
+
+usage: python -m benchmarks.bench_audit [rows] [path]
+"""
+
+import collections
+import datetime
+import multiprocessing
+import random
+import resource
+import sys
+import time
+
+from sqlalchemy import create_engine
+
+import audit
+import update_metadata
+from benchmarks.bench_indexes import EMPLOYEES, START, build
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_audit(path, results):
+    """Audits path in a fresh process, so its peak RSS is the audit's"""
+    engine = create_engine('sqlite:///{}'.format(path))
+    rss = max_rss_mb()
+    start = time.time()
+    kinds = collections.Counter(
+        issue.kind for issue in audit.audit(
+            engine, max_gap=datetime.timedelta(hours=2)))
+    results.put((time.time() - start, rss, max_rss_mb(), dict(kinds)))
+
+
+def main(argv):
+    rows = int(argv[1]) if len(argv) > 1 else 1000000
+    path = argv[2] if len(argv) > 2 else "bench_audit.db"
+    print("Building {} clocktimes in {}".format(rows, path))
+    build(path, rows)
+    engine = create_engine('sqlite:///{}'.format(path))
+    update_metadata.migrate(engine)
+
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_audit,
+                                      args=(path, results))
+    process.start()
+    elapsed, rss, peak_rss, kinds = results.get()
+    process.join()
+    print("audit: {:.1f} s, {:.0f} rows/s, peak RSS {:.0f} -> {:.0f} MB, "
+          "{}".format(elapsed, rows / elapsed, rss, peak_rss, kinds))
+
+    rng = random.Random(0)
+    span = (rows * 3) // 60  # hours of history
+    probes = 2000
+    start = time.time()
+    with engine.connect() as connection:
+        for _ in range(probes):
+            time_in = START + datetime.timedelta(
+                hours=rng.uniform(0, span))
+            audit.check_interval(connection, rng.randint(1, EMPLOYEES),
+                                 time_in,
+                                 time_in + datetime.timedelta(hours=8))
+    print("check_interval: {:.3f} ms each".format(
+        (time.time() - start) / probes * 1000))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
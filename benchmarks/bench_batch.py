@@ -0,0 +1,60 @@
+"""Scalar (ORM + tc helpers) vs vectorized (batch) payroll totals
+
+usage: python -m benchmarks.bench_batch [rows] [path]
+"""
+
+import sys
+import time
+from collections import defaultdict
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import joinedload, sessionmaker
+
+import batch
+import tc
+import update_metadata
+from benchmarks.bench_indexes import build
+from models import Clocktime
+
+
+def scalar_totals(session):
+    totals = defaultdict(lambda: [0, 0, 0])
+    clocktimes = session.query(Clocktime)\
+                        .options(joinedload(Clocktime.job))\
+                        .filter(Clocktime.time_out != None)
+    for clocktime in clocktimes:
+        seconds = clocktime.seconds_worked
+        total = totals[(clocktime.employee_id, clocktime.job_id)]
+        total[0] += seconds
+        total[1] += tc.round_to_nearest(seconds, 360) // 360
+        total[2] += tc.pay_cents(seconds, clocktime.job.rate)
+    return {key: tuple(value) for key, value in totals.items()}
+
+
+def main(argv):
+    rows = int(argv[1]) if len(argv) > 1 else 1000000
+    path = argv[2] if len(argv) > 2 else "bench_batch.db"
+    print("Building {} clocktimes in {}".format(rows, path))
+    build(path, rows)
+    engine = create_engine('sqlite:///{}'.format(path))
+    update_metadata.migrate(engine)
+
+    start = time.time()
+    expected = scalar_totals(sessionmaker(bind=engine)())
+    scalar = time.time() - start
+    print("scalar:     {:.2f} s".format(scalar))
+
+    start = time.time()
+    with engine.connect() as connection:
+        arrays = batch.load_arrays(connection)
+    loaded = time.time() - start
+    totals = batch.aggregate(arrays)
+    vectorized = time.time() - start
+    print("vectorized: {:.2f} s ({:.2f} s loading, {:.3f} s computing)"
+          .format(vectorized, loaded, vectorized - loaded))
+    print("speedup:    {:.1f}x, results match: {}".format(
+        scalar / vectorized, totals == expected))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,122 @@
+"""Concurrent clock-in/clock-out load against one SQLite file
+
+Starts N writer processes, each clocking its own employee in and out as
+fast as it can through database.transaction, and reports commit
+throughput and latency percentiles -- once with the old rollback
+journal defaults and once with make_engine's WAL settings.
+
+usage: python -m benchmarks.bench_concurrency [writers] [punches] [path]
+"""
+
+import datetime
+import multiprocessing
+import os
+import sys
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+import database
+from models import Base, Clocktime, Employee, Job
+
+MODES = [
+    ("rollback journal", {'journal_mode': 'delete', 'synchronous': 'full'}),
+    ("WAL", {}),
+]
+
+
+def setup(path, writers, options):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    engine = database.make_engine(path, **options)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(Job(id=1, name="Load Test", abbr="LOAD", rate=1500))
+    session.add_all([Employee(id=i + 1, firstname="Writer",
+                              lastname=str(i)) for i in range(writers)])
+    session.commit()
+    session.close()
+    engine.dispose()
+
+
+def writer(path, options, employee_id, punches, start, results):
+    engine = database.make_engine(path, **options)
+    session = sessionmaker(bind=engine)()
+    latencies = []
+    errors = 0
+
+    def punch_in(session):
+        clocktime = Clocktime(employee_id=employee_id, job_id=1,
+                              time_in=datetime.datetime.now())
+        session.add(clocktime)
+        return clocktime
+
+    def punch_out(session):
+        clocktime.time_out = datetime.datetime.now()
+
+    def timed(work):
+        """Returns (succeeded, result) for one transaction"""
+        begin = time.time()
+        try:
+            return True, database.transaction(session, work)
+        except Exception:
+            return False, None
+        finally:
+            latencies.append(time.time() - begin)
+
+    start.wait()
+    for _ in range(punches):
+        ok, clocktime = timed(punch_in)
+        if ok:
+            ok, _ = timed(punch_out)
+        errors += not ok
+    session.close()
+    engine.dispose()
+    results.put((latencies, errors))
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(label, path, options, writers, punches):
+    setup(path, writers, options)
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(
+        target=writer, args=(path, options, i + 1, punches, start, results))
+        for i in range(writers)]
+    for process in processes:
+        process.start()
+    began = time.time()
+    start.set()
+    latencies, errors = [], 0
+    for _ in processes:
+        worker_latencies, worker_errors = results.get()
+        latencies.extend(worker_latencies)
+        errors += worker_errors
+    elapsed = time.time() - began
+    for process in processes:
+        process.join()
+    latencies.sort()
+    print("{:<18} {:>7.0f} commits/s  p50 {:>7.1f} ms  p99 {:>7.1f} ms  "
+          "max {:>7.1f} ms  {} errors".format(
+              label, len(latencies) / elapsed,
+              percentile(latencies, 0.5) * 1000,
+              percentile(latencies, 0.99) * 1000,
+              latencies[-1] * 1000, errors))
+
+
+def main(argv):
+    writers = int(argv[1]) if len(argv) > 1 else 40
+    punches = int(argv[2]) if len(argv) > 2 else 50
+    path = argv[3] if len(argv) > 3 else "bench_concurrency.db"
+    print("{} writers x {} clock-in/clock-out pairs".format(writers,
+                                                           punches))
+    for label, options in MODES:
+        run(label, path, options, writers, punches)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
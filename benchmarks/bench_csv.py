@@ -0,0 +1,47 @@
+"""Export and import throughput of csvio on a synthetic database
+
+usage: python -m benchmarks.bench_csv [rows] [path]
+"""
+
+import os
+import sys
+import time
+
+from sqlalchemy import create_engine
+
+import csvio
+import update_metadata
+from benchmarks.bench_indexes import build
+
+
+def main(argv):
+    rows = int(argv[1]) if len(argv) > 1 else 1000000
+    path = argv[2] if len(argv) > 2 else "bench_csv.db"
+    csv_path = path + ".csv"
+    print("Building {} clocktimes in {}".format(rows, path))
+    build(path, rows)
+    engine = create_engine('sqlite:///{}'.format(path))
+    update_metadata.migrate(engine)
+
+    start = time.time()
+    with open(csv_path, 'wb') as f, engine.connect() as connection:
+        count = csvio.export_csv(connection, f)
+    elapsed = time.time() - start
+    print("export: {} rows in {:.2f} s ({:,.0f} rows/s)".format(
+        count, elapsed, count / elapsed))
+
+    # import into a copy that has the same employees and jobs but no
+    # clocktimes or totals
+    engine.execute("DELETE FROM clocktimes")
+    engine.execute("DELETE FROM daily_totals")
+    start = time.time()
+    with open(csv_path, 'rb') as f:
+        count = csvio.import_csv(engine, f)
+    elapsed = time.time() - start
+    print("import: {} rows in {:.2f} s ({:,.0f} rows/s)".format(
+        count, elapsed, count / elapsed))
+    os.remove(csv_path)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,71 @@
+"""models.durations sketches vs sorting every shift's length
+
+Generates (or reuses) the benchmark runner's synthetic database, then
+computes each job's median and 90th percentile shift length over the
+whole range both ways: from Clocktime objects' timeworked, and by
+merging the daily_sketches rows. Also times rebuilding the sketches.
+
+usage: python -m benchmarks.bench_durations [employees] [days]
+"""
+
+import sys
+import time
+from collections import defaultdict
+
+from sqlalchemy.orm import sessionmaker
+
+import database
+from benchmarks.bench_audit import max_rss_mb
+from benchmarks.run import prepare
+from models import Clocktime, durations
+
+
+def exact(session):
+    lengths = defaultdict(list)
+    for clocktime in session.query(Clocktime)\
+            .filter(Clocktime.time_out != None):
+        lengths[clocktime.job_id].append(
+            clocktime.timeworked.total_seconds())
+    result = {}
+    for job_id, values in lengths.items():
+        values.sort()
+        result[job_id] = (values[(len(values) - 1) // 2],
+                          values[int(len(values) * 0.9 + 0.5) - 1])
+    return result
+
+
+def sketched(connection):
+    return {job_id: (sketch.median, sketch.quantile(0.9))
+            for job_id, sketch in
+            durations.distributions(connection, None, None).items()}
+
+
+def main(argv):
+    employees = int(argv[1]) if len(argv) > 1 else 300
+    days = int(argv[2]) if len(argv) > 2 else 365
+    path = prepare({'employees': employees, 'days': days, 'seed': 0})
+    engine = database.make_engine(path)
+    with engine.begin() as connection:
+        start = time.time()
+        durations.rebuild(connection)
+        print("rebuild: {:.2f} s".format(time.time() - start))
+    rss = max_rss_mb()
+    with engine.connect() as connection:
+        start = time.time()
+        fast = sketched(connection)
+        print("sketches: {:.3f} s, peak RSS +{:.0f} MB".format(
+            time.time() - start, max_rss_mb() - rss))
+    session = sessionmaker(bind=engine)()
+    start = time.time()
+    slow = exact(session)
+    print("timeworked lists: {:.3f} s, peak RSS +{:.0f} MB".format(
+        time.time() - start, max_rss_mb() - rss))
+    session.close()
+    error = max(abs(fast[job_id][i] - slow[job_id][i]) / slow[job_id][i]
+                for job_id in slow for i in (0, 1))
+    print("largest relative error over {} jobs: {:.2%}".format(len(slow),
+                                                               error))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,111 @@
+"""Query plans and timings before and after update_metadata.migrate
+
+Builds a synthetic timesheet database with the pre-index schema, runs the
+report-style lookups, migrates it in place and runs them again.
+
+usage: python -m benchmarks.bench_indexes [rows] [path]
+"""
+
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import time
+
+from sqlalchemy import create_engine
+
+import update_metadata
+from tests.db.legacy import OLD_SCHEMA
+
+EMPLOYEES = 300
+JOBS = 500
+START = datetime.datetime(2010, 1, 1, 8)
+
+QUERIES = [
+    ("employee week",
+     "SELECT id, time_in, time_out FROM clocktimes "
+     "WHERE employee_id = ? AND time_in >= ? AND time_in < ?",
+     (17, START + datetime.timedelta(days=700),
+      START + datetime.timedelta(days=707))),
+    ("job month",
+     "SELECT id, time_in, time_out FROM clocktimes "
+     "WHERE job_id = ? AND time_in >= ? AND time_in < ?",
+     (42, START + datetime.timedelta(days=700),
+      START + datetime.timedelta(days=730))),
+    ("open shift",
+     "SELECT id FROM clocktimes WHERE employee_id = ? AND time_out IS NULL",
+     (17,)),
+    ("job by abbr",
+     "SELECT id FROM jobs WHERE abbr = ?",
+     ("J0042",)),
+]
+
+
+def build(path, rows):
+    """Fills a fresh pre-index database at path with rows clocktimes"""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    for statement in OLD_SCHEMA:
+        conn.execute(statement)
+    conn.executemany("INSERT INTO employees (firstname, lastname) "
+                     "VALUES (?, ?)",
+                     (("First{}".format(i), "Last{}".format(i))
+                      for i in range(EMPLOYEES)))
+    conn.executemany("INSERT INTO jobs (name, abbr, rate) VALUES (?, ?, ?)",
+                     (("Job {}".format(i), "J{:04d}".format(i), 1500 + i)
+                      for i in range(JOBS)))
+    rng = random.Random(0)
+
+    def clocktimes():
+        for i in range(rows):
+            time_in = START + datetime.timedelta(
+                minutes=i * 3 + rng.randint(0, 60))
+            time_out = time_in + datetime.timedelta(
+                minutes=rng.randint(30, 600))
+            if i >= rows - EMPLOYEES:
+                time_out = None  # the tail of the table is still open
+            yield (str(time_in), time_out and str(time_out),
+                   rng.randint(1, EMPLOYEES), rng.randint(1, JOBS))
+
+    conn.executemany("INSERT INTO clocktimes (time_in, time_out, "
+                     "employee_id, job_id) VALUES (?, ?, ?, ?)",
+                     clocktimes())
+    conn.commit()
+    conn.close()
+
+
+def run_queries(path, repeat=20):
+    conn = sqlite3.connect(path)
+    for label, sql, params in QUERIES:
+        params = tuple(str(p) if isinstance(p, datetime.datetime) else p
+                       for p in params)
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        start = time.time()
+        for _ in range(repeat):
+            conn.execute(sql, params).fetchall()
+        elapsed = (time.time() - start) / repeat
+        print("{:<14} {:>10.3f} ms  {}".format(
+            label, elapsed * 1000, "; ".join(row[-1] for row in plan)))
+    conn.close()
+
+
+def main(argv):
+    rows = int(argv[1]) if len(argv) > 1 else 2000000
+    path = argv[2] if len(argv) > 2 else "bench_indexes.db"
+    print("Building {} clocktimes in {}".format(rows, path))
+    build(path, rows)
+    print("\nBefore migration")
+    run_queries(path)
+    start = time.time()
+    created = update_metadata.migrate(
+        create_engine('sqlite:///{}'.format(path)))
+    print("\nmigrate() created {} in {:.1f} s".format(
+        ", ".join(created), time.time() - start))
+    print("\nAfter migration")
+    run_queries(path)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,42 @@
+"""Timing of payroll.payroll / billing over a synthetic database
+
+The default row count is roughly a year of daily shifts for 300 people.
+
+usage: python -m benchmarks.bench_payroll [rows] [path]
+"""
+
+import sys
+import time
+
+from sqlalchemy import create_engine
+
+import payroll
+import update_metadata
+from benchmarks.bench_indexes import build
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    print("{:<16} {:>8.3f} s  {} lines".format(label, time.time() - start,
+                                               len(result)))
+    return result
+
+
+def main(argv):
+    rows = int(argv[1]) if len(argv) > 1 else 110000
+    path = argv[2] if len(argv) > 2 else "bench_payroll.db"
+    print("Building {} clocktimes in {}".format(rows, path))
+    build(path, rows)
+    engine = create_engine('sqlite:///{}'.format(path))
+    update_metadata.migrate(engine)
+    with engine.connect() as connection:
+        lines = timed("payroll (week)", payroll.payroll, connection)
+        timed("overtime", payroll.overtime, lines)
+        timed("payroll (month)", payroll.payroll, connection,
+              period='month')
+        timed("billing (month)", payroll.billing, connection)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
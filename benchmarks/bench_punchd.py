@@ -0,0 +1,114 @@
+"""Punches per second through punchd versus direct per-process commits
+
+N client processes each clock their own employee in and out. "direct"
+clients commit every punch themselves, as tc.py did; "punchd" clients
+send them to a daemon that group-commits. Both fsync every commit
+(synchronous=full), since a punch is only acknowledged once durable.
+
+usage: python -m benchmarks.bench_punchd [clients] [punches] [path]
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+import database
+import punchd
+from benchmarks.bench_concurrency import percentile, setup
+
+OPTIONS = {'synchronous': 'full'}
+
+
+def direct_client(path, employee_id, punches, start, results):
+    engine = database.make_engine(path, **OPTIONS)
+    session = sessionmaker(bind=engine)()
+    send = lambda request: punchd.commit_punch(session, request)
+    results.put(punch_loop(send, employee_id, punches, start))
+    session.close()
+    engine.dispose()
+
+
+def daemon_client(socket_path, employee_id, punches, start, results):
+    client = punchd.Client(socket_path)
+    results.put(punch_loop(client.request, employee_id, punches, start))
+    client.close()
+
+
+def punch_loop(send, employee_id, punches, start):
+    latencies = []
+    errors = 0
+    start.wait()
+    for _ in range(punches):
+        for op in ('clock-in', 'clock-out'):
+            begin = time.time()
+            reply = send(punchd.punch_request(op, employee_id, 'LOAD'))
+            latencies.append(time.time() - begin)
+            errors += not reply['ok']
+    return latencies, errors
+
+
+def serve(db_path, socket_path, ready):
+    database.configure(db_path, **OPTIONS)
+    server = punchd.make_server(socket_path)
+    ready.set()
+    try:
+        server.serve_forever()
+    finally:
+        punchd.shutdown(server)
+
+
+def run(label, target, address, clients, punches):
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(
+        target=target, args=(address, i + 1, punches, start, results))
+        for i in range(clients)]
+    for process in processes:
+        process.start()
+    began = time.time()
+    start.set()
+    latencies, errors = [], 0
+    for _ in processes:
+        client_latencies, client_errors = results.get()
+        latencies.extend(client_latencies)
+        errors += client_errors
+    elapsed = time.time() - began
+    for process in processes:
+        process.join()
+    latencies.sort()
+    print("{:<8} {:>7.0f} punches/s  p50 {:>7.1f} ms  p99 {:>7.1f} ms  "
+          "{} errors".format(label, len(latencies) / elapsed,
+                             percentile(latencies, 0.5) * 1000,
+                             percentile(latencies, 0.99) * 1000, errors))
+
+
+def main(argv):
+    clients = int(argv[1]) if len(argv) > 1 else 40
+    punches = int(argv[2]) if len(argv) > 2 else 50
+    path = argv[3] if len(argv) > 3 else "bench_punchd.db"
+    socket_path = path + ".sock"
+    print("{} clients x {} clock-in/clock-out pairs".format(clients,
+                                                           punches))
+    setup(path, clients, OPTIONS)
+    run("direct", direct_client, path, clients, punches)
+
+    setup(path, clients, OPTIONS)
+    ready = multiprocessing.Event()
+    daemon = multiprocessing.Process(target=serve,
+                                     args=(path, socket_path, ready))
+    daemon.start()
+    ready.wait()
+    run("punchd", daemon_client, socket_path, clients, punches)
+    print("{punches} punches in {batches} commits".format(
+        **punchd.send({'op': 'stats'}, socket_path)))
+    daemon.terminate()
+    daemon.join()
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
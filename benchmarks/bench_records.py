@@ -0,0 +1,69 @@
+"""models.records vs the ORM for listing clocktimes over a date range
+
+Each path loads every clocktime in the range and formats it, in a fresh
+process so its peak RSS is its own.
+
+usage: python -m benchmarks.bench_records [employees] [days] [path]
+"""
+
+import datetime
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.bench_audit import max_rss_mb
+from models import Base, queries, records
+from tests.db.synthetic import START, generate
+
+
+def orm_path(session, start, end):
+    return queries.clocktimes(session, start, end).all()
+
+
+def records_path(session, start, end):
+    return records.clocktimes(session, start, end)
+
+
+def run(path, load, start, end, results):
+    session = sessionmaker(bind=create_engine('sqlite:///{}'.format(path)))()
+    rss = max_rss_mb()
+    began = time.time()
+    rows = load(session, start, end)
+    loaded = time.time()
+    lines = [str(row) for row in rows]
+    results.put((len(lines), loaded - began, time.time() - loaded,
+                 max_rss_mb() - rss))
+
+
+def main(argv):
+    employees = int(argv[1]) if len(argv) > 1 else 300
+    days = int(argv[2]) if len(argv) > 2 else 365
+    path = argv[3] if len(argv) > 3 else "bench_records.db"
+    if not os.path.exists(path):
+        engine = create_engine('sqlite:///{}'.format(path))
+        Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            print("Generated {} clocktimes in {}".format(
+                generate(connection, employees=employees, days=days), path))
+    print("{:>6} {:<8} {:>8} {:>10} {:>10} {:>8}".format(
+        "days", "path", "rows", "load s", "format s", "RSS MB"))
+    for span in (7, 30, days):
+        end = START + datetime.timedelta(days=span)
+        for name, load in (('orm', orm_path), ('records', records_path)):
+            results = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=run, args=(path, load, START, end, results))
+            process.start()
+            rows, load_time, format_time, rss = results.get()
+            process.join()
+            print("{:>6} {:<8} {:>8} {:>10.3f} {:>10.3f} {:>8.1f}".format(
+                span, name, rows, load_time, format_time, rss))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
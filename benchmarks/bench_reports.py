@@ -0,0 +1,44 @@
+"""reports.employee_report() with 1 to N worker processes
+
+Generates (or reuses) the benchmark runner's synthetic database, then
+times the per-employee report over all of it with each process count,
+checking every run writes the same bytes as the serial one.
+
+usage: python -m benchmarks.bench_reports [employees] [days] [processes]
+"""
+
+import hashlib
+import multiprocessing
+import sys
+import time
+from StringIO import StringIO
+
+import reports
+from benchmarks.run import prepare
+
+
+def main(argv):
+    employees = int(argv[1]) if len(argv) > 1 else 1000
+    days = int(argv[2]) if len(argv) > 2 else 3 * 365
+    most = int(argv[3]) if len(argv) > 3 else multiprocessing.cpu_count()
+    path = prepare({'employees': employees, 'days': days, 'seed': 0})
+    print("{} CPUs".format(multiprocessing.cpu_count()))
+    print("{:>9} {:>8} {:>9} {:>8}".format("processes", "lines", "seconds",
+                                           "speedup"))
+    serial = digest = None
+    for processes in range(1, most + 1):
+        out = StringIO()
+        start = time.time()
+        lines = reports.employee_report(path, out, period='week',
+                                        processes=processes)
+        seconds = time.time() - start
+        if serial is None:
+            serial, digest = seconds, hashlib.sha1(out.getvalue()).digest()
+        assert hashlib.sha1(out.getvalue()).digest() == digest, processes
+        print("{:>9} {:>8} {:>9.2f} {:>8.2f}".format(processes, lines,
+                                                     seconds,
+                                                     serial / seconds))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
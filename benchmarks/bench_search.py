@@ -0,0 +1,92 @@
+"""models.search.JobIndex vs LIKE scans of the jobs table
+
+Fills a database with jobs named from a small vocabulary, then times
+building the index, searches of each kind, and adding a job, against
+the LIKE query a prompt would otherwise run.
+
+usage: python -m benchmarks.bench_search [jobs] [path]
+"""
+
+import os
+import random
+import sys
+import time
+
+from sqlalchemy import create_engine, or_
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.bench_audit import max_rss_mb
+from models import Base, Job
+from models.search import JobIndex
+
+WORDS = ["Acme", "Harbor", "Bridge", "Python", "Website", "Redesign",
+         "Inventory", "Warehouse", "Audit", "Payroll", "Migration", "North",
+         "South", "Library", "School", "Clinic", "Network", "Survey",
+         "Roof", "Kitchen", "Plumbing", "Garden", "Archive", "Portal"]
+
+
+def build(path, count, seed=0):
+    rng = random.Random(seed)
+    engine = create_engine('sqlite:///{}'.format(path))
+    Base.metadata.create_all(engine)
+    rows = []
+    for n in range(count):
+        words = rng.sample(WORDS, 3)
+        rows.append({'name': " ".join(words) + " {}".format(n),
+                     'abbr': "".join(word[:2] for word in words).upper() +
+                             str(n),
+                     'rate': 2000})
+    engine.execute(Job.__table__.insert(), rows)
+    return engine
+
+
+def per_call_us(func, calls=200):
+    start = time.time()
+    for _ in range(calls):
+        func()
+    return (time.time() - start) / calls * 1e6
+
+
+def like_scan(session, text):
+    pattern = "%{}%".format(text)
+    return session.query(Job.id, Job.abbr, Job.name)\
+                  .filter(or_(Job.abbr.like(pattern),
+                              Job.name.like(pattern)))\
+                  .limit(10).all()
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 100000
+    path = argv[2] if len(argv) > 2 else "bench_search.db"
+    if os.path.exists(path):
+        os.remove(path)
+    engine = build(path, count)
+    session = sessionmaker(bind=engine)()
+    index = JobIndex()
+    rss = max_rss_mb()
+    start = time.time()
+    index.load(session)
+    print("load {} jobs: {:.2f} s, peak RSS +{:.0f} MB".format(
+        count, time.time() - start, max_rss_mb() - rss))
+    abbr, name = session.query(Job.abbr, Job.name)\
+                        .filter(Job.id == count // 2).one()
+    queries = [("exact abbr", abbr),
+               ("abbr prefix", abbr[:4]),
+               ("name prefix", " ".join(name.split()[1:])[:10]),
+               ("fuzzy", "warehuse invntory"),
+               ("fuzzy number", "kitchen garden 4242")]
+    print("{:<14} {:<20} {:>12} {:>12}".format("query", "text", "index us",
+                                               "LIKE us"))
+    for label, text in queries:
+        index_us = per_call_us(lambda: index.search(session, text))
+        like_us = per_call_us(lambda: like_scan(session, text), calls=5)
+        print("{:<14} {:<20} {:>12.0f} {:>12.0f}".format(label, text,
+                                                         index_us, like_us))
+    ids = iter(range(count + 1, count + 1001))
+    print("add a job: {:.0f} us".format(per_call_us(
+        lambda: index.add(next(ids), "NEWJOB", "Brand New Job"),
+        calls=1000)))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
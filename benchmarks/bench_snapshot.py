@@ -0,0 +1,80 @@
+"""Columnar snapshot versus SQLite for whole-history aggregates
+
+Builds a synthetic database, writes its snapshot, then has several
+processes at once total hours and pay per employee and job, first
+reading from SQLite (batch.load_arrays) and then mapping the snapshot.
+
+usage: python -m benchmarks.bench_snapshot [rows] [processes] [path]
+"""
+
+import multiprocessing
+import resource
+import shutil
+import sys
+import time
+
+from sqlalchemy import create_engine
+
+import batch
+import snapshot
+import update_metadata
+from benchmarks.bench_indexes import build
+
+
+def report(source, path, directory, results):
+    started = time.time()
+    if source == 'sqlite':
+        with create_engine('sqlite:///{}'.format(path)).connect() as c:
+            arrays = batch.load_arrays(c)
+    else:
+        arrays = snapshot.load(directory)
+    totals = batch.aggregate(arrays)
+    results.put((time.time() - started, len(totals),
+                 resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def run(source, path, directory, processes):
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=report,
+                                       args=(source, path, directory,
+                                             results))
+               for _ in range(processes)]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    print("{:<9} {:>6.2f} s wall, {:>6.2f} s per process, "
+          "peak RSS {:>5.0f} MB per process".format(
+              source, time.time() - started,
+              max(outcome[0] for outcome in outcomes),
+              max(outcome[2] for outcome in outcomes)))
+
+
+def main(argv):
+    rows = int(argv[1]) if len(argv) > 1 else 1000000
+    processes = int(argv[2]) if len(argv) > 2 else 4
+    path = argv[3] if len(argv) > 3 else "bench_snapshot.db"
+    directory = path + ".snapshot"
+    print("Building {} clocktimes in {}".format(rows, path))
+    build(path, rows)
+    engine = create_engine('sqlite:///{}'.format(path))
+    update_metadata.migrate(engine)
+    shutil.rmtree(directory, ignore_errors=True)
+    with engine.connect() as connection:
+        started = time.time()
+        added = snapshot.update(connection, directory)
+        print("snapshot: {} rows in {:.2f} s".format(
+            added, time.time() - started))
+        started = time.time()
+        snapshot.update(connection, directory)
+        print("update with nothing new: {:.3f} s".format(
+            time.time() - started))
+    print("{} processes each totalling all history:".format(processes))
+    run('sqlite', path, directory, processes)
+    run('snapshot', path, directory, processes)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,62 @@
+"""Resident memory over a long run of punches through tc.py's CLI path
+
+Clocks employees in and out round robin, as kiosks would over weeks,
+each punch its own unit of work, and prints RSS as it goes.
+
+usage: python -m benchmarks.bench_soak [punches] [path]
+"""
+
+import datetime
+import os
+import sys
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+import database
+import tc
+from benchmarks.bench_audit import max_rss_mb
+from models import Base, Employee, Job
+
+EMPLOYEES = 100
+
+
+def rss_mb():
+    """Current resident set size, from /proc"""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024.0 / 1024.0
+
+
+def main(argv):
+    punches = int(argv[1]) if len(argv) > 1 else 100000
+    path = argv[2] if len(argv) > 2 else "bench_soak.db"
+    if os.path.exists(path):
+        os.remove(path)
+    engine = database.make_engine(path)
+    Base.metadata.create_all(engine)
+    tc.Session = sessionmaker(bind=engine)
+    with tc.unit_of_work() as session:
+        session.add(Job(name="Soak", abbr="SOAK", rate=2000))
+        session.add_all([Employee(firstname="Kiosk", lastname=str(n))
+                         for n in range(EMPLOYEES)])
+    start = datetime.datetime(2014, 1, 6, 8)
+    began = time.time()
+    print("{:>8} {:>10} {:>10}".format("punches", "RSS MB", "punches/s"))
+    for n in range(punches):
+        shift, employee = divmod(n // 2, EMPLOYEES)
+        at = start + datetime.timedelta(hours=shift)
+        if n % 2:
+            reply = tc._punch('clock-out', employee + 1,
+                              at=at + datetime.timedelta(minutes=30))
+        else:
+            reply = tc._punch('clock-in', employee + 1, "SOAK", at)
+        assert reply['ok'], reply
+        if (n + 1) % (punches // 10) == 0:
+            print("{:>8} {:>10.1f} {:>10.0f}".format(
+                n + 1, rss_mb(), (n + 1) / (time.time() - began)))
+    print("peak RSS {:.1f} MB".format(max_rss_mb()))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,50 @@
+"""Cold start time of one-shot tc.py commands
+
+Times `tc.py --help` (which must not import SQLAlchemy) against a bare
+interpreter and against importing the models, and checks it against
+BUDGET_MS.
+
+usage: python -m benchmarks.bench_startup [runs]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+BUDGET_MS = 150
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = [
+    ("python -c pass", ['-c', 'pass']),
+    ("tc.py --help", [os.path.join(ROOT, 'tc.py'), '--help']),
+    ("import models", ['-c', 'import models']),
+]
+
+
+def best_of(args, runs):
+    best = None
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.check_call([sys.executable] + args, cwd=ROOT,
+                                  stdout=devnull)
+            elapsed = (time.time() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    runs = int(argv[1]) if len(argv) > 1 else 10
+    results = {}
+    for label, args in COMMANDS:
+        results[label] = best_of(args, runs)
+        print("{:<16} {:>7.1f} ms".format(label, results[label]))
+    help_ms = results["tc.py --help"]
+    print("tc.py --help is {} the {} ms budget".format(
+        "within" if help_ms <= BUDGET_MS else "OVER", BUDGET_MS))
+    return 0 if help_ms <= BUDGET_MS else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,68 @@
+"""sync.sync() of a kiosk database into a central one vs copying files
+
+Fills a kiosk file with synthetic shifts, syncs all of it into an empty
+central file, then edits a few shifts at a time and times each delta
+sync next to copying the whole file.
+
+usage: python -m benchmarks.bench_sync [employees] [days]
+"""
+
+import datetime
+import os
+import shutil
+import sys
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+import database
+import sync
+from models import Base, Clocktime
+from tests.db.synthetic import generate
+
+
+def fresh(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    engine = database.make_engine(path)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def timed(func):
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+
+def main(argv):
+    employees = int(argv[1]) if len(argv) > 1 else 300
+    days = int(argv[2]) if len(argv) > 2 else 365
+    kiosk, central = fresh("bench_sync_kiosk.db"), fresh("bench_sync.db")
+    with kiosk.begin() as connection:
+        count = generate(connection, employees=employees, days=days)
+    print("{} clocktimes, {:.1f} MB".format(
+        count, os.path.getsize("bench_sync_kiosk.db") / 1024.0 / 1024.0))
+    _, seconds = timed(lambda: shutil.copy("bench_sync_kiosk.db",
+                                           "bench_sync_copy.db"))
+    print("copy the file: {:.3f} s".format(seconds))
+    result, seconds = timed(lambda: sync.sync(kiosk, central))
+    print("first sync: {} rows in {:.3f} s".format(
+        sum(result.upserted.values()), seconds))
+    session = sessionmaker(bind=kiosk)()
+    print("{:>8} {:>10}".format("changes", "sync s"))
+    for changed in (0, 1, 10, 100, 1000):
+        for clocktime in session.query(Clocktime)\
+                .filter(Clocktime.id % 97 == changed % 97).limit(changed):
+            clocktime.time_out += datetime.timedelta(minutes=6)
+        session.commit()
+        result, seconds = timed(lambda: sync.sync(kiosk, central))
+        print("{:>8} {:>10.4f}".format(sum(result.upserted.values()),
+                                       seconds))
+    session.close()
+    os.remove("bench_sync_copy.db")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
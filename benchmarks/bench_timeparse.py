@@ -0,0 +1,61 @@
+"""timeparse.parse_times vs the strptime based parsing it replaced
+
+usage: python -m benchmarks.bench_timeparse [count]
+"""
+
+import datetime
+import random
+import sys
+import time
+
+import timeparse
+
+
+def strptime_parse(text):
+    """The old tc.get_time, minus its globals and printing"""
+    if text.split(' ')[0] in {'1', '2', '3', '4', '5', '6',
+                              '7', '8', '9', '10', '11', '12'}:
+        text = text.split(' ')[0] + ':' + '00' + ' ' + text.split(' ')[1]
+    split_hour = text.split(':')[0]
+    split_minute = text.split(':')[1]
+    split_minute2 = split_minute.split(' ')[0]
+    split_ap = text.split(' ')[1]
+    if split_ap in {'a', 'A', 'p', 'P'}:
+        split_ap = 'AM' if split_ap in {'a', 'A'} else 'PM'
+        text = split_hour + ':' + split_minute2 + ' ' + split_ap
+    return datetime.datetime.strptime(text, '%I:%M %p')
+
+
+def sample(count, seed=0):
+    rng = random.Random(seed)
+    forms = ["{h}:{m:02d} {ap}", "{h} {ap}", "{h}:{m:02d} {a}",
+             "{h:02d}:{m:02d} {ap}"]
+    return [rng.choice(forms).format(h=rng.randint(1, 12),
+                                     m=rng.randrange(0, 60, 6),
+                                     ap=rng.choice(["AM", "PM"]),
+                                     a=rng.choice("apAP"))
+            for _ in range(count)]
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 200000
+    texts = sample(count)
+
+    start = time.time()
+    old = [strptime_parse(text) for text in texts]
+    strptime_time = time.time() - start
+
+    start = time.time()
+    new = timeparse.parse_times(texts)
+    table_time = time.time() - start
+
+    assert [timeparse.to_datetime(m) for m in new] == old
+    print("strptime:    {:.3f} s ({:,.0f}/s)".format(
+        strptime_time, count / strptime_time))
+    print("parse_times: {:.3f} s ({:,.0f}/s)".format(
+        table_time, count / table_time))
+    print("speedup:     {:.0f}x".format(strptime_time / table_time))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
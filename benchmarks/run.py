@@ -0,0 +1,237 @@
+"""The benchmark suite, over a generated database, with regression checks
+
+Generates a database of tests.db.synthetic data (once per size and seed,
+kept as bench_run-<employees>x<days>-<seed>.db), copies it so every run
+starts from the same file, then times each case:
+
+    punch     clock in/out latency through punchd.commit_punch
+    report    tc.print_report for one day and its week
+    parse     timeparse.parse_times
+    rounding  tc.round_to_nearest per shift vs batch.tenths
+    export    csvio.export_csv of every clocktime
+    payroll   payroll.payroll by week
+
+Results (milliseconds, lower is better) are printed as JSON, and written
+to --output. With --baseline, they're compared with a stored result and
+the exit status is 1 if any is more than --tolerance slower.
+
+usage: python -m benchmarks.run [--employees N] [--days N] [--seed N]
+           [--only CASE ...] [--output FILE] [--baseline FILE]
+           [--tolerance FRACTION]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+
+import numpy as np
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+import batch
+import csvio
+import database
+import payroll
+import punchd
+import tc
+import timeparse
+from benchmarks.bench_timeparse import sample
+from models import Base
+from tests.db.synthetic import START, generate
+
+
+class NullWriter(object):
+    def write(self, data):
+        pass
+
+
+def note(text):
+    """Progress and warnings go to stderr, leaving stdout for the JSON"""
+    sys.stderr.write(text + "\n")
+
+
+def best(func, repeat=3):
+    """Seconds of func's fastest run"""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def bench_punch(context, punches=400):
+    """Each of the first employees clocks in then out, after the history"""
+    session = context['session']
+    day = START + datetime.timedelta(days=context['params']['days'] + 1)
+    at = datetime.datetime.combine(day, datetime.time(8))
+    latencies = []
+    employees = range(1, 1 + min(punches // 2,
+                                 context['params']['employees']))
+    for op, when in (('clock-in', at), ('clock-out', at +
+                                        datetime.timedelta(hours=8))):
+        for employee_id in employees:
+            request = punchd.punch_request(op, employee_id, "SYN00001",
+                                           when)
+            start = time.time()
+            reply = punchd.commit_punch(session, request)
+            latencies.append(time.time() - start)
+            assert reply['ok'], reply
+    return {'punch_p50_ms': ms(percentile(latencies, 0.5)),
+            'punch_p99_ms': ms(percentile(latencies, 0.99))}
+
+
+def bench_report(context):
+    day = START + datetime.timedelta(days=context['params']['days'] // 2)
+    while day.weekday() >= 5:
+        day -= datetime.timedelta(days=1)
+    stdout, sys.stdout = sys.stdout, NullWriter()
+    try:
+        seconds = best(lambda: tc.print_report(day), repeat=5)
+    finally:
+        sys.stdout = stdout
+    return {'report_ms': ms(seconds)}
+
+
+def bench_parse(context, count=100000):
+    texts = sample(count)
+    return {'parse_100k_ms': ms(best(lambda: timeparse.parse_times(texts)))}
+
+
+def bench_rounding(context):
+    arrays = batch.load_arrays(context['connection'])
+    seconds = arrays['time_out'] - arrays['time_in']
+    values = seconds.tolist()
+    return {
+        'rounding_scalar_ms': ms(best(
+            lambda: [tc.round_to_nearest(value, 360) for value in values])),
+        'rounding_vector_ms': ms(best(lambda: batch.tenths(seconds)))}
+
+
+def bench_export(context):
+    connection = context['connection']
+    return {'export_ms': ms(best(
+        lambda: csvio.export_csv(connection, NullWriter()), repeat=1))}
+
+
+def bench_payroll(context):
+    connection = context['connection']
+    return {'payroll_week_ms': ms(best(
+        lambda: payroll.payroll(connection), repeat=1))}
+
+
+CASES = [('punch', bench_punch), ('report', bench_report),
+         ('parse', bench_parse), ('rounding', bench_rounding),
+         ('export', bench_export), ('payroll', bench_payroll)]
+
+
+def prepare(params):
+    """Returns the path of a fresh copy of the generated database"""
+    path = "bench_run-{employees}x{days}-{seed}.db".format(**params)
+    if not os.path.exists(path):
+        note("Generating {}".format(path))
+        engine = sqlalchemy.create_engine('sqlite:///{}.tmp'.format(path))
+        Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            count = generate(connection, **params)
+        engine.dispose()
+        os.rename(path + ".tmp", path)
+        note("{} clocktimes".format(count))
+    work = "bench_run.db"
+    shutil.copy(path, work)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(work + suffix):
+            os.remove(work + suffix)
+    return work
+
+
+def run(params, only=None):
+    path = prepare(params)
+    engine = database.make_engine(path)
+    tc.Session = sessionmaker(bind=engine)
+    session = tc.Session()
+    results = {}
+    with engine.connect() as connection:
+        context = {'params': params, 'session': session,
+                   'connection': connection}
+        for name, case in CASES:
+            if only and name not in only:
+                continue
+            note("{}...".format(name))
+            results.update(case(context))
+    session.close()
+    engine.dispose()
+    return {'params': params,
+            'environment': {'python': platform.python_version(),
+                            'sqlalchemy': sqlalchemy.__version__,
+                            'numpy': np.__version__,
+                            'machine': platform.machine()},
+            'results': results}
+
+
+def compare(current, baseline, tolerance=0.2):
+    """Returns [(name, baseline, current, ratio)] for every regression
+
+    A regression is a result more than tolerance (a fraction) slower than
+    the baseline's. Results missing from either side are skipped.
+    """
+    regressions = []
+    for name, before in sorted(baseline['results'].items()):
+        after = current['results'].get(name)
+        if after is None or not before:
+            continue
+        ratio = after / float(before)
+        if ratio > 1 + tolerance:
+            regressions.append((name, before, after, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--employees', type=int, default=300)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='+', choices=[n for n, _ in CASES])
+    parser.add_argument('--output', help="write the results here too")
+    parser.add_argument('--baseline', help="results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+    params = {'employees': args.employees, 'days': args.days,
+              'seed': args.seed}
+    current = run(params, args.only)
+    text = json.dumps(current, indent=2, sort_keys=True)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['params'] != params:
+            note("Warning: baseline was run with {}".format(
+                baseline['params']))
+        regressions = compare(current, baseline, args.tolerance)
+        for name, before, after, ratio in regressions:
+            note("REGRESSION {}: {} -> {} ms ({:+.0%})".format(
+                name, before, after, ratio - 1))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""CSV timesheet export and bulk import
+
+export_csv streams clocktimes joined to their employee and job straight
+from a Core select, a batch at a time, so memory use doesn't depend on
+how many rows are written. import_csv loads timesheets in the same
+format with batched executemany inserts, all in one transaction.
+"""
+
+import argparse
+import csv
+import datetime
+import logging
+from collections import defaultdict
+
+from sqlalchemy import String, and_, select, type_coerce
+
+import archive
+from models import Clocktime, Employee, Job, changes, durations, rollup, \
+    seconds_between
+from database import get_engine
+from rounding import hours_worked
+
+FIELDS = ['id', 'employee', 'job_abbr', 'job_name', 'time_in', 'time_out',
+          'hours']
+DATETIME_FORMATS = ['%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S',
+                    '%Y-%m-%d %H:%M']
+
+
+def _encode(value):
+    """csv in Python 2 wants bytes"""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def export_query(start=None, end=None, employee_id=None, job_id=None,
+                 clocktimes=None):
+    """Returns the Core select behind export_csv
+
+    start and end bound time_in (start <= time_in < end). clocktimes is
+    the table to read, by default the clocktimes table itself.
+    """
+    if clocktimes is None:
+        clocktimes = Clocktime.__table__
+    employees = Employee.__table__
+    jobs = Job.__table__
+    # time_in and time_out are selected as the stored strings, which are
+    # already in the format we want to write, to skip parsing them
+    query = select([clocktimes.c.id,
+                    (employees.c.firstname + " " + employees.c.lastname),
+                    jobs.c.abbr,
+                    jobs.c.name,
+                    type_coerce(clocktimes.c.time_in, String),
+                    type_coerce(clocktimes.c.time_out, String),
+                    seconds_between(clocktimes.c.time_in,
+                                    clocktimes.c.time_out)])\
+        .select_from(clocktimes
+                     .join(employees,
+                           clocktimes.c.employee_id == employees.c.id)
+                     .join(jobs, clocktimes.c.job_id == jobs.c.id))
+    conditions = []
+    if start is not None:
+        conditions.append(clocktimes.c.time_in >= start)
+    if end is not None:
+        conditions.append(clocktimes.c.time_in < end)
+    if employee_id is not None:
+        conditions.append(clocktimes.c.employee_id == employee_id)
+    if job_id is not None:
+        conditions.append(clocktimes.c.job_id == job_id)
+    if conditions:
+        query = query.where(and_(*conditions))
+    return query.order_by(clocktimes.c.time_in, clocktimes.c.id)
+
+
+def export_csv(connection, fileobj, start=None, end=None, employee_id=None,
+               job_id=None, batch_size=10000):
+    """Writes matching clocktimes to fileobj as CSV, returning the row count
+
+    Open shifts are written with empty time_out and hours. Archived
+    clocktimes in the range are included.
+    """
+    writer = csv.writer(fileobj)
+    writer.writerow(FIELDS)
+    result = connection.execution_options(stream_results=True).execute(
+        export_query(start, end, employee_id, job_id,
+                     archive.clocktimes(connection, start, end)))
+    count = 0
+    while True:
+        rows = result.fetchmany(batch_size)
+        if not rows:
+            break
+        writer.writerows((id_, _encode(name), _encode(abbr), _encode(job),
+                          time_in, time_out,
+                          None if seconds is None else hours_worked(seconds))
+                         for id_, name, abbr, job, time_in, time_out, seconds
+                         in rows)
+        count += len(rows)
+    result.close()
+    return count
+
+
+def parse_datetime(value):
+    """Parses the timestamps written by export_csv (or None for blanks)"""
+    if not value:
+        return None
+    if len(value) in (19, 26) and value[10] == ' ':
+        # the format SQLite stores, sliced directly since strptime
+        # dominates import time otherwise
+        try:
+            return datetime.datetime(
+                int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                int(value[11:13]), int(value[14:16]), int(value[17:19]),
+                int(value[20:26]) if len(value) == 26 else 0)
+        except ValueError:
+            pass
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError("Unrecognized timestamp {!r}".format(value))
+
+
+def _lookups(connection):
+    """Returns ({employee name: id}, {job abbr: id}) in two queries"""
+    employees = Employee.__table__
+    jobs = Job.__table__
+    names = {_encode(first + " " + last): id_ for id_, first, last in
+             connection.execute(select([employees.c.id,
+                                        employees.c.firstname,
+                                        employees.c.lastname]))}
+    abbrs = {_encode(abbr): id_ for id_, abbr in
+             connection.execute(select([jobs.c.id, jobs.c.abbr]))}
+    return names, abbrs
+
+
+def _insert_chunk(connection, chunk, seq):
+    """Inserts one chunk of clocktime dicts, their daily totals and sketches
+
+    The rows are stamped with change sequence number seq, for sync.
+    """
+    deltas = defaultdict(int)
+    for row in chunk:
+        rollup.add_interval(deltas, row['time_in'], row['time_out'],
+                            row['employee_id'], row['job_id'])
+        row['change_seq'] = seq
+    connection.execute(Clocktime.__table__.insert(), chunk)
+    rollup.apply_deltas(connection, deltas)
+    durations.recompute(connection, set(
+        pair for row in chunk
+        for pair in durations.touched(row['employee_id'], row['time_in'])))
+
+
+def import_csv(engine, fileobj, chunk_size=10000):
+    """Bulk loads clocktimes from a CSV timesheet, returning the row count
+
+    Needs employee, job_abbr, time_in and time_out columns (any others,
+    including id, are ignored). Employees are matched on full name and
+    jobs on abbreviation; an unknown one, or a timestamp that can't be
+    parsed, raises ValueError naming the line. The whole file is loaded
+    in one transaction, so then nothing is.
+    """
+    count = 0
+    with engine.begin() as connection:
+        names, abbrs = _lookups(connection)
+        seq = changes.next_sequence(connection)
+        chunk = []
+        for line_no, row in enumerate(csv.DictReader(fileobj), start=2):
+            try:
+                chunk.append({'employee_id': names[row['employee']],
+                              'job_id': abbrs[row['job_abbr']],
+                              'time_in': parse_datetime(row['time_in']),
+                              'time_out': parse_datetime(row['time_out'])})
+            except KeyError as e:
+                raise ValueError("Line {}: unknown employee or job {}"
+                                 .format(line_no, e))
+            except ValueError as e:
+                raise ValueError("Line {}: {}".format(line_no, e))
+            if len(chunk) >= chunk_size:
+                _insert_chunk(connection, chunk, seq)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            _insert_chunk(connection, chunk, seq)
+            count += len(chunk)
+    logging.info("Imported {} clocktimes".format(count))
+    return count
+
+
+def _date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest='command')
+    export_parser = subparsers.add_parser('export')
+    export_parser.add_argument('file')
+    export_parser.add_argument('--start', type=_date,
+                               help="first day to include, YYYY-MM-DD")
+    export_parser.add_argument('--end', type=_date,
+                               help="last day to include, YYYY-MM-DD")
+    export_parser.add_argument('--employee', type=int)
+    export_parser.add_argument('--job', type=int)
+    import_parser = subparsers.add_parser('import')
+    import_parser.add_argument('file')
+    args = parser.parse_args(argv)
+
+    engine = get_engine()
+    if args.command == 'export':
+        with open(args.file, 'wb') as f, engine.connect() as connection:
+            end = args.end and args.end + datetime.timedelta(days=1)
+            count = export_csv(connection, f, args.start, end,
+                               args.employee, args.job)
+        print("Exported {} clocktimes to {}".format(count, args.file))
+    else:
+        with open(args.file, 'rb') as f:
+            count = import_csv(engine, f)
+        print("Imported {} clocktimes from {}".format(count, args.file))
+
+
+if __name__ == "__main__":
+    main()
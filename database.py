@@ -0,0 +1,151 @@
+"""Lazily created engine and sessions for the timesheet database
+
+Nothing here imports SQLAlchemy until an engine or session is actually
+asked for, so commands that never touch the database (--help, argument
+errors) don't pay for it at startup.
+
+Several terminals may clock in against the same file at once, so
+make_engine puts it in WAL mode (readers never block the writer, and
+vice versa), waits on a locked database instead of failing straight
+away, and keeps a small pool of connections so those settings are only
+applied once per connection. transaction() retries a whole unit of work
+if the database is still locked after that.
+
+Sessions are meant to be short-lived, one per unit of work:
+
+    with session_scope() as session:
+        transaction(session, work)
+"""
+
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+DB_NAME = "timesheet.db"
+
+_engine = None
+_sessionmaker = None
+_path = DB_NAME
+_options = {}
+
+
+def make_engine(path=DB_NAME, journal_mode='wal', synchronous='normal',
+                busy_timeout=5000, pool_size=5, max_overflow=10,
+                pool_timeout=30, read_only=False):
+    """Returns an engine for the SQLite file at path tuned for concurrency
+
+    journal_mode and synchronous are SQLite PRAGMA values (journal_mode
+    None leaves the file's mode alone). synchronous=normal is safe in WAL
+    mode: a power failure can lose the last commits but not corrupt the
+    file. busy_timeout is how many milliseconds to wait for a lock, and
+    the pool settings are passed on to a QueuePool. With read_only, the
+    connections refuse to write (PRAGMA query_only).
+    """
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.pool import QueuePool
+    engine = create_engine('sqlite:///{}'.format(path),
+                           poolclass=QueuePool,
+                           pool_size=pool_size,
+                           max_overflow=max_overflow,
+                           pool_timeout=pool_timeout,
+                           connect_args={'timeout': busy_timeout / 1000.0,
+                                         'check_same_thread': False})
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if journal_mode is not None:
+            cursor.execute("PRAGMA journal_mode={}".format(journal_mode))
+        cursor.execute("PRAGMA synchronous={}".format(synchronous))
+        cursor.execute("PRAGMA busy_timeout={:d}".format(busy_timeout))
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return engine
+
+
+def configure(path=None, **options):
+    """Changes the file and/or make_engine options get_engine() uses
+
+    Takes effect for engines and sessions created after the call.
+    """
+    global _engine, _sessionmaker, _path
+    if path is not None:
+        _path = path
+    _options.update(options)
+    if _engine is not None:
+        _engine.dispose()
+    _engine = _sessionmaker = None
+
+
+def get_engine():
+    """Returns the engine for DB_NAME, creating it on first use"""
+    global _engine
+    if _engine is None:
+        _engine = make_engine(_path, **_options)
+    return _engine
+
+
+def get_sessionmaker():
+    """Returns a sessionmaker bound to get_engine()"""
+    global _sessionmaker
+    if _sessionmaker is None:
+        from sqlalchemy.orm import sessionmaker
+        _sessionmaker = sessionmaker(bind=get_engine())
+    return _sessionmaker
+
+
+def is_locked(error):
+    """True if error is SQLite reporting a locked or busy database"""
+    from sqlalchemy.exc import OperationalError
+    message = str(getattr(error, 'orig', error)).lower()
+    return isinstance(error, OperationalError) and \
+        ('locked' in message or 'busy' in message)
+
+
+def transaction(session, work, retries=5, backoff=0.05):
+    """Runs work(session) and commits, retrying while the database is locked
+
+    On a locked database the session is rolled back and work is run
+    again from the start after an exponential, jittered backoff of about
+    backoff, 2 * backoff, 4 * backoff... seconds. Returns what work
+    returned; the last error is re-raised once retries run out.
+    """
+    for attempt in range(retries + 1):
+        try:
+            result = work(session)
+            session.commit()
+            return result
+        except Exception as e:
+            session.rollback()
+            if not is_locked(e) or attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            logging.warning("Database locked, retrying in {:.3f}s"
+                            .format(delay))
+            time.sleep(delay)
+
+
+def new_session():
+    """Returns a new Session from get_sessionmaker()"""
+    return get_sessionmaker()()
+
+
+@contextmanager
+def session_scope(factory=new_session):
+    """Yields a new Session from factory for one unit of work
+
+    It's committed when the block finishes, rolled back if it raises,
+    and closed either way, so nothing it loaded outlives the block.
+    """
+    session = factory()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
@@ -0,0 +1,279 @@
+"""Instrumentation for the SQL the timeclock issues, and its commands
+
+QueryCounter hooks an engine's before_cursor_execute event to count the
+statements run while it's active, optionally broken down by operation:
+
+    with QueryCounter(engine) as counter:
+        with counter.operation('report'):
+            report()
+    counter.count, counter.by_operation['report']
+
+instrumented() is the opt-in layer tc.py's --stats switches on: while
+it's active, STATS is a Recorder of counters and latency histograms,
+every statement the engine runs is timed into it (those slower than a
+threshold also going to the slow-query log), and timer() blocks are
+timed. At the end it's dumped to a JSON file:
+
+    with instrumented(engine, "stats.json"):
+        with timer('command.report'):
+            report()
+
+Disabled, timer() is a function call returning a shared no-op, and no
+engine events are registered at all. SQLAlchemy is only imported once
+something is actually hooked up, so tc.py can import this for free.
+"""
+
+import bisect
+import cProfile
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# next to timeclock.log
+SLOW_LOG = "timeclock-slow.log"
+SLOW_THRESHOLD = 0.1  # seconds
+
+# histogram bucket upper bounds, in seconds: 0.1 ms doubling up to ~105 s
+BUCKETS = [0.0001 * 2 ** i for i in range(21)]
+
+# the Recorder instrumented() is filling, or None when disabled
+STATS = None
+
+
+def _event():
+    from sqlalchemy import event
+    return event
+
+
+class QueryCounter(object):
+    """Counts (and optionally records) the statements an engine executes
+
+    An executemany counts as a single statement.
+    """
+
+    def __init__(self, engine, record=False):
+        self.engine = engine
+        self.record = record
+        self.count = 0
+        self.by_operation = defaultdict(int)
+        self.statements = []
+        self._operation = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        self.count += 1
+        if self._operation is not None:
+            self.by_operation[self._operation] += 1
+        if self.record:
+            self.statements.append(statement)
+
+    def __enter__(self):
+        _event().listen(self.engine, 'before_cursor_execute',
+                        self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _event().remove(self.engine, 'before_cursor_execute',
+                        self._before_cursor_execute)
+
+    @contextmanager
+    def operation(self, name):
+        """Attributes the statements run inside the block to name"""
+        previous, self._operation = self._operation, name
+        try:
+            yield self
+        finally:
+            self._operation = previous
+
+
+class Histogram(object):
+    """Count, total, max and BUCKETS counts of a series of durations"""
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # the last is overflow
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def as_dict(self):
+        """Milliseconds, with buckets as [upper bound, count] pairs
+
+        Empty buckets are left out; the overflow bucket's bound is None.
+        """
+        bounds = [round(bound * 1000, 1) for bound in BUCKETS] + [None]
+        return {'count': self.count,
+                'total_ms': round(self.total * 1000, 3),
+                'max_ms': round(self.max * 1000, 3),
+                'buckets': [[bound, count] for bound, count
+                            in zip(bounds, self.buckets) if count]}
+
+
+class Recorder(object):
+    """Named counters and Histograms"""
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.histograms = defaultdict(Histogram)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def observe(self, name, seconds):
+        self.histograms[name].add(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Adds the block's duration to the name histogram"""
+        start = time.time()
+        try:
+            yield self
+        finally:
+            self.observe(name, time.time() - start)
+
+    def as_dict(self):
+        return {'counters': dict(self.counters),
+                'histograms': {name: histogram.as_dict() for name, histogram
+                               in self.histograms.items()}}
+
+    def dump(self, path):
+        """Writes as_dict() to path as JSON"""
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+class QueryTimer(object):
+    """Times every statement an engine executes into a Recorder
+
+    Each statement's latency goes to the 'sql' histogram and to one
+    named 'sql: ' plus its text. With a slow_log Logger, statements
+    taking at least slow_threshold seconds are logged to it too.
+    """
+
+    def __init__(self, engine, recorder, slow_log=None,
+                 slow_threshold=SLOW_THRESHOLD):
+        self.engine = engine
+        self.recorder = recorder
+        self.slow_log = slow_log
+        self.slow_threshold = slow_threshold
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        conn.info.setdefault('query_start', []).append(time.time())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        elapsed = time.time() - conn.info['query_start'].pop()
+        self.recorder.observe('sql', elapsed)
+        self.recorder.observe('sql: ' + statement, elapsed)
+        if self.slow_log is not None and elapsed >= self.slow_threshold:
+            self.slow_log.warning("{:.1f} ms: {} {!r}".format(
+                elapsed * 1000, statement, parameters))
+
+    def _handle_error(self, exception_context):
+        self.recorder.count('sql errors')
+        starts = exception_context.connection.info.get('query_start')
+        if starts:
+            starts.pop()
+
+    def __enter__(self):
+        event = _event()
+        event.listen(self.engine, 'before_cursor_execute',
+                     self._before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute',
+                     self._after_cursor_execute)
+        event.listen(self.engine, 'handle_error', self._handle_error)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event = _event()
+        event.remove(self.engine, 'before_cursor_execute',
+                     self._before_cursor_execute)
+        event.remove(self.engine, 'after_cursor_execute',
+                     self._after_cursor_execute)
+        event.remove(self.engine, 'handle_error', self._handle_error)
+
+
+class _NullTimer(object):
+    """What timer() returns while instrumentation is off"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name):
+    """Times the with block into STATS, if instrumentation is on"""
+    if STATS is None:
+        return _NULL_TIMER
+    return STATS.timer(name)
+
+
+def slow_query_log(path=SLOW_LOG):
+    """A Logger writing to path that doesn't propagate to timeclock.log"""
+    logger = logging.getLogger('timeclock.slow_queries')
+    logger.propagate = False
+    handler = logging.FileHandler(path, delay=True)  # created when needed
+    handler.setFormatter(logging.Formatter("%(asctime)s :: %(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+
+@contextmanager
+def instrumented(engine=None, stats_path=None, slow_log=SLOW_LOG,
+                 slow_threshold=SLOW_THRESHOLD):
+    """Turns instrumentation on for the with block, yielding STATS
+
+    Statements run on engine (if given) are timed, and slow ones logged
+    to the slow_log file (if not None). STATS is dumped to stats_path,
+    if given, however the block exits.
+    """
+    global STATS
+    previous, STATS = STATS, Recorder()
+    logger = handler = None
+    if engine is not None and slow_log is not None:
+        logger = slow_query_log(slow_log)
+        handler = logger.handlers[-1]
+    try:
+        if engine is None:
+            yield STATS
+        else:
+            with QueryTimer(engine, STATS, logger, slow_threshold):
+                yield STATS
+    finally:
+        recorder, STATS = STATS, previous
+        if handler is not None:
+            logger.removeHandler(handler)
+            handler.close()
+        if stats_path is not None:
+            recorder.dump(stats_path)
+
+
+@contextmanager
+def profiled(path):
+    """Runs the with block under cProfile, saving the stats to path
+
+    Read them with pstats: python -m pstats path
+    """
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
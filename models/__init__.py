@@ -1,14 +1,23 @@
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, Integer, String, ForeignKey,\
-                       ForeignKeyConstraint, Numeric
-from sqlalchemy.types import DateTime
+                       ForeignKeyConstraint, Numeric, Index, text
+from sqlalchemy.types import Date, DateTime
 from sqlalchemy.orm import relationship, backref
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.sql import cast, func
 
 from decimal import Decimal  # Job.rate
 
 Base = declarative_base()
 
-__all__ = ['Clocktime', 'Employee', 'Job']
+__all__ = ['ChangeCounter', 'Clocktime', 'DailySketch', 'DailyTotal',
+           'Deletion', 'Employee', 'Job', 'SyncState']
+
+
+def seconds_between(time_in, time_out):
+    """SQL for the whole seconds from time_in to time_out, via SQLite"""
+    return cast(func.strftime('%s', time_out), Integer) - \
+           cast(func.strftime('%s', time_in), Integer)
 
 class Clocktime(Base):
     """Table for clockin/clockout values
@@ -19,17 +28,49 @@ class Clocktime(Base):
     """
 
     __tablename__ = "clocktimes"
+    __table_args__ = (
+        # per-employee and per-job time range lookups (reports, payroll)
+        Index('ix_clocktimes_employee_time_in', 'employee_id', 'time_in'),
+        Index('ix_clocktimes_job_time_in', 'job_id', 'time_in'),
+        # partial index covering only open shifts (not yet clocked out)
+        Index('ix_clocktimes_open', 'employee_id',
+              sqlite_where=text('time_out IS NULL')),
+        Index('ix_clocktimes_change_seq', 'change_seq'),
+    )
     id = Column(Integer, primary_key=True)
     time_in = Column(DateTime)
     time_out = Column(DateTime)
     employee_id = Column(Integer,ForeignKey('employees.id'))
     job_id = Column(Integer, ForeignKey('jobs.id'))
+    change_seq = Column(Integer)  # set by models.changes
     # employee = many to one relationship with Employee
     # job = many to one relationship with Job
 
     @property
     def timeworked(self):
-        return self.time_out - self.time_in
+        """time_out - time_in in whole seconds, or None while clocked in
+
+        Microseconds are dropped from both ends first, as SQLite's
+        strftime('%s') does, so reports, payroll and the rollup all
+        count the same seconds.
+        """
+        if self.time_out is None:  # still clocked in
+            return None
+        return self.time_out.replace(microsecond=0) - \
+            self.time_in.replace(microsecond=0)
+
+    @hybrid_property
+    def seconds_worked(self):
+        """timeworked as an int
+
+        Also usable in queries, where it's computed by SQLite.
+        """
+        timeworked = self.timeworked
+        return timeworked.days * 86400 + timeworked.seconds
+
+    @seconds_worked.expression
+    def seconds_worked(cls):
+        return seconds_between(cls.time_in, cls.time_out)
 
     def __str__(self):
         formatter="Employee: {employee.name}, "\
@@ -47,9 +88,13 @@ class Employee(Base):
     """
 
     __tablename__ = "employees"
+    __table_args__ = (
+        Index('ix_employees_change_seq', 'change_seq'),
+    )
     id = Column(Integer, primary_key=True)
     firstname = Column(String(50))
     lastname = Column(String(50))
+    change_seq = Column(Integer)  # set by models.changes
     clocktimes = relationship('Clocktime', backref='employee')
     
     @property
@@ -67,10 +112,15 @@ class Job(Base):
     note that rate is cents/hr"""
 
     __tablename__ = "jobs"
+    __table_args__ = (
+        Index('ix_jobs_abbr', 'abbr', unique=True),
+        Index('ix_jobs_change_seq', 'change_seq'),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(50))
     abbr = Column(String(16))
     rate = Column(Integer)  # cents/hr
+    change_seq = Column(Integer)  # set by models.changes
     clocktimes = relationship('Clocktime', backref='job')
 
     def __str__(self):
@@ -80,3 +130,80 @@ class Job(Base):
                                 abbr="Abbr: " + str(self.abbr),
                                 rate=self.rate/100.0,
                                 id="ID# " + str(self.id))
+
+class DailyTotal(Base):
+    """Rollup table of seconds worked per day, employee and job
+
+    Kept up to date by models.rollup whenever a Clocktime is flushed.
+    Shifts that cross midnight are split between the days they cover.
+    many to one -> employee
+    many to one -> job
+    """
+
+    __tablename__ = "daily_totals"
+    date = Column(Date, primary_key=True)
+    employee_id = Column(Integer, ForeignKey('employees.id'),
+                         primary_key=True)
+    job_id = Column(Integer, ForeignKey('jobs.id'), primary_key=True)
+    seconds = Column(Integer, nullable=False, default=0)
+    employee = relationship('Employee')
+    job = relationship('Job')
+
+    def __str__(self):
+        return "{self.date} {employee.name}, Job: {job.abbr}, "\
+               "Seconds: {self.seconds}".format(employee=self.employee,
+                                                 job=self.job, self=self)
+
+class DailySketch(Base):
+    """Rollup table of duration histograms per day, employee, job and kind
+
+    kind is 'shift' (time worked) or 'break' (time off between shifts),
+    and bins a models.durations.LogHistogram's encoding. Kept up to date
+    by models.durations; a shift counts on the day it started.
+    """
+
+    __tablename__ = "daily_sketches"
+    date = Column(Date, primary_key=True)
+    employee_id = Column(Integer, ForeignKey('employees.id'),
+                         primary_key=True)
+    job_id = Column(Integer, ForeignKey('jobs.id'), primary_key=True)
+    kind = Column(String(8), primary_key=True)
+    count = Column(Integer, nullable=False)
+    bins = Column(String, nullable=False)
+
+class ChangeCounter(Base):
+    """The single row holding the last change sequence number handed out
+
+    site identifies this database to the ones it's synced with.
+    """
+
+    __tablename__ = "change_counter"
+    id = Column(Integer, primary_key=True)
+    site = Column(String(32), nullable=False)
+    seq = Column(Integer, nullable=False)
+
+class Deletion(Base):
+    """Tombstone for a deleted Clocktime, Employee or Job, for sync"""
+
+    __tablename__ = "deletions"
+    __table_args__ = (
+        Index('ix_deletions_change_seq', 'change_seq'),
+    )
+    table_name = Column(String(32), primary_key=True)
+    row_id = Column(Integer, primary_key=True)
+    change_seq = Column(Integer, nullable=False)
+
+class SyncState(Base):
+    """How far this database has synced from another one (see sync.py)
+
+    last_seq is the source's change sequence number synced up to, and
+    local_seq this database's own at the end of that sync.
+    """
+
+    __tablename__ = "sync_state"
+    site = Column(String(32), primary_key=True)
+    last_seq = Column(Integer, nullable=False)
+    local_seq = Column(Integer, nullable=False)
+
+from models import rollup  # registers the flush listeners
+from models import changes, durations
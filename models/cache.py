@@ -0,0 +1,175 @@
+"""In-process LRU cache of Job and Employee lookups
+
+Jobs and Employees change rarely but are looked up on every punch, so
+LookupCache keeps small immutable records of them keyed by id (and jobs
+by abbreviation as well). Entries are dropped when a session commits a
+change to the matching Job or Employee, via the session events below.
+Changes made elsewhere (another process, csvio, sync) are caught by
+checking the jobs' and employees' newest change_seq (see
+models.changes) once per transaction: if it moved, everything cached
+is dropped. That's one SELECT of three index lookups, however many
+lookups the transaction makes.
+
+    cache = LookupCache()
+    job = cache.job_by_abbr(session, "PYTIME")  # one SELECT
+    job = cache.job_by_abbr(session, "PYTIME")  # none
+"""
+
+import weakref
+from collections import OrderedDict
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from models import Deletion, Employee, Job
+from models.records import EmployeeRecord, JobRecord, columns
+
+# session.info key for the (kind, id) pairs changed in this transaction
+_CHANGED = 'cache_changed'
+
+
+# every live LookupCache, so commits can invalidate all of them
+_caches = weakref.WeakSet()
+
+_deletions = Deletion.__table__
+# the newest change to any job or employee, deletions included
+_VERSION = select([
+    select([func.max(Job.__table__.c.change_seq)]).as_scalar(),
+    select([func.max(Employee.__table__.c.change_seq)]).as_scalar(),
+    select([func.max(_deletions.c.change_seq)])
+    .where(_deletions.c.table_name.in_([Job.__tablename__,
+                                        Employee.__tablename__]))
+    .as_scalar()])
+
+
+class LookupCache(object):
+    """Size-bounded LRU cache of JobRecords and EmployeeRecords
+
+    Misses are loaded with one Core SELECT through the session passed
+    in; lookups that find nothing return None and aren't cached.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (kind, id) -> record
+        self._abbrs = {}  # job abbr -> job id
+        self._version = None  # the _VERSION row the entries are from
+        self._checked = None  # weakref to the transaction that read it
+        _caches.add(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._entries), 'maxsize': self.maxsize}
+
+    def _get(self, key):
+        try:
+            record = self._entries.pop(key)
+        except KeyError:
+            return None
+        self._entries[key] = record  # most recently used goes last
+        return record
+
+    def _put(self, key, record):
+        self._entries.pop(key, None)
+        self._entries[key] = record
+        if key[0] == 'job':
+            self._abbrs[record.abbr] = record.id
+        while len(self._entries) > self.maxsize:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key):
+        record = self._entries.pop(key, None)
+        if record is not None and key[0] == 'job' and \
+                self._abbrs.get(record.abbr) == record.id:
+            del self._abbrs[record.abbr]
+
+    def _check(self, session):
+        """Drops everything if jobs or employees changed since last time
+
+        Only the first lookup in each transaction reads the version.
+        """
+        transaction = session.transaction
+        if self._checked is not None and self._checked() is transaction:
+            return
+        version = tuple(session.execute(_VERSION).first())
+        if version != self._version:
+            self.invalidate()
+            self._version = version
+        self._checked = weakref.ref(transaction)
+
+    def _lookup(self, kind, id_, session, table, record_type, where):
+        self._check(session)
+        record = self._get((kind, id_)) if id_ is not None else None
+        if record is not None:
+            self.hits += 1
+            return record
+        self.misses += 1
+        row = session.execute(select(columns(table, record_type))
+                              .where(where)).first()
+        if row is None:
+            return None
+        record = record_type(*row)
+        self._put((kind, record.id), record)
+        return record
+
+    def job(self, session, job_id):
+        """Returns the JobRecord with id job_id, or None"""
+        table = Job.__table__
+        return self._lookup('job', job_id, session, table, JobRecord,
+                            table.c.id == job_id)
+
+    def job_by_abbr(self, session, abbr):
+        """Returns the JobRecord with abbreviation abbr, or None"""
+        table = Job.__table__
+        return self._lookup('job', self._abbrs.get(abbr), session, table,
+                            JobRecord, table.c.abbr == abbr)
+
+    def employee(self, session, employee_id):
+        """Returns the EmployeeRecord with id employee_id, or None"""
+        table = Employee.__table__
+        return self._lookup('employee', employee_id, session, table,
+                            EmployeeRecord, table.c.id == employee_id)
+
+    def invalidate(self, kind=None, id_=None):
+        """Drops one entry, every entry of a kind, or everything"""
+        if kind is None:
+            self._entries.clear()
+            self._abbrs.clear()
+        elif id_ is None:
+            for key in [key for key in self._entries if key[0] == kind]:
+                self._evict(key)
+        else:
+            self._evict((kind, id_))
+
+
+CACHE = LookupCache()
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_changes(session, flush_context, instances):
+    changed = session.info.setdefault(_CHANGED, set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Job, Employee)) and (
+                obj in session.deleted or
+                session.is_modified(obj, include_collections=False)):
+            identity = inspect(obj).identity
+            if identity is not None:
+                kind = 'job' if isinstance(obj, Job) else 'employee'
+                changed.add((kind, identity[0]))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate(session):
+    for kind, id_ in session.info.pop(_CHANGED, ()):
+        for cache in list(_caches):
+            cache.invalidate(kind, id_)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    session.info.pop(_CHANGED, None)
@@ -0,0 +1,102 @@
+"""Change sequence numbers for clocktimes, employees and jobs
+
+Every flush that adds, edits or deletes a Clocktime, Employee or Job
+takes the next number from the change_counter table and stamps it on
+their change_seq column; deleted rows leave a Deletion tombstone with
+it instead. It's all done inside the flush's own transaction, so the
+numbers commit (or roll back) with the changes, and "everything changed
+since n" is a range scan of the change_seq indexes. sync.py uses that
+to copy just the changes from one database to another.
+
+Core writes bypass the session and have to call next_sequence() and
+stamp their rows themselves, as csvio.import_csv does. archive.archive
+deliberately leaves no tombstones: archived shifts haven't been deleted.
+"""
+
+import uuid
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from models import ChangeCounter, Clocktime, Deletion, Employee, Job
+
+TRACKED = (Clocktime, Employee, Job)
+
+# session.info key for the sequence number taken in this transaction
+_STAMPED = 'change_seq'
+
+
+def next_sequence(connection):
+    """Takes the next change sequence number and returns it
+
+    The UPDATE takes SQLite's write lock before the number is read, so
+    concurrent writers never share one.
+    """
+    counter = ChangeCounter.__table__
+    if not connection.execute(
+            counter.update().values(seq=counter.c.seq + 1)).rowcount:
+        connection.execute(counter.insert().values(
+            id=1, site=uuid.uuid4().hex, seq=1))
+    return connection.execute(select([counter.c.seq])).scalar()
+
+
+def current_sequence(connection):
+    """The last change sequence number handed out (0 for none)"""
+    counter = ChangeCounter.__table__
+    return connection.execute(select([counter.c.seq])).scalar() or 0
+
+
+def site(connection):
+    """This database's site id, made up on first use"""
+    counter = ChangeCounter.__table__
+    query = select([counter.c.site])
+    site_id = connection.execute(query).scalar()
+    if site_id is None:
+        next_sequence(connection)
+        site_id = connection.execute(query).scalar()
+    return site_id
+
+
+def uncommitted(session):
+    """True if session has flushed tracked changes it hasn't committed"""
+    return _STAMPED in session.info
+
+
+def stamped(session):
+    """The number session's last flush took, None if it hasn't taken one
+
+    Cleared when the transaction commits or rolls back.
+    """
+    return session.info.get(_STAMPED)
+
+
+@event.listens_for(Session, 'before_flush')
+def _stamp(session, flush_context, instances):
+    """Stamps the tracked objects about to be written with one number"""
+    new = [obj for obj in session.new if isinstance(obj, TRACKED)]
+    changed = [obj for obj in session.dirty
+               if isinstance(obj, TRACKED) and
+               session.is_modified(obj, include_collections=False)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, TRACKED)]
+    if not (new or changed or deleted):
+        return
+    seq = next_sequence(session.connection())
+    session.info[_STAMPED] = seq
+    for obj in new + changed:
+        obj.change_seq = seq
+    if deleted:
+        session.execute(
+            Deletion.__table__.insert().prefix_with('OR REPLACE'),
+            [{'table_name': obj.__tablename__,
+              'row_id': inspect(obj).identity[0],
+              'change_seq': seq} for obj in deleted])
+
+
+@event.listens_for(Session, 'after_commit')
+def _committed(session):
+    session.info.pop(_STAMPED, None)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    session.info.pop(_STAMPED, None)
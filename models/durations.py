@@ -0,0 +1,395 @@
+"""Shift and break length distributions, from mergeable log histograms
+
+Totals come from daily_totals; medians and 90th percentiles can't be
+added up like that, and sorting every Clocktime's timeworked doesn't
+scale. Instead each day, employee, job and kind ('shift' for time
+worked, 'break' for the time off until the employee's next shift) gets
+a LogHistogram in the daily_sketches table. Histograms merge by adding
+their counts, so a distribution over any date range, per job or per
+employee, is read from the day rows alone, in memory proportional to
+the number of groups, however many shifts they cover:
+
+    by_job = distributions(connection, start, end, by='job')
+    by_job[job_id].quantile(0.9)  # seconds, within 1%
+
+Like the daily rollup, the rows are kept in step from inside the flush
+that adds, edits or deletes a Clocktime. A shift counts on the day it
+started, and so does the break after it. Recomputing a day in a year
+that has an archive reads the employee's archived shifts back too, on
+a connection of its own, as ATTACH can't run inside the flush.
+"""
+
+import datetime
+import math
+from collections import defaultdict
+from itertools import groupby
+
+from sqlalchemy import and_, bindparam, event, inspect, select
+from sqlalchemy.orm import Session
+
+import archive
+from models import Clocktime, DailySketch
+
+# bin width ratio: quantiles come out within (GAMMA - 1) / 2 of the truth
+GAMMA = 1.02
+# longer gaps between shifts are time off, not breaks
+MAX_BREAK = datetime.timedelta(hours=4)
+ONE_DAY = datetime.timedelta(days=1)
+KINDS = ('shift', 'break')
+
+# session.info key for the (employee_id, date) pairs to recompute
+_TOUCHED = 'durations_touched'
+# the Clocktime attributes whose changes alter shifts or breaks, and
+# those that can move them to another day or employee
+_COLUMNS = ('time_in', 'time_out', 'employee_id', 'job_id', 'employee',
+            'job')
+_MOVING = ('time_in', 'employee_id', 'employee')
+
+_LOG_GAMMA = math.log(GAMMA)
+
+# recompute()'s statements, built once so their compiled forms are
+# cached in _COMPILED rather than compiled on every punch
+_clocktimes = Clocktime.__table__
+_sketches = DailySketch.__table__
+_SHIFTS = select([_clocktimes.c.time_in, _clocktimes.c.time_out,
+                  _clocktimes.c.employee_id, _clocktimes.c.job_id])\
+    .where(and_(_clocktimes.c.employee_id == bindparam('employee_id'),
+                _clocktimes.c.time_in >= bindparam('start'),
+                _clocktimes.c.time_in < bindparam('end')))\
+    .order_by(_clocktimes.c.time_in)
+_DELETE = _sketches.delete().where(
+    and_(_sketches.c.employee_id == bindparam('emp'),
+         _sketches.c.date == bindparam('day')))
+_INSERT = _sketches.insert()
+_COMPILED = {}
+
+
+def bin_of(seconds):
+    """The LogHistogram bin a duration in seconds falls in
+
+    Bin 0 holds durations under a second, and bin i those from
+    GAMMA ** (i - 1) up to GAMMA ** i seconds.
+    """
+    if seconds < 1:
+        return 0
+    return int(math.floor(math.log(seconds) / _LOG_GAMMA)) + 1
+
+
+def bin_value(index):
+    """The middle of a bin, in seconds"""
+    if index == 0:
+        return 0.0
+    return GAMMA ** (index - 1) * (1 + GAMMA) / 2
+
+
+class LogHistogram(object):
+    """Counts of durations in geometrically growing bins
+
+    Two histograms merge exactly, by adding their counts, and any
+    quantile is read back to within half a bin's width.
+    """
+
+    __slots__ = ('bins', 'count')
+
+    def __init__(self, bins=None):
+        self.bins = dict(bins or {})  # bin -> count
+        self.count = sum(self.bins.values())
+
+    def add(self, seconds, n=1):
+        index = bin_of(seconds)
+        self.bins[index] = self.bins.get(index, 0) + n
+        self.count += n
+
+    def merge(self, other):
+        """Adds other's counts to this histogram's, returning it"""
+        for index, n in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + n
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """The duration a fraction q of those counted are at or under
+
+        None if nothing has been counted.
+        """
+        if not self.count:
+            return None
+        rank = min(max(int(math.ceil(q * self.count)), 1), self.count)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen >= rank:
+                return bin_value(index)
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+    def encode(self):
+        """'bin:count,...', as stored in daily_sketches.bins"""
+        return ",".join("{:d}:{:d}".format(index, self.bins[index])
+                        for index in sorted(self.bins))
+
+    @classmethod
+    def decode(cls, text):
+        return cls((int(index), int(n)) for index, n in
+                   (pair.split(":") for pair in text.split(",") if pair))
+
+    def __eq__(self, other):
+        return isinstance(other, LogHistogram) and self.bins == other.bins
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "LogHistogram(count={}, median={})".format(self.count,
+                                                          self.median)
+
+
+def _seconds(start, end):
+    delta = end.replace(microsecond=0) - start.replace(microsecond=0)
+    return delta.days * 86400 + delta.seconds
+
+
+def sketch_shifts(shifts, days=None):
+    """Returns {(date, employee_id, job_id, kind): LogHistogram}
+
+    shifts are one employee's (time_in, time_out, employee_id, job_id)
+    in time_in order, and only those starting on one of days (default
+    any) are counted. Each shift's break is the gap until the next one
+    starts, if that's no longer than MAX_BREAK.
+    """
+    sketches = defaultdict(LogHistogram)
+    previous = None
+    for shift in list(shifts) + [None]:
+        if previous is not None and previous[1] is not None:
+            time_in, time_out, employee_id, job_id = previous
+            day = time_in.date()
+            if days is None or day in days:
+                if time_out >= time_in:
+                    sketches[(day, employee_id, job_id, 'shift')].add(
+                        _seconds(time_in, time_out))
+                if shift is not None and \
+                        time_out <= shift[0] <= time_out + MAX_BREAK:
+                    sketches[(day, employee_id, job_id, 'break')].add(
+                        _seconds(time_out, shift[0]))
+        previous = shift
+    return sketches
+
+
+def _rows(sketches):
+    return [{'date': day, 'employee_id': employee_id, 'job_id': job_id,
+             'kind': kind, 'count': sketch.count, 'bins': sketch.encode()}
+            for (day, employee_id, job_id, kind), sketch in sketches.items()]
+
+
+def _archive_years(connection, start, end):
+    """The years with an archive that can hold start <= time_in < end"""
+    path = connection.engine.url.database
+    if not path:
+        return []
+    return [year for year in archive.archive_years(path)
+            if (start is None or start < datetime.datetime(year + 1, 1, 1))
+            and (end is None or end > datetime.datetime(year, 1, 1))]
+
+
+def _archived_shifts(archived, employee_id, start=None, end=None):
+    """employee_id's shifts in the archive tables, start <= time_in < end
+
+    archived is a list of (connection, table) pairs.
+    """
+    shifts = []
+    for connection, table in archived:
+        conditions = [table.c.employee_id == employee_id]
+        if start is not None:
+            conditions.append(table.c.time_in >= start)
+        if end is not None:
+            conditions.append(table.c.time_in < end)
+        shifts.extend(connection.execute(
+            select([table.c.time_in, table.c.time_out,
+                    table.c.employee_id, table.c.job_id])
+            .where(and_(*conditions))))
+    return shifts
+
+
+def _with_archived(shifts, archived_shifts):
+    if not archived_shifts:
+        return shifts
+    return sorted(list(shifts) + archived_shifts, key=lambda row: row[0])
+
+
+def recompute(connection, pairs):
+    """Rebuilds the daily_sketches rows of each (employee_id, date) pair
+
+    Reads each employee's clocktimes from the first day to two days
+    after the last, to find the shift following the last day's, from
+    the archives as well as the hot table where they overlap.
+    """
+    days_by_employee = defaultdict(set)
+    for employee_id, day in pairs:
+        if employee_id is not None and day is not None:
+            days_by_employee[employee_id].add(day)
+    if not days_by_employee:
+        return
+    ranges = {employee_id: (
+        datetime.datetime.combine(min(days), datetime.time()),
+        datetime.datetime.combine(max(days) + 2 * ONE_DAY, datetime.time()))
+        for employee_id, days in days_by_employee.items()}
+    years = _archive_years(connection,
+                           min(start for start, _ in ranges.values()),
+                           max(end for _, end in ranges.values()))
+    if years:
+        with connection.engine.connect() as other:
+            archived = [(other, archive.attach(other, year))
+                        for year in years]
+            archived_shifts = {
+                employee_id: _archived_shifts(archived, employee_id,
+                                              start, end)
+                for employee_id, (start, end) in ranges.items()}
+    else:
+        archived_shifts = {}
+    connection = connection.execution_options(compiled_cache=_COMPILED)
+    deletes, inserts = [], []
+    for employee_id, days in days_by_employee.items():
+        start, end = ranges[employee_id]
+        shifts = connection.execute(_SHIFTS, employee_id=employee_id,
+                                    start=start, end=end).fetchall()
+        shifts = _with_archived(shifts, archived_shifts.get(employee_id))
+        deletes.extend({'emp': employee_id, 'day': day} for day in days)
+        inserts.extend(_rows(sketch_shifts(shifts, days)))
+    connection.execute(_DELETE, deletes)
+    if inserts:
+        connection.execute(_INSERT, inserts)
+
+
+def touched(employee_id, time_in):
+    """The (employee_id, date) pairs a shift starting at time_in affects
+
+    Its own day, and the day before, whose last break may end in it.
+    """
+    if employee_id is None or time_in is None:
+        return []
+    day = time_in.date()
+    return [(employee_id, day), (employee_id, day - ONE_DAY)]
+
+
+def _employee_shifts(rows, archived):
+    """Yields each employee's shifts, archived ones merged in
+
+    rows are the hot table's, in employee_id, time_in order.
+    """
+    archived_ids = set()
+    for connection, table in archived:
+        archived_ids.update(employee_id for (employee_id,) in
+                            connection.execute(
+                                select([table.c.employee_id]).distinct()))
+    for employee_id, shifts in groupby(rows, key=lambda row: row[2]):
+        archived_ids.discard(employee_id)
+        yield _with_archived(shifts, _archived_shifts(archived, employee_id))
+    for employee_id in archived_ids:
+        yield _with_archived([], _archived_shifts(archived, employee_id))
+
+
+def rebuild(connection, chunk_size=10000):
+    """Recomputes daily_sketches from scratch out of the clocktimes table
+
+    Streams the clocktimes by employee, holding one employee's at a time,
+    archived ones included.
+    """
+    table = DailySketch.__table__
+    clocktimes = Clocktime.__table__
+    connection.execute(table.delete())
+    years = _archive_years(connection, None, None)
+    other = connection.engine.connect() if years else None
+    try:
+        archived = [(other, archive.attach(other, year)) for year in years]
+        rows = connection.execute(
+            select([clocktimes.c.time_in, clocktimes.c.time_out,
+                    clocktimes.c.employee_id, clocktimes.c.job_id])
+            .where(clocktimes.c.time_in != None)
+            .order_by(clocktimes.c.employee_id, clocktimes.c.time_in))
+        chunk = []
+        for shifts in _employee_shifts(rows, archived):
+            chunk.extend(_rows(sketch_shifts(shifts)))
+            if len(chunk) >= chunk_size:
+                connection.execute(table.insert(), chunk)
+                chunk = []
+        if chunk:
+            connection.execute(table.insert(), chunk)
+    finally:
+        if other is not None:
+            other.close()
+
+
+def distributions(connection, start, end, by='job', kind='shift',
+                  employee_id=None, job_id=None):
+    """Returns {job or employee id: LogHistogram} for start <= date < end
+
+    by is 'job', 'employee' or None for a single histogram under None;
+    kind is 'shift' or 'break'.
+    """
+    if kind not in KINDS:
+        raise ValueError("Unknown duration kind {!r}".format(kind))
+    table = DailySketch.__table__
+    group = {'job': table.c.job_id, 'employee': table.c.employee_id,
+             None: None}[by]
+    conditions = [table.c.kind == kind]
+    if start is not None:
+        conditions.append(table.c.date >= start)
+    if end is not None:
+        conditions.append(table.c.date < end)
+    if employee_id is not None:
+        conditions.append(table.c.employee_id == employee_id)
+    if job_id is not None:
+        conditions.append(table.c.job_id == job_id)
+    columns = [table.c.bins] if group is None else [table.c.bins, group]
+    merged = defaultdict(LogHistogram)
+    for row in connection.execute(select(columns).where(and_(*conditions))):
+        merged[row[1] if group is not None else None].merge(
+            LogHistogram.decode(row[0]))
+    return dict(merged)
+
+
+def _changed(obj, names):
+    attrs = inspect(obj).attrs
+    return any(attrs[name].history.has_changes() for name in names)
+
+
+@event.listens_for(Session, 'before_flush')
+def _before_flush(session, flush_context, instances):
+    """Notes the days of every Clocktime about to move, as they were
+
+    Shifts moved to another day or employee, or deleted, are looked up
+    in the database, as rollup does; a clock out only changes time_out
+    and needs no query.
+    """
+    added = [obj for obj in session.new if isinstance(obj, Clocktime)]
+    moved = []
+    for obj in session.dirty:
+        if isinstance(obj, Clocktime) and _changed(obj, _COLUMNS):
+            added.append(obj)
+            if _changed(obj, _MOVING):
+                moved.append(inspect(obj).identity[0])
+    moved.extend(inspect(obj).identity[0] for obj in session.deleted
+                 if isinstance(obj, Clocktime))
+    if not (added or moved):
+        return
+    pairs = set()
+    if moved:
+        clocktimes = Clocktime.__table__
+        for employee_id, time_in in session.execute(
+                select([clocktimes.c.employee_id, clocktimes.c.time_in])
+                .where(clocktimes.c.id.in_(moved))):
+            pairs.update(touched(employee_id, time_in))
+    session.info[_TOUCHED] = (pairs, added)
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    """Recomputes the days touched, with the flushed values"""
+    pairs, added = session.info.pop(_TOUCHED, (None, ()))
+    if pairs is None:
+        return
+    for obj in added:
+        pairs.update(touched(obj.employee_id, obj.time_in))
+    recompute(session.connection(), pairs)
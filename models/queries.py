@@ -0,0 +1,43 @@
+"""Shared read queries over the timeclock models
+
+Anything that prints clocktimes should go through here: Clocktime.__str__
+reads both .employee and .job, which would otherwise each be lazy loaded
+with their own SELECT for every row.
+"""
+
+from sqlalchemy.orm import joinedload
+
+from models import Clocktime
+
+
+def clocktimes(session, start=None, end=None, employee_id=None,
+               job_id=None):
+    """Returns a query for Clocktimes with employee and job joined in
+
+    start and end bound time_in (start <= time_in < end). Rows are
+    ordered by time_in.
+    """
+    query = session.query(Clocktime)\
+                   .options(joinedload(Clocktime.employee),
+                            joinedload(Clocktime.job))
+    if start is not None:
+        query = query.filter(Clocktime.time_in >= start)
+    if end is not None:
+        query = query.filter(Clocktime.time_in < end)
+    if employee_id is not None:
+        query = query.filter(Clocktime.employee_id == employee_id)
+    if job_id is not None:
+        query = query.filter(Clocktime.job_id == job_id)
+    return query.order_by(Clocktime.time_in, Clocktime.id)
+
+
+def open_clocktime(session, employee_id):
+    """Returns employee_id's open Clocktime, or None if not clocked in
+
+    Served by the partial index on open shifts.
+    """
+    return session.query(Clocktime)\
+                  .filter(Clocktime.employee_id == employee_id,
+                          Clocktime.time_out == None)\
+                  .order_by(Clocktime.time_in.desc())\
+                  .first()
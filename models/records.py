@@ -0,0 +1,126 @@
+"""Read-only records of the timeclock models, for reports and listings
+
+The queries here are Core selects returning small immutable namedtuples
+instead of mapped instances, so there's no identity map, instance state
+or attribute instrumentation per row. The records borrow the models' own
+properties and __str__, so they print exactly like the objects they
+stand in for:
+
+    for clocktime in records.clocktimes(session, day, day + ONE_DAY):
+        print(clocktime)  # as str(Clocktime)
+
+Use the models themselves (and models.queries) for anything that's
+going to be changed.
+"""
+
+from collections import namedtuple
+
+from sqlalchemy import and_, select
+
+from models import Clocktime, Employee, Job
+
+
+class JobRecord(namedtuple('JobRecord', ['id', 'name', 'abbr', 'rate'])):
+    __slots__ = ()
+
+    __str__ = Job.__str__.__func__
+
+
+class EmployeeRecord(namedtuple('EmployeeRecord',
+                                ['id', 'firstname', 'lastname'])):
+    __slots__ = ()
+
+    name = Employee.name
+    __str__ = Employee.__str__.__func__
+
+
+class ClocktimeRecord(namedtuple('ClocktimeRecord',
+                                 ['id', 'time_in', 'time_out', 'employee_id',
+                                  'job_id', 'firstname', 'lastname', 'abbr',
+                                  'job_name', 'rate'])):
+    """A clocktime with its employee's and job's columns alongside"""
+
+    __slots__ = ()
+
+    timeworked = Clocktime.timeworked
+    seconds_worked = property(Clocktime.__dict__['seconds_worked'].fget)
+    name = Employee.name
+    __str__ = Clocktime.__str__.__func__
+
+    @property
+    def employee(self):
+        return EmployeeRecord(self.employee_id, self.firstname,
+                              self.lastname)
+
+    @property
+    def job(self):
+        return JobRecord(self.job_id, self.job_name, self.abbr, self.rate)
+
+
+def columns(table, record_type):
+    """table's columns for record_type's fields, in order"""
+    return [table.c[field] for field in record_type._fields]
+
+
+def _rows(session, query):
+    """Runs query through session, after flushing like a Query would"""
+    session.flush()
+    return session.execute(query)
+
+
+def _clocktimes_query(*conditions):
+    table = Clocktime.__table__
+    employees = Employee.__table__
+    jobs = Job.__table__
+    return select([table.c.id, table.c.time_in, table.c.time_out,
+                   table.c.employee_id, table.c.job_id,
+                   employees.c.firstname, employees.c.lastname,
+                   jobs.c.abbr, jobs.c.name, jobs.c.rate])\
+        .select_from(table
+                     .outerjoin(employees,
+                                table.c.employee_id == employees.c.id)
+                     .outerjoin(jobs, table.c.job_id == jobs.c.id))\
+        .where(and_(*conditions))
+
+
+def clocktime(session, clocktime_id):
+    """Returns the ClocktimeRecord with id clocktime_id, or None"""
+    row = _rows(session, _clocktimes_query(
+        Clocktime.__table__.c.id == clocktime_id)).first()
+    return None if row is None else ClocktimeRecord._make(row)
+
+
+def clocktimes(session, start=None, end=None, employee_id=None,
+               job_id=None):
+    """Returns ClocktimeRecords for queries.clocktimes' Clocktimes
+
+    Same filters, same order, in one SELECT.
+    """
+    table = Clocktime.__table__
+    conditions = []
+    if start is not None:
+        conditions.append(table.c.time_in >= start)
+    if end is not None:
+        conditions.append(table.c.time_in < end)
+    if employee_id is not None:
+        conditions.append(table.c.employee_id == employee_id)
+    if job_id is not None:
+        conditions.append(table.c.job_id == job_id)
+    query = _clocktimes_query(*conditions)\
+        .order_by(table.c.time_in, table.c.id)
+    make = ClocktimeRecord._make
+    return [make(row) for row in _rows(session, query)]
+
+
+def jobs(session):
+    """Returns a JobRecord for every job, by id"""
+    table = Job.__table__
+    query = select(columns(table, JobRecord)).order_by(table.c.id)
+    return [JobRecord._make(row) for row in _rows(session, query)]
+
+
+def employees(session):
+    """Returns an EmployeeRecord for every employee, by id"""
+    table = Employee.__table__
+    query = select(columns(table, EmployeeRecord)).order_by(table.c.id)
+    return [EmployeeRecord._make(row) for row in _rows(session, query)]
@@ -0,0 +1,171 @@
+"""Cache of report results, checked against the data generation
+
+The menu's reports are asked for over and over while the data behind
+them rarely changes in between. ReportCache keeps each report's rows
+keyed by (report, arguments) together with the generation they were
+built at: the database's site id and the change sequence number
+models.changes bumps in every transaction that writes a Clocktime,
+Employee or Job (bulk loads and sync included). A lookup reads that one
+row, and while it's unchanged the cached rows are served without
+touching clocktimes or daily_totals; once it moves, the report is
+rebuilt on its next request.
+
+The cache holds at most maxsize reports, least recently used going
+first. Given a path, it's also pickled there after every rebuild and
+read back on first use, so one-shot `tc.py report` runs share it.
+
+    REPORTS.totals(session, day, day + ONE_DAY)  # the report's SELECT
+    REPORTS.totals(session, day, day + ONE_DAY)  # just the generation's
+"""
+
+import cPickle as pickle
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import select
+
+import instrumentation
+from models import ChangeCounter, changes, rollup
+
+Total = namedtuple('Total', ['date', 'employee_id', 'name', 'abbr',
+                             'job_name', 'seconds'])
+WeekTotal = namedtuple('WeekTotal', ['abbr', 'job_name', 'seconds'])
+
+
+def generation(connection):
+    """(site, change sequence number) of the database behind connection
+
+    Read with one SELECT of the single change_counter row.
+    """
+    counter = ChangeCounter.__table__
+    query = select([counter.c.site, counter.c.seq])
+    row = connection.execute(query).first()
+    if row is None:
+        changes.site(connection)
+        row = connection.execute(query).first()
+    return tuple(row)
+
+
+# the reports the cache knows how to build, by name
+BUILDERS = {
+    'totals': lambda session, start, end, employee_id=None:
+        [Total(*row) for row in rollup.totals(session, start, end,
+                                              employee_id)],
+    'week_totals': lambda session, day, employee_id=None:
+        [WeekTotal(*row) for row in rollup.week_totals(session, day,
+                                                       employee_id)],
+}
+
+
+class ReportCache(object):
+    """Size-bounded LRU cache of report rows, validated by generation"""
+
+    def __init__(self, maxsize=128, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # misses where an outdated entry was dropped
+        self.rebuild_seconds = 0.0
+        self._entries = OrderedDict()  # key -> ((site, seq), rows)
+        self._loaded = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'stale': self.stale, 'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'rebuild_ms': round(self.rebuild_seconds * 1000, 3)}
+
+    def report(self, session, name, *args):
+        """Returns report name's rows for args, from the cache if current
+
+        A session with uncommitted changes gets a fresh report, which
+        isn't cached: its generation could still be rolled back.
+        """
+        session.flush()
+        if changes.uncommitted(session):
+            return BUILDERS[name](session, *args)
+        if not self._loaded:
+            self._load()
+        version = generation(session.connection())
+        key = (name,) + args
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[0] == version:
+            self._entries[key] = entry  # most recently used goes last
+            self.hits += 1
+            self._count('report cache hits')
+            return entry[1]
+        self.misses += 1
+        self._count('report cache misses')
+        if entry is not None:
+            self.stale += 1
+        start = time.time()
+        with instrumentation.timer('report.' + name):
+            rows = BUILDERS[name](session, *args)
+        self.rebuild_seconds += time.time() - start
+        self._entries[key] = (version, rows)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        self.save()
+        return rows
+
+    def totals(self, session, start, end, employee_id=None):
+        """rollup.totals() as Total tuples"""
+        return self.report(session, 'totals', start, end, employee_id)
+
+    def week_totals(self, session, day, employee_id=None):
+        """rollup.week_totals() as WeekTotal tuples"""
+        return self.report(session, 'week_totals', day, employee_id)
+
+    def invalidate(self):
+        """Forgets every report"""
+        self._entries.clear()
+
+    @staticmethod
+    def _count(name):
+        if instrumentation.STATS is not None:
+            instrumentation.STATS.count(name)
+
+    def _load(self):
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            logging.warning("Ignoring unreadable report cache {}: {}"
+                            .format(self.path, e))
+            return
+        entries.update(self._entries)
+        self._entries = entries
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        """Writes the cache to path, if it has one"""
+        if not self.path:
+            return
+        temp = None
+        try:
+            # a temp file of its own, as other processes may be saving too
+            fd, temp = tempfile.mkstemp(
+                dir=os.path.dirname(self.path) or ".",
+                prefix=os.path.basename(self.path))
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(self._entries, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp, self.path)
+        except (IOError, OSError) as e:
+            logging.warning("Couldn't save report cache {}: {}"
+                            .format(self.path, e))
+            if temp is not None and os.path.exists(temp):
+                os.remove(temp)
+
+
+REPORTS = ReportCache()
@@ -0,0 +1,165 @@
+"""Daily rollup of time worked, kept in step with the clocktimes table
+
+DailyTotal rows are updated from inside the flush that closes, edits or
+deletes a Clocktime, so they always commit (or roll back) together with
+it. Reports read their totals from here in O(days x jobs) no matter how
+much history the clocktimes table holds.
+"""
+
+import datetime
+from collections import defaultdict
+from itertools import chain
+
+from sqlalchemy import and_, bindparam, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from models import Clocktime, DailyTotal, Employee, Job
+
+ONE_DAY = datetime.timedelta(days=1)
+
+# session.info key for the deltas collected in before_flush
+_PENDING = 'rollup_pending'
+
+
+def split_by_day(time_in, time_out):
+    """Yields (date, seconds) for each calendar day an interval covers
+
+    Open or empty intervals yield nothing. Microseconds are dropped from
+    both ends first, so the seconds add up to Clocktime.seconds_worked.
+    split_by_day(datetime(2014, 9, 1, 22), datetime(2014, 9, 2, 2)) ->
+        (date(2014, 9, 1), 7200), (date(2014, 9, 2), 7200)
+    """
+    if time_in is None or time_out is None:
+        return
+    start = time_in.replace(microsecond=0)
+    time_out = time_out.replace(microsecond=0)
+    while start < time_out:
+        midnight = datetime.datetime.combine(start.date() + ONE_DAY,
+                                             datetime.time())
+        end = min(midnight, time_out)
+        delta = end - start
+        yield start.date(), delta.days * 86400 + delta.seconds
+        start = end
+
+
+def add_interval(deltas, time_in, time_out, employee_id, job_id, sign=1):
+    """Adds sign * the interval's seconds to deltas, keyed by DailyTotal PK"""
+    for day, seconds in split_by_day(time_in, time_out):
+        deltas[(day, employee_id, job_id)] += sign * seconds
+
+
+def apply_deltas(connection, deltas):
+    """Adds each (date, employee_id, job_id): seconds delta to daily_totals
+
+    Runs as two executemany statements however many keys there are: one
+    to make sure every row exists, and one to add the deltas.
+    """
+    table = DailyTotal.__table__
+    params = [{'day': day, 'emp': employee_id, 'job': job_id,
+               'delta': seconds}
+              for (day, employee_id, job_id), seconds in deltas.items()
+              if seconds]
+    if not params:
+        return
+    connection.execute(
+        table.insert().prefix_with('OR IGNORE').values(
+            date=bindparam('day'), employee_id=bindparam('emp'),
+            job_id=bindparam('job'), seconds=0),
+        params)
+    connection.execute(
+        table.update().where(and_(table.c.date == bindparam('day'),
+                                  table.c.employee_id == bindparam('emp'),
+                                  table.c.job_id == bindparam('job')))
+             .values(seconds=table.c.seconds + bindparam('delta')),
+        params)
+
+
+def rebuild(connection):
+    """Recomputes daily_totals from scratch out of the clocktimes table
+
+    Used to backfill databases that predate the rollup.
+    """
+    clocktimes = Clocktime.__table__
+    connection.execute(DailyTotal.__table__.delete())
+    deltas = defaultdict(int)
+    rows = connection.execute(
+        select([clocktimes.c.time_in, clocktimes.c.time_out,
+                clocktimes.c.employee_id, clocktimes.c.job_id])
+        .where(clocktimes.c.time_out != None))
+    for row in rows:
+        add_interval(deltas, *row)
+    apply_deltas(connection, deltas)
+
+
+@event.listens_for(Session, 'before_flush')
+def _before_flush(session, flush_context, instances):
+    """Subtracts the stored values of every Clocktime about to change
+
+    The database still holds the old row at this point, so it's read
+    from there rather than trusting (possibly expired) attribute history.
+    """
+    changed = [obj for obj in session.dirty
+               if isinstance(obj, Clocktime) and
+               session.is_modified(obj, include_collections=False)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Clocktime)]
+    persistent_ids = [inspect(obj).identity[0]
+                      for obj in chain(changed, deleted)]
+    deltas = defaultdict(int)
+    if persistent_ids:
+        clocktimes = Clocktime.__table__
+        rows = session.execute(
+            select([clocktimes.c.time_in, clocktimes.c.time_out,
+                    clocktimes.c.employee_id, clocktimes.c.job_id])
+            .where(clocktimes.c.id.in_(persistent_ids)))
+        for row in rows:
+            add_interval(deltas, *row, sign=-1)
+    new = [obj for obj in session.new if isinstance(obj, Clocktime)]
+    session.info[_PENDING] = (deltas, new + changed)
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    """Adds the flushed values of new and edited Clocktimes"""
+    deltas, added = session.info.pop(_PENDING, (None, ()))
+    if deltas is None:
+        return
+    for obj in added:
+        add_interval(deltas, obj.time_in, obj.time_out,
+                     obj.employee_id, obj.job_id)
+    apply_deltas(session.connection(), deltas)
+
+
+def totals(session, start, end, employee_id=None):
+    """Returns the daily totals for start <= date < end
+
+    Each row has date, employee_id, name, abbr (of the job), job_name and
+    seconds attributes, ordered by date, employee and job.
+    """
+    query = session.query(DailyTotal.date,
+                          DailyTotal.employee_id,
+                          (Employee.firstname + " " +
+                           Employee.lastname).label('name'),
+                          Job.abbr,
+                          Job.name.label('job_name'),
+                          DailyTotal.seconds)\
+                   .join(Employee, DailyTotal.employee_id == Employee.id)\
+                   .join(Job, DailyTotal.job_id == Job.id)\
+                   .filter(DailyTotal.date >= start, DailyTotal.date < end)
+    if employee_id is not None:
+        query = query.filter(DailyTotal.employee_id == employee_id)
+    return query.order_by(DailyTotal.date, DailyTotal.employee_id,
+                          Job.abbr).all()
+
+
+def week_totals(session, day, employee_id=None):
+    """Returns (abbr, job_name, seconds) per job from Monday through day"""
+    monday = day - datetime.timedelta(days=day.weekday())
+    query = session.query(Job.abbr,
+                          Job.name.label('job_name'),
+                          func.sum(DailyTotal.seconds).label('seconds'))\
+                   .join(DailyTotal, DailyTotal.job_id == Job.id)\
+                   .filter(DailyTotal.date >= monday,
+                           DailyTotal.date < day + ONE_DAY)
+    if employee_id is not None:
+        query = query.filter(DailyTotal.employee_id == employee_id)
+    return query.group_by(Job.id).order_by(Job.abbr).all()
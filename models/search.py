@@ -0,0 +1,256 @@
+"""In-memory search over job abbreviations and names
+
+JobIndex reads every job's abbr and name once, on first use, and from
+then on keeps in step with Jobs committed in this process via the
+session events below (bulk Core inserts and other processes aren't seen
+until load() is called again). Two structures answer queries:
+
+- a sorted list of normalized keys -- the abbr, and the name from each
+  word on -- where a prefix's matches are one bisect away, like walking
+  down a trie but without a dict per character;
+- a trigram index, mapping each three letter run of an abbr or name to
+  a sorted array of the jobs containing it, for misspelt or partial
+  names when nothing matches by prefix.
+
+Keys are UTF-8 byte strings and job ids are kept in arrays rather than
+sets, which keeps 100k jobs to tens of MB rather than hundreds.
+
+    index = JobIndex()
+    index.search(session, "pyth")  # one SELECT the first time
+    [Candidate(id=1, abbr=u'PYTIME', name=u'Python Time', score=...)]
+"""
+
+import bisect
+import heapq
+import weakref
+from array import array
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import Job
+
+# session.info key for the job changes flushed in this transaction
+_CHANGES = 'job_search_changes'
+
+# score bands: an exact abbreviation beats any abbr prefix, which beats
+# any name prefix, which beats any fuzzy match (scored 0 to 1)
+EXACT, ABBR_PREFIX, NAME_PREFIX = 4.0, 3.0, 2.0
+
+# trigram postings longer than this are too common to pick candidates by
+COMMON = 2000
+# most fuzzy candidates to score, taking those sharing most rare trigrams
+CANDIDATES = 500
+
+
+class Candidate(namedtuple('Candidate', ['id', 'abbr', 'name', 'score'])):
+    __slots__ = ()
+
+
+def normalize(text):
+    return u" ".join((text or u"").lower().split())
+
+
+def trigrams(text):
+    """The set of three character runs in normalize(text), padded"""
+    padded = u"  {} ".format(normalize(text))
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _key(text):
+    return normalize(text).encode('utf-8')
+
+
+def _keys(id_, abbr, name):
+    """(key, id * 2 + kind) pairs to file a job under
+
+    kind is 0 for the abbr and 1 for the name.
+    """
+    keys = set()
+    if abbr:
+        keys.add((_key(abbr), id_ * 2))
+    words = normalize(name).split(u" ")
+    for i in range(len(words)):
+        if words[i]:
+            keys.add((u" ".join(words[i:]).encode('utf-8'), id_ * 2 + 1))
+    return keys
+
+
+# every live JobIndex, so commits can update all of them
+_indexes = weakref.WeakSet()
+
+
+class JobIndex(object):
+    """Prefix and trigram index of job abbreviations and names"""
+
+    def __init__(self):
+        self._jobs = None  # job id -> (abbr, name, number of trigrams)
+        self._keys = []  # sorted keys
+        self._ids = array('l')  # and id * 2 + kind for each
+        self._trigrams = {}  # trigram -> sorted array of job ids
+        _indexes.add(self)
+
+    def load(self, session):
+        """(Re)reads every job's abbr and name with one query"""
+        jobs = Job.__table__
+        rows = session.execute(select([jobs.c.id, jobs.c.abbr,
+                                       jobs.c.name])).fetchall()
+        self._jobs = {}
+        keys = []
+        postings = defaultdict(list)
+        for id_, abbr, name in rows:
+            keys.extend(_keys(id_, abbr, name))
+            job_trigrams = trigrams(abbr) | trigrams(name)
+            self._jobs[id_] = (abbr, name, len(job_trigrams))
+            for trigram in job_trigrams:
+                postings[trigram].append(id_)
+        keys.sort()
+        self._keys = [key for key, _ in keys]
+        self._ids = array('l', [ids for _, ids in keys])
+        self._trigrams = {trigram: array('l', sorted(ids))
+                          for trigram, ids in postings.items()}
+
+    def invalidate(self):
+        """Forgets everything, so the next search loads afresh"""
+        self._jobs, self._keys, self._ids, self._trigrams = \
+            None, [], array('l'), {}
+
+    def __len__(self):
+        return len(self._jobs or ())
+
+    def add(self, id_, abbr, name):
+        """Indexes a new or changed job"""
+        if self._jobs is None:
+            return
+        self.remove(id_)
+        for key, ids in _keys(id_, abbr, name):
+            i = bisect.bisect_right(self._keys, key)
+            self._keys.insert(i, key)
+            self._ids.insert(i, ids)
+        job_trigrams = trigrams(abbr) | trigrams(name)
+        self._jobs[id_] = (abbr, name, len(job_trigrams))
+        for trigram in job_trigrams:
+            bisect.insort(self._trigrams.setdefault(trigram, array('l')),
+                          id_)
+
+    def remove(self, id_):
+        """Drops a job from the index, if it's there"""
+        if self._jobs is None or id_ not in self._jobs:
+            return
+        abbr, name, _ = self._jobs.pop(id_)
+        for key, ids in _keys(id_, abbr, name):
+            i = bisect.bisect_left(self._keys, key)
+            while i < len(self._keys) and self._keys[i] == key:
+                if self._ids[i] == ids:
+                    del self._keys[i]
+                    del self._ids[i]
+                    break
+                i += 1
+        for trigram in trigrams(abbr) | trigrams(name):
+            postings = self._trigrams.get(trigram)
+            if postings is not None:
+                i = bisect.bisect_left(postings, id_)
+                if i < len(postings) and postings[i] == id_:
+                    del postings[i]
+                if not postings:
+                    del self._trigrams[trigram]
+
+    def _prefixed(self, prefix, limit):
+        """Yields (key, id, kind) for keys starting with prefix, in order"""
+        i = bisect.bisect_left(self._keys, prefix)
+        end = min(len(self._keys), i + limit)
+        while i < end and self._keys[i].startswith(prefix):
+            id_, kind = divmod(self._ids[i], 2)
+            yield self._keys[i], id_, kind
+            i += 1
+
+    def _fuzzy(self, text, threshold):
+        """Returns {id: similarity} for jobs sharing trigrams with text
+
+        Similarity is the Jaccard index of the job's trigrams and the
+        query's. Candidates are the CANDIDATES jobs sharing most of the
+        query's rarer trigrams; the COMMON ones are only looked up for
+        those, so a query of nothing but common trigrams finds nothing.
+        """
+        query = trigrams(text)
+        postings = [self._trigrams[trigram] for trigram in query
+                    if trigram in self._trigrams]
+        common = [ids for ids in postings if len(ids) > COMMON]
+        shared = defaultdict(int)
+        for ids in postings:
+            if len(ids) <= COMMON:
+                for id_ in ids:
+                    shared[id_] += 1
+        candidates = shared.items()
+        if len(candidates) > CANDIDATES:
+            candidates = heapq.nlargest(CANDIDATES, candidates,
+                                        key=lambda item: item[1])
+        scores = {}
+        for id_, count in candidates:
+            for ids in common:
+                i = bisect.bisect_left(ids, id_)
+                if i < len(ids) and ids[i] == id_:
+                    count += 1
+            score = float(count) / (len(query) + self._jobs[id_][2] - count)
+            if score >= threshold:
+                scores[id_] = score
+        return scores
+
+    def search(self, session, text, limit=10, threshold=0.2):
+        """Returns up to limit Candidates for text, best first
+
+        Exact abbreviations come first, then abbreviation prefixes, then
+        name prefixes (from any word). Only if nothing matches by prefix
+        are fuzzy matches looked for.
+        """
+        if self._jobs is None:
+            self.load(session)
+        prefix = _key(text)
+        if not prefix:
+            return []
+        scores = {}
+        for key, id_, kind in self._prefixed(prefix, limit * 4):
+            if kind == 0:
+                score = EXACT if key == prefix else \
+                    ABBR_PREFIX + float(len(prefix)) / len(key)
+            else:
+                score = NAME_PREFIX + float(len(prefix)) / len(key)
+            scores[id_] = max(score, scores.get(id_, score))
+        if not scores:
+            scores = self._fuzzy(text, threshold)
+        best = sorted(scores.items(),
+                      key=lambda item: (-item[1], self._jobs[item[0]][0]))
+        return [Candidate(id_, self._jobs[id_][0], self._jobs[id_][1], score)
+                for id_, score in best[:limit]]
+
+
+INDEX = JobIndex()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    """Records (id, abbr, name) for jobs added or changed, (id,) removed"""
+    changes = session.info.setdefault(_CHANGES, [])
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Job):
+            changes.append((obj.id, obj.abbr, obj.name))
+    for obj in session.deleted:
+        if isinstance(obj, Job):
+            changes.append((obj.id,))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop(_CHANGES, ())
+    for change in changes:
+        for index in list(_indexes):
+            if len(change) == 1:
+                index.remove(*change)
+            else:
+                index.add(*change)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    session.info.pop(_CHANGES, None)
@@ -0,0 +1,204 @@
+"""Registry of open shifts: who is on the clock right now, and on what
+
+An open shift is a Clocktime with no time_out. ShiftRegistry reads all of
+them once, through the partial index on open shifts, and from then on
+keeps its copy in step with every commit made in this process via the
+session events below. current() is then a dict lookup and on_the_clock()
+touches only the open shifts, however much history there is.
+
+Commits made by other processes (terminals, the punch daemon, csvio,
+sync) are caught by reading the change sequence number (see
+models.changes) once per transaction: if anyone but this process moved
+it since the registry last looked, the open shifts are read again.
+
+    registry = ShiftRegistry()
+    registry.current(session, 12)  # the sequence number, then the shifts
+    registry.on_the_clock(session)  # none, in the same transaction
+"""
+
+import datetime
+import logging
+import weakref
+from collections import namedtuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import Clocktime, changes as sequences
+
+# session.info keys for the shift changes flushed in this transaction,
+# and the first and last change sequence numbers its flushes took
+_CHANGES = 'shift_changes'
+_SEQUENCES = 'shift_sequences'
+
+# open shifts older than this are assumed abandoned by a crashed client
+MAX_SHIFT = datetime.timedelta(hours=16)
+
+
+class OpenShift(namedtuple('OpenShift', ['clocktime_id', 'employee_id',
+                                         'job_id', 'time_in'])):
+    __slots__ = ()
+
+
+# every live ShiftRegistry, so commits can update all of them
+_registries = weakref.WeakSet()
+
+
+class ShiftRegistry(object):
+    """In-memory OpenShifts by employee, loaded on first use"""
+
+    def __init__(self):
+        self._shifts = None  # employee_id -> OpenShift
+        self._employees = {}  # clocktime_id -> employee_id
+        self.duplicates = []  # older extra open shifts, see stale()
+        self._version = None  # the change sequence number loaded at
+        self._checked = None  # weakref to the transaction that checked it
+        _registries.add(self)
+
+    def load(self, session):
+        """(Re)reads every open shift with one query
+
+        If an employee has more than one, the latest is their current
+        shift and the others are kept in duplicates.
+        """
+        clocktimes = Clocktime.__table__
+        self._version = sequences.current_sequence(session.connection())
+        self._checked = weakref.ref(session.transaction)
+        rows = session.execute(
+            select([clocktimes.c.id, clocktimes.c.employee_id,
+                    clocktimes.c.job_id, clocktimes.c.time_in])
+            .where(clocktimes.c.time_out == None)
+            .order_by(clocktimes.c.time_in, clocktimes.c.id))
+        self._shifts, self._employees, self.duplicates = {}, {}, []
+        for row in rows:
+            self._open(OpenShift(*row))
+
+    def invalidate(self):
+        """Forgets everything, so the next lookup loads afresh"""
+        self._shifts, self._employees, self.duplicates = None, {}, []
+        self._version = self._checked = None
+
+    def _loaded(self, session):
+        """The shifts, reloaded first if another process has committed"""
+        if self._shifts is not None and self._checked is not None and \
+                self._checked() is session.transaction:
+            return self._shifts
+        if self._shifts is None or self._version != \
+                sequences.current_sequence(session.connection()):
+            self.load(session)
+        else:
+            self._checked = weakref.ref(session.transaction)
+        return self._shifts
+
+    def _open(self, shift):
+        self._close(shift.clocktime_id)
+        previous = self._shifts.get(shift.employee_id)
+        if previous is not None:
+            if previous.time_in > shift.time_in:
+                previous, shift = shift, previous
+            self.duplicates.append(previous)
+            del self._employees[previous.clocktime_id]
+        self._shifts[shift.employee_id] = shift
+        self._employees[shift.clocktime_id] = shift.employee_id
+
+    def _close(self, clocktime_id):
+        employee_id = self._employees.pop(clocktime_id, None)
+        if employee_id is not None:
+            del self._shifts[employee_id]
+        self.duplicates = [shift for shift in self.duplicates
+                           if shift.clocktime_id != clocktime_id]
+
+    def _apply(self, changes, first=None, last=None):
+        """Applies a commit's changes, which took numbers first to last
+
+        If this registry was current up to just before them, it's
+        current after them too; otherwise its next check reloads.
+        """
+        if self._shifts is None:
+            return
+        for shift, clocktime_id in changes:
+            if shift is None:
+                self._close(clocktime_id)
+            else:
+                self._open(shift)
+        if first is not None and self._version == first - 1:
+            self._version = last
+
+    def __len__(self):
+        return len(self._shifts or ())
+
+    def current(self, session, employee_id):
+        """Returns employee_id's OpenShift, or None if not clocked in"""
+        return self._loaded(session).get(employee_id)
+
+    def on_the_clock(self, session):
+        """Returns everyone's current OpenShift, earliest first"""
+        return sorted(self._loaded(session).values(),
+                      key=lambda shift: (shift.time_in, shift.clocktime_id))
+
+    def stale(self, session, max_shift=MAX_SHIFT, now=None):
+        """Returns the OpenShifts that can't still be in progress
+
+        That's any open longer than max_shift, plus any an employee left
+        open before clocking in again.
+        """
+        now = now or datetime.datetime.now()
+        shifts = self._loaded(session)
+        return sorted(self.duplicates +
+                      [shift for shift in shifts.values()
+                       if now - shift.time_in > max_shift],
+                      key=lambda shift: (shift.time_in, shift.clocktime_id))
+
+    def close_stale(self, session, max_shift=MAX_SHIFT, now=None):
+        """Closes every stale() shift in session and returns them
+
+        Their real end is unknown, so each is closed at its own time_in,
+        crediting no time until someone edits it. Nothing is committed.
+        """
+        closed = self.stale(session, max_shift, now)
+        for shift in closed:
+            clocktime = session.query(Clocktime).get(shift.clocktime_id)
+            clocktime.time_out = clocktime.time_in
+            logging.warning("Closed stale shift ID# {} (employee ID# {}, "
+                            "in at {})".format(shift.clocktime_id,
+                                               shift.employee_id,
+                                               shift.time_in))
+        return closed
+
+
+REGISTRY = ShiftRegistry()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    """Records (OpenShift, None) for shifts opened, (None, id) for closed"""
+    changes = session.info.setdefault(_CHANGES, [])
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Clocktime):
+            if obj.time_out is None:
+                changes.append((OpenShift(obj.id, obj.employee_id,
+                                          obj.job_id, obj.time_in), None))
+            else:
+                changes.append((None, obj.id))
+    for obj in session.deleted:
+        if isinstance(obj, Clocktime):
+            changes.append((None, obj.id))
+    seq = sequences.stamped(session)
+    if seq is not None:
+        first, _ = session.info.get(_SEQUENCES, (seq, seq))
+        session.info[_SEQUENCES] = (first, seq)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop(_CHANGES, ())
+    first, last = session.info.pop(_SEQUENCES, (None, None))
+    if changes or first is not None:
+        for registry in list(_registries):
+            registry._apply(changes, first, last)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    session.info.pop(_CHANGES, None)
+    session.info.pop(_SEQUENCES, None)
@@ -0,0 +1,129 @@
+"""Payroll and billing totals computed in a single grouped SQL query
+
+Each shift is rounded to the nearest tenth of an hour and priced at its
+job's rate (cents/hr) inside SQLite, then summed per employee, job and
+pay period, so no Clocktime objects are ever loaded. The arithmetic is
+the same as rounding.round_to_nearest and rounding.pay_cents.
+"""
+
+from collections import namedtuple, defaultdict
+
+from sqlalchemy import Date, Integer, and_, cast, func, or_, select, \
+    type_coerce
+
+import archive
+from models import Job, seconds_between
+
+PayrollLine = namedtuple('PayrollLine', ['period', 'employee_id', 'job_id',
+                                         'shifts', 'seconds', 'tenths',
+                                         'cents'])
+BillingLine = namedtuple('BillingLine', ['period', 'job_id', 'shifts',
+                                         'seconds', 'tenths', 'cents'])
+Overtime = namedtuple('Overtime', ['period', 'employee_id', 'tenths',
+                                   'overtime_tenths', 'premium_cents'])
+
+
+def _period(period, time_in):
+    """SQL expression for the first day of the pay period time_in is in"""
+    if period == 'day':
+        start = func.date(time_in)
+    elif period == 'week':  # Monday to Sunday
+        start = func.date(time_in, '-6 days', 'weekday 1')
+    elif period == 'month':
+        start = func.strftime('%Y-%m-01', time_in)
+    else:
+        raise ValueError("Unknown pay period {!r}".format(period))
+    return type_coerce(start, Date)
+
+
+def _aggregate(connection, keys, period, start, end, employee_id, job_id,
+               employee_range=None):
+    clocktimes = archive.clocktimes(connection, start, end)
+    jobs = Job.__table__
+    seconds = seconds_between(clocktimes.c.time_in, clocktimes.c.time_out)
+    # (seconds + 180) / 360 is round_to_nearest(seconds, 360) // 360 for
+    # the non-negative durations of closed shifts
+    tenths = cast((seconds + 180) / 360, Integer)
+    cents = (tenths * jobs.c.rate + 5) / 10
+    columns = {'period': None if period is None else
+               _period(period, clocktimes.c.time_in).label('period'),
+               'employee_id': clocktimes.c.employee_id,
+               'job_id': clocktimes.c.job_id}
+    group = [columns[key] for key in keys if columns[key] is not None]
+    conditions = [clocktimes.c.time_out != None]
+    if start is not None:
+        conditions.append(clocktimes.c.time_in >= start)
+    if end is not None:
+        conditions.append(clocktimes.c.time_in < end)
+    if employee_id is not None:
+        conditions.append(clocktimes.c.employee_id == employee_id)
+    if employee_range is not None:
+        first, last = employee_range
+        if first is None:
+            # the range NULL employee ids sort into
+            nulls = clocktimes.c.employee_id == None
+            conditions.append(nulls if last is None else
+                              or_(nulls, clocktimes.c.employee_id <= last))
+        else:
+            conditions.append(clocktimes.c.employee_id.between(first, last))
+    if job_id is not None:
+        conditions.append(clocktimes.c.job_id == job_id)
+    query = select(group + [func.count(clocktimes.c.id),
+                            func.sum(seconds),
+                            func.sum(tenths),
+                            func.sum(cents)])\
+        .select_from(clocktimes.join(jobs, clocktimes.c.job_id == jobs.c.id))\
+        .where(and_(*conditions))\
+        .group_by(*group)\
+        .order_by(*group)
+    for row in connection.execute(query):
+        row = list(row)
+        if period is None:
+            row.insert(0, None)
+        yield row
+
+
+def payroll(connection, start=None, end=None, period='week',
+            employee_id=None, job_id=None, employee_range=None):
+    """Returns PayrollLines per pay period, employee and job
+
+    period is 'day', 'week', 'month' or None for the whole range; start
+    and end bound time_in, and employee_range is a (first, last) pair of
+    employee ids, where a first of None takes in NULL ids too. Open
+    shifts aren't counted; archived ones are.
+    """
+    return [PayrollLine(*row) for row in
+            _aggregate(connection, ('period', 'employee_id', 'job_id'),
+                       period, start, end, employee_id, job_id,
+                       employee_range)]
+
+
+def billing(connection, start=None, end=None, period='month', job_id=None):
+    """Returns BillingLines -- what each job owes -- per pay period"""
+    return [BillingLine(*row) for row in
+            _aggregate(connection, ('period', 'job_id'),
+                       period, start, end, None, job_id)]
+
+
+def overtime(lines, threshold_hours=40, multiplier=1.5):
+    """Returns Overtime per period and employee from PayrollLines
+
+    Hours over threshold_hours in a period earn the extra
+    (multiplier - 1) times the employee's regular rate for that period,
+    which is their straight-time pay divided by their hours.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for line in lines:
+        total = totals[(line.period, line.employee_id)]
+        total[0] += line.tenths
+        total[1] += line.cents
+    result = []
+    for (period, employee_id), (tenths, cents) in sorted(totals.items()):
+        overtime_tenths = max(0, tenths - threshold_hours * 10)
+        premium = 0
+        if overtime_tenths:
+            premium = int(round(
+                cents * overtime_tenths * (multiplier - 1) / tenths))
+        result.append(Overtime(period, employee_id, tenths,
+                               overtime_tenths, premium))
+    return result
@@ -0,0 +1,347 @@
+"""Timeclock daemon: one process owns the database and group-commits punches
+
+Clients send one JSON object per line over a Unix domain socket:
+
+    {"op": "clock-in", "employee_id": 12, "job": "PYTIME",
+     "at": "2014-09-01 08:00:00.000000"}
+    {"op": "clock-out", "employee_id": 12}
+    {"op": "break", "employee_id": 12}
+
+and get one JSON reply line back, {"ok": true, ...} or {"ok": false,
+"error": "..."}, once the punch is committed. Punches arriving within a
+few milliseconds of each other are applied and committed together in a
+single transaction, so a burst of clients at shift change costs one
+fsync per batch instead of one per punch.
+
+The request/reply helpers at the top don't import SQLAlchemy, so tc.py
+can act as a thin client without paying for it.
+
+usage: python punchd.py [--socket PATH] [--db PATH] [--window SECONDS]
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import Queue
+import socket
+import SocketServer
+import sys
+import threading
+import time
+
+import database
+
+SOCKET_PATH = "timeclock.sock"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+OPS = ('clock-in', 'clock-out', 'break')
+
+
+class PunchError(Exception):
+    """A punch that can't be applied, e.g. clocking out when not clocked in"""
+
+
+class DaemonUnavailable(Exception):
+    """No daemon is listening on the socket"""
+
+
+def format_time(when):
+    return when.strftime(TIME_FORMAT)
+
+
+def parse_time(text):
+    return datetime.datetime.strptime(text, TIME_FORMAT)
+
+
+def punch_request(op, employee_id, job=None, at=None):
+    """Builds the JSON-ready request for a punch; at defaults to now"""
+    return {'op': op, 'employee_id': employee_id, 'job': job,
+            'at': format_time(at or datetime.datetime.now())}
+
+
+class Client(object):
+    """A connection to the daemon that can send any number of requests"""
+
+    def __init__(self, path=SOCKET_PATH):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.connect(path)
+        except socket.error as e:
+            self.socket.close()
+            raise DaemonUnavailable("{}: {}".format(path, e))
+        self.reader = self.socket.makefile('rb')
+
+    def request(self, request):
+        """Sends request and returns the daemon's reply"""
+        self.socket.sendall(json.dumps(request) + "\n")
+        line = self.reader.readline()
+        if not line:
+            raise DaemonUnavailable("The daemon closed the connection")
+        return json.loads(line)
+
+    def close(self):
+        self.reader.close()
+        self.socket.close()
+
+
+def send(request, path=SOCKET_PATH):
+    """Sends one request to the daemon and returns its reply
+
+    Raises DaemonUnavailable if there's no daemon at path.
+    """
+    if not os.path.exists(path):
+        raise DaemonUnavailable("{} doesn't exist".format(path))
+    client = Client(path)
+    try:
+        return client.request(request)
+    finally:
+        client.close()
+
+
+def apply_punch(session, request):
+    """Applies one punch request in session and returns its reply
+
+    Everything is checked before anything changes, so a PunchError leaves
+    the session as it was. The reply is built after a flush, while the
+    new rows' ids are known, but nothing is committed here.
+    """
+    from models import Clocktime, cache, queries
+    op = request.get('op')
+    if op not in OPS:
+        raise PunchError("Unknown operation {!r}".format(op))
+    try:
+        employee_id = int(request.get('employee_id'))
+        when = parse_time(request.get('at'))
+    except (TypeError, ValueError) as e:
+        raise PunchError("Bad request: {}".format(e))
+    current = queries.open_clocktime(session, employee_id)
+    if op == 'clock-in':
+        job = cache.CACHE.job_by_abbr(session, request.get('job'))
+        if job is None:
+            raise PunchError("No job with abbreviation {}".format(
+                request.get('job')))
+        if cache.CACHE.employee(session, employee_id) is None:
+            raise PunchError("No employee with ID# {}".format(employee_id))
+        if current is not None:
+            raise PunchError("Employee ID# {} is already clocked in "
+                             "(clocktime ID# {})".format(employee_id,
+                                                         current.id))
+        check_shift(session, employee_id, when)
+        current = Clocktime(employee_id=employee_id, job_id=job.id,
+                            time_in=when)
+        session.add(current)
+        session.flush()
+        return {'ok': True, 'clocktime_id': current.id, 'job': job.abbr,
+                'time': format_time(when)}
+    if current is None:
+        raise PunchError("Employee ID# {} is not clocked in".format(
+            employee_id))
+    check_shift(session, employee_id, current.time_in, when, current.id)
+    current.time_out = when
+    session.flush()
+    job = cache.CACHE.job(session, current.job_id)
+    logging.info("Stopped {} for {} at {}".format(
+        job.abbr, "break" if op == 'break' else "home", when))
+    return {'ok': True, 'clocktime_id': current.id, 'job': job.abbr,
+            'time': format_time(when), 'seconds': current.seconds_worked}
+
+
+def check_shift(session, employee_id, time_in, time_out=None,
+                clocktime_id=None):
+    """Raises PunchError if the shift would be empty or overlap another"""
+    import audit
+    for issue in audit.check_interval(session.connection(), employee_id,
+                                      time_in, time_out, clocktime_id):
+        if issue.kind == 'duration':
+            raise PunchError("Can't clock out at {} before clocking in at "
+                             "{}".format(time_out, time_in))
+        raise PunchError("That shift would overlap clocktime ID# {} from "
+                         "{} to {}".format(issue.other_id, issue.start,
+                                           issue.end or "now"))
+
+
+def commit_punch(session, request):
+    """Applies and commits one punch directly, without the daemon"""
+    try:
+        return database.transaction(
+            session, lambda session: apply_punch(session, request))
+    except PunchError as e:
+        return {'ok': False, 'error': str(e)}
+
+
+class Punch(object):
+    """A request waiting in GroupCommitter's queue for its reply"""
+
+    __slots__ = ('request', 'reply', 'done')
+
+    def __init__(self, request):
+        self.request = request
+        self.reply = None
+        self.done = threading.Event()
+
+
+class GroupCommitter(threading.Thread):
+    """Applies queued punches in batches, one transaction per batch
+
+    A batch is everything queued while the last one was committing, plus
+    whatever arrives within window seconds of its first punch, up to
+    max_batch punches. Each punch's reply is released only after its
+    batch has committed.
+    """
+
+    def __init__(self, session, window=0.005, max_batch=256):
+        threading.Thread.__init__(self, name="GroupCommitter")
+        self.daemon = True
+        self.session = session
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = Queue.Queue()
+        self.punches = 0
+        self.batches = 0
+
+    def submit(self, request):
+        """Queues request and blocks until its batch is committed"""
+        punch = Punch(request)
+        self.queue.put(punch)
+        punch.done.wait()
+        return punch.reply
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def stats(self):
+        return {'punches': self.punches, 'batches': self.batches}
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.time() + self.window
+        while batch[-1] is not None and len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except Queue.Empty:
+                pass
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except Queue.Empty:
+                break
+        return batch
+
+    def _commit(self, batch):
+        def work(session):
+            replies = []
+            for punch in batch:
+                try:
+                    replies.append(apply_punch(session, punch.request))
+                except PunchError as e:
+                    replies.append({'ok': False, 'error': str(e)})
+            return replies
+        try:
+            replies = database.transaction(self.session, work)
+        except Exception as e:
+            logging.exception("Couldn't commit {} punches".format(
+                len(batch)))
+            replies = [{'ok': False, 'error': "Commit failed: {}".format(e)}
+                       for _ in batch]
+        self.punches += len(batch)
+        self.batches += 1
+        for punch, reply in zip(batch, replies):
+            punch.reply = reply
+            punch.done.set()
+
+    def run(self):
+        running = True
+        while running:
+            batch = self._next_batch()
+            if batch[-1] is None:
+                batch.pop()
+                running = False
+            if batch:
+                self._commit(batch)
+
+
+class PunchHandler(SocketServer.StreamRequestHandler):
+    """Serves one client connection, one request line at a time"""
+
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                reply = {'ok': False, 'error': "Bad request: {}".format(e)}
+            else:
+                if request.get('op') == 'stats':
+                    reply = dict(self.server.committer.stats(), ok=True)
+                else:
+                    reply = self.server.committer.submit(request)
+            self.wfile.write(json.dumps(reply) + "\n")
+            self.wfile.flush()
+
+
+class PunchServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, committer):
+        SocketServer.UnixStreamServer.__init__(self, path, PunchHandler)
+        self.committer = committer
+
+
+def make_server(path=SOCKET_PATH, session=None, window=0.005,
+                max_batch=256):
+    """Returns a PunchServer on path with its GroupCommitter started
+
+    session defaults to a new one from database.get_sessionmaker().
+    A stale socket file left at path is removed first.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    session = session or database.get_sessionmaker()()
+    committer = GroupCommitter(session, window, max_batch)
+    committer.start()
+    return PunchServer(path, committer)
+
+
+def shutdown(server):
+    """Stops server, commits whatever is queued and removes the socket"""
+    server.shutdown()
+    server.server_close()
+    server.committer.stop()
+    if os.path.exists(server.server_address):
+        os.remove(server.server_address)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PYPER timeclock daemon")
+    parser.add_argument('--socket', default=SOCKET_PATH)
+    parser.add_argument('--db', default=database.DB_NAME)
+    parser.add_argument('--window', type=float, default=0.005,
+                        help="seconds to wait for more punches per batch")
+    parser.add_argument('--max-batch', type=int, default=256)
+    args = parser.parse_args(argv)
+    # acknowledged means on disk, so fsync every (group) commit
+    database.configure(args.db, synchronous='full')
+    server = make_server(args.socket, window=args.window,
+                         max_batch=args.max_batch)
+    logging.info("Listening on {}".format(args.socket))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown(server)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
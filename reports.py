@@ -0,0 +1,134 @@
+"""Per-employee payroll reports, optionally split across processes
+
+employee_report() totals shifts, hours (rounded per shift to tenths)
+and pay per employee, pay period and job, as payroll.payroll() does,
+and writes them out as CSV ordered by employee. For year-end and
+quarterly runs over millions of clocktimes, processes > 1 splits the
+employees into contiguous id ranges and aggregates each range in a
+worker process with its own read-only connection to the database file;
+the workers send back plain tuples, which are concatenated in range
+order. The arithmetic is all integer and done by SQLite either way, so
+the output is byte for byte the same as with processes=1:
+
+    with open("2014.csv", 'wb') as f:
+        employee_report("timesheet.db", f, start, end, processes=4)
+"""
+
+import csv
+import multiprocessing
+
+from sqlalchemy import and_, select
+
+import archive
+import database
+import payroll
+from models import Employee, Job
+
+FIELDS = ['employee_id', 'employee', 'period', 'job', 'shifts', 'hours',
+          'pay']
+
+# the worker's read-only engine, set up by _init_worker
+_engine = None
+
+
+def employee_ranges(connection, parts, start=None, end=None):
+    """Splits employee ids into at most parts (first, last) ranges
+
+    The ids are those of the clocktimes with start <= time_in < end,
+    employees or not, and each range holds about the same number. A
+    NULL employee_id sorts first, so it starts the first range; payroll
+    counts a range whose first id is None as including NULL ids.
+    """
+    clocktimes = archive.clocktimes(connection, start, end)
+    conditions = [clocktimes.c.time_out != None]
+    if start is not None:
+        conditions.append(clocktimes.c.time_in >= start)
+    if end is not None:
+        conditions.append(clocktimes.c.time_in < end)
+    ids = [id_ for (id_,) in connection.execute(
+        select([clocktimes.c.employee_id]).where(and_(*conditions))
+        .distinct().order_by(clocktimes.c.employee_id))]
+    if not ids:
+        return []
+    size = -(-len(ids) // parts)  # rounded up
+    return [(ids[i], ids[min(i + size, len(ids)) - 1])
+            for i in range(0, len(ids), size)]
+
+
+def aggregate(connection, start, end, period, employee_range):
+    """Returns payroll tuples for employee_range, ordered by employee"""
+    lines = payroll.payroll(connection, start, end, period,
+                            employee_range=employee_range)
+    return sorted((line.employee_id, line.period, line.job_id, line.shifts,
+                   line.seconds, line.tenths, line.cents) for line in lines)
+
+
+def _init_worker(path):
+    global _engine
+    _engine = database.make_engine(path, journal_mode=None, read_only=True,
+                                   pool_size=1)
+
+
+def _aggregate_range(args):
+    start, end, period, employee_range = args
+    with _engine.connect() as connection:
+        return aggregate(connection, start, end, period, employee_range)
+
+
+def _format_cents(cents):
+    return "{}.{:02d}".format(*divmod(cents, 100))
+
+
+def write_report(fileobj, rows, employees, jobs):
+    """Writes aggregate() rows to fileobj as CSV, returning the row count
+
+    employees and jobs map ids to names and abbreviations.
+    """
+    writer = csv.writer(fileobj)
+    writer.writerow(FIELDS)
+    count = 0
+    for employee_id, period, job_id, shifts, seconds, tenths, cents in rows:
+        writer.writerow([employee_id, employees.get(employee_id, u"")
+                         .encode('utf-8'),
+                         period, jobs.get(job_id, u"").encode('utf-8'),
+                         shifts, "{}.{}".format(*divmod(tenths, 10)),
+                         _format_cents(cents)])
+        count += 1
+    return count
+
+
+def employee_report(path, fileobj, start=None, end=None, period='month',
+                    processes=1, chunks=None):
+    """Writes the per-employee report for the database at path to fileobj
+
+    With processes > 1, the employees are split into chunks id ranges
+    (default four per process) aggregated by a pool of that many worker
+    processes. Returns the number of rows written.
+    """
+    engine = database.make_engine(path, journal_mode=None, read_only=True,
+                                  pool_size=1)
+    with engine.connect() as connection:
+        employees = Employee.__table__
+        jobs = Job.__table__
+        names = dict(connection.execute(
+            select([employees.c.id, employees.c.firstname + " " +
+                    employees.c.lastname])).fetchall())
+        abbrs = dict(connection.execute(
+            select([jobs.c.id, jobs.c.abbr])).fetchall())
+        if processes <= 1:
+            rows = aggregate(connection, start, end, period, None)
+        else:
+            ranges = employee_ranges(connection, chunks or processes * 4,
+                                     start, end)
+    engine.dispose()
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, _init_worker, (path,))
+        try:
+            rows = [row for part in pool.imap(
+                _aggregate_range,
+                [(start, end, period, employee_range)
+                 for employee_range in ranges]) for row in part]
+        finally:
+            pool.close()
+            pool.join()
+    return write_report(fileobj, rows, names, abbrs)
@@ -0,0 +1,35 @@
+"""Company rounding of time worked, and the pay it earns
+
+Shifts are rounded to the nearest tenth of an hour (six minutes) before
+they're reported or paid. batch and payroll do the same arithmetic over
+whole columns and must match these exactly.
+"""
+
+
+def round_to_nearest(num, b):
+    """Rounds num to the nearest base
+
+    round_to_nearest(7, 5) -> 5
+    """
+
+    company_minutes = num + (b // 2)
+    return company_minutes - (company_minutes % b)
+
+
+def hours_worked(seconds):
+    """Converts seconds to hours, rounded to the nearest tenth
+
+    hours_worked(5570) -> 1.5
+    """
+    return float(round_to_nearest(seconds, 360)) / 3600
+
+
+def pay_cents(seconds, rate):
+    """Pay in cents for seconds worked at rate cents/hr
+
+    The time is rounded to the nearest tenth of an hour first, and the
+    pay to the nearest cent.
+    pay_cents(5570, 2000) -> 3000
+    """
+    tenths = round_to_nearest(seconds, 360) // 360
+    return (tenths * rate + 5) // 10
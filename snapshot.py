@@ -0,0 +1,168 @@
+"""Columnar snapshot of closed clocktimes for numpy.memmap
+
+A snapshot is a directory with one file per column -- id, employee_id,
+job_id, time_in, time_out (epoch seconds) and rate (the job's cents/hr
+when exported) -- each a HEADER_SIZE byte header followed by the column
+as fixed-width little-endian int64s:
+
+    magic    8 bytes   "TCSNAP01"
+    dtype    8 bytes   "<i8", NUL padded
+    rows     int64     rows in the file
+    last_id  int64     highest clocktime id exported
+
+load() maps the files read-only without parsing anything, so report
+processes share one copy through the page cache, and its result can go
+straight to batch.aggregate().
+
+update() appends clocktimes exported since last_id. Rows are only
+exported in id order up to the first shift still open, since one that
+closes later couldn't be added behind rows already written; closing
+stale shifts (tc.py close-stale) keeps that from holding the snapshot
+back. Edits to rows already exported aren't seen; rebuild to pick
+those up.
+"""
+
+import os
+import struct
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import and_, func, select
+
+import archive
+from batch import epoch_seconds
+from models import Job
+
+MAGIC = b"TCSNAP01"
+DTYPE = np.dtype('<i8')
+HEADER = struct.Struct('<8s8sqq')
+HEADER_SIZE = 64
+COLUMNS = ['id', 'employee_id', 'job_id', 'time_in', 'time_out', 'rate']
+
+
+class SnapshotError(ValueError):
+    """Raised for a file that isn't a snapshot column"""
+
+
+def _path(directory, column):
+    return os.path.join(directory, column + ".col")
+
+
+def read_header(path):
+    """Returns (rows, last_id) from a column file's header"""
+    with open(path, 'rb') as f:
+        data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise SnapshotError("{}: too short for a header".format(path))
+    magic, dtype, rows, last_id = HEADER.unpack(data)
+    if magic != MAGIC or dtype.rstrip(b"\0") != DTYPE.str.encode('ascii'):
+        raise SnapshotError("{}: not a snapshot column".format(path))
+    return rows, last_id
+
+
+def _write_header(f, rows, last_id):
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, DTYPE.str.encode('ascii'), rows, last_id)
+            .ljust(HEADER_SIZE, b"\0"))
+
+
+def state(directory):
+    """Returns (rows, last_id) of the snapshot in directory
+
+    (0, 0) if there isn't one yet. A column with more rows than the
+    others was part way through an update; only the rows every column
+    has count.
+    """
+    headers = [read_header(_path(directory, column))
+               for column in COLUMNS
+               if os.path.exists(_path(directory, column))]
+    if len(headers) < len(COLUMNS):
+        return 0, 0
+    return min(headers)
+
+
+def load(directory):
+    """Maps the snapshot in directory as a dict of read-only int64 arrays
+
+    The arrays are plain ndarray views of the numpy.memmaps, which
+    arithmetic on is noticeably faster than on the memmaps themselves.
+    """
+    rows, _ = state(directory)
+    if not rows:
+        return {column: np.zeros(0, dtype=DTYPE) for column in COLUMNS}
+    return {column: np.asarray(np.memmap(_path(directory, column),
+                                         dtype=DTYPE, mode='r',
+                                         offset=HEADER_SIZE, shape=(rows,)))
+            for column in COLUMNS}
+
+
+def _query(clocktimes, last_id):
+    jobs = Job.__table__
+    still_open = select([func.min(clocktimes.c.id)])\
+        .where(clocktimes.c.time_out == None).as_scalar()
+    return select([clocktimes.c.id, clocktimes.c.employee_id,
+                   clocktimes.c.job_id,
+                   epoch_seconds(clocktimes.c.time_in),
+                   epoch_seconds(clocktimes.c.time_out),
+                   jobs.c.rate])\
+        .select_from(clocktimes.join(jobs, clocktimes.c.job_id == jobs.c.id))\
+        .where(and_(clocktimes.c.id > last_id,
+                    clocktimes.c.id < func.coalesce(still_open,
+                                                    2 ** 63 - 1)))\
+        .order_by(clocktimes.c.id)
+
+
+def update(connection, directory, batch_size=100000, rebuild=False):
+    """Appends clocktimes exported since the snapshot's last_id
+
+    Creates the snapshot if there's none (or with rebuild, replaces it).
+    Each batch's data is written and flushed before the headers are
+    updated, so readers and crashes only ever see whole rows. A new
+    snapshot is written beside the old one and renamed over it at the
+    end, so processes that have the old one mapped keep it. Returns the
+    number of rows added.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    rows, last_id = (0, 0) if rebuild else state(directory)
+    fresh = not rows
+    files = {}
+    for column in COLUMNS:
+        path = _path(directory, column)
+        if fresh:
+            files[column] = open(path + ".new", 'w+b')
+            _write_header(files[column], 0, 0)
+        else:
+            files[column] = open(path, 'r+b')
+    added = 0
+    try:
+        result = connection.execute(_query(archive.clocktimes(connection),
+                                           last_id))
+        while True:
+            batch = result.cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            table = np.fromiter(chain.from_iterable(batch), dtype=DTYPE,
+                                count=len(batch) * len(COLUMNS))\
+                .reshape(len(batch), len(COLUMNS))
+            for index, column in enumerate(COLUMNS):
+                f = files[column]
+                f.seek(HEADER_SIZE + rows * DTYPE.itemsize)
+                f.write(table[:, index].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            rows += len(batch)
+            last_id = int(table[-1, 0])
+            added += len(batch)
+            for f in files.values():
+                _write_header(f, rows, last_id)
+                f.flush()
+        result.close()
+    finally:
+        for f in files.values():
+            f.close()
+    if fresh:
+        for column in COLUMNS:
+            os.rename(_path(directory, column) + ".new",
+                      _path(directory, column))
+    return added
@@ -0,0 +1,228 @@
+"""Incremental sync of clocktimes, employees and jobs between databases
+
+sync(source, target) copies whatever changed in the source database
+since the last sync into the target: rows whose change_seq (see
+models.changes) is past the source's sequence number recorded in the
+target's sync_state table, and the rows deleted since. Finding them is
+an index range scan and applying them is a handful of executemany
+statements, so the cost follows the number of changes, not the size of
+either file. Kiosks sync to a central database (and it can sync back to
+them) without copying whole files:
+
+    sync(make_engine("kiosk-1.db"), make_engine("timesheet.db"))
+
+Rows are matched by primary key, so each site should hand out ids from
+its own range. Everything is applied in one target transaction that
+also records the new sync_state, so an interrupted sync is simply run
+again, and running it twice changes nothing. Applied rows are restamped
+with the target's own sequence number, so changes pass on from the
+target to further databases; rows the target already has as they are
+aren't written at all, so syncing back and forth settles.
+
+A conflict is an incoming row (or deletion) for a row the target has
+changed itself since its last sync from the same source. on_conflict
+says what happens: 'error' (the default) raises SyncConflict and
+applies nothing, 'source' takes the incoming row, 'target' keeps its
+own. Either way the conflicts are listed in the result.
+
+The daily rollup and duration sketches are updated with the clocktimes,
+but in-process caches (models.cache, models.search, models.shifts) only
+follow session commits, so processes using the target should be
+restarted or invalidate them. Syncing should happen before the source
+archives shifts: archived rows stay in the source's archives and
+aren't sent.
+"""
+
+import logging
+from collections import Counter, defaultdict, namedtuple
+
+from sqlalchemy import bindparam, select
+
+from models import Clocktime, Deletion, Employee, Job, SyncState, changes, \
+    durations, rollup
+
+# parents before children, so the rows a clocktime refers to come first
+TABLES = [Employee.__table__, Job.__table__, Clocktime.__table__]
+
+# ids per IN (...) list, under SQLite's 999 variable limit
+CHUNK = 500
+
+SyncResult = namedtuple('SyncResult', ['site', 'last_seq', 'upserted',
+                                       'deleted', 'conflicts'])
+
+
+class SyncConflict(Exception):
+    """Both databases changed the same row since they last synced"""
+
+    def __init__(self, conflicts):
+        Exception.__init__(self, "{} conflicting rows, first {} ID# {}"
+                           .format(len(conflicts), *conflicts[0]))
+        self.conflicts = conflicts
+
+
+def _data_columns(table):
+    return [column for column in table.columns
+            if column.name != 'change_seq']
+
+
+def changed_rows(connection, table, after, upto):
+    """Rows of table with after < change_seq <= upto, without change_seq"""
+    return connection.execute(
+        select(_data_columns(table))
+        .where(table.c.change_seq > after)
+        .where(table.c.change_seq <= upto)
+        .order_by(table.c.id)).fetchall()
+
+
+def deleted_ids(connection, table, after, upto):
+    """Ids of table's rows deleted with after < change_seq <= upto"""
+    deletions = Deletion.__table__
+    return [row_id for (row_id,) in connection.execute(
+        select([deletions.c.row_id])
+        .where(deletions.c.table_name == table.name)
+        .where(deletions.c.change_seq > after)
+        .where(deletions.c.change_seq <= upto)
+        .order_by(deletions.c.row_id))]
+
+
+def _current(connection, table, ids):
+    """{id: (data columns tuple, change_seq)} for those of ids in table"""
+    current = {}
+    for i in range(0, len(ids), CHUNK):
+        for row in connection.execute(
+                select(_data_columns(table) + [table.c.change_seq])
+                .where(table.c.id.in_(ids[i:i + CHUNK]))):
+            row = tuple(row)
+            current[row[0]] = (row[:-1], row[-1])
+    return current
+
+
+def _resolve(conflicts, local_seq, on_conflict, table, id_, current):
+    """True if a change to the target's current row should be applied"""
+    if current is None or current[1] is None or current[1] <= local_seq:
+        return True
+    conflicts.append((table.name, id_))
+    return on_conflict == 'source'
+
+
+def _clocktime_deltas(deltas, pairs, row, sign):
+    """Adds a clocktime row's rollup deltas and the sketch days it affects"""
+    _, time_in, time_out, employee_id, job_id = row
+    rollup.add_interval(deltas, time_in, time_out, employee_id, job_id, sign)
+    pairs.update(durations.touched(employee_id, time_in))
+
+
+def apply_changes(connection, table, rows, deleted, local_seq, seq,
+                  on_conflict, conflicts):
+    """Applies one table's incoming rows and deletions to the target
+
+    Returns (rows written, rows deleted). Conflicts are appended to
+    conflicts.
+    """
+    rows = [tuple(row) for row in rows]
+    # a row deleted and then added back with the same id is just a change
+    incoming_ids = set(row[0] for row in rows)
+    deleted = [id_ for id_ in deleted if id_ not in incoming_ids]
+    current = _current(connection, table, [row[0] for row in rows] + deleted)
+    columns = [column.name for column in _data_columns(table)]
+    inserts, updates, deletes = [], [], []
+    deltas = defaultdict(int)
+    pairs = set()
+    for row in rows:
+        existing = current.get(row[0])
+        if existing is not None and existing[0] == row:
+            continue
+        if not _resolve(conflicts, local_seq, on_conflict, table, row[0],
+                        existing):
+            continue
+        params = dict(zip(columns, row), change_seq=seq)
+        if existing is None:
+            inserts.append(params)
+        else:
+            params['_id'] = row[0]
+            updates.append(params)
+            if table is Clocktime.__table__:
+                _clocktime_deltas(deltas, pairs, existing[0], -1)
+        if table is Clocktime.__table__:
+            _clocktime_deltas(deltas, pairs, row, 1)
+    for id_ in deleted:
+        existing = current.get(id_)
+        if existing is None or not _resolve(conflicts, local_seq,
+                                            on_conflict, table, id_,
+                                            existing):
+            continue
+        deletes.append(id_)
+        if table is Clocktime.__table__:
+            _clocktime_deltas(deltas, pairs, existing[0], -1)
+    if deletes:
+        connection.execute(
+            table.delete().where(table.c.id == bindparam('_id')),
+            [{'_id': id_} for id_ in deletes])
+        connection.execute(
+            Deletion.__table__.insert().prefix_with('OR REPLACE'),
+            [{'table_name': table.name, 'row_id': id_, 'change_seq': seq}
+             for id_ in deletes])
+    if updates:
+        connection.execute(
+            table.update().where(table.c.id == bindparam('_id'))
+            .values({name: bindparam(name)
+                     for name in columns[1:] + ['change_seq']}),
+            updates)
+    if inserts:
+        connection.execute(table.insert(), inserts)
+    rollup.apply_deltas(connection, deltas)
+    durations.recompute(connection, pairs)
+    return len(inserts) + len(updates), len(deletes)
+
+
+def sync(source, target, on_conflict='error'):
+    """Copies the source engine's changes since the last sync to target
+
+    Returns a SyncResult: the source's site id, its sequence number
+    synced up to, Counters of rows written and deleted per table, and
+    the (table, id) conflicts found. Raises SyncConflict if there were
+    any and on_conflict is 'error', and ValueError for a database synced
+    with itself.
+    """
+    if on_conflict not in ('error', 'source', 'target'):
+        raise ValueError("Unknown on_conflict {!r}".format(on_conflict))
+    state_table = SyncState.__table__
+    with target.begin() as connection:
+        target_site = changes.site(connection)
+    with source.begin() as connection:
+        site = changes.site(connection)
+    if site == target_site:
+        raise ValueError("Can't sync a database with itself")
+    with target.connect() as connection:
+        state = connection.execute(
+            select([state_table.c.last_seq, state_table.c.local_seq])
+            .where(state_table.c.site == site)).first()
+    last_seq, local_seq = state or (0, 0)
+    with source.connect() as connection:
+        # later changes get higher numbers, and wait for the next sync
+        upto = changes.current_sequence(connection)
+        incoming = [(table, changed_rows(connection, table, last_seq, upto),
+                     deleted_ids(connection, table, last_seq, upto))
+                    for table in TABLES]
+    upserted, deleted, conflicts = Counter(), Counter(), []
+    with target.begin() as connection:
+        seq = changes.next_sequence(connection)
+        for table, rows, deleted_rows in incoming:
+            written, removed = apply_changes(connection, table, rows,
+                                             deleted_rows, local_seq, seq,
+                                             on_conflict, conflicts)
+            upserted[table.name] += written
+            deleted[table.name] += removed
+        if conflicts and on_conflict == 'error':
+            raise SyncConflict(conflicts)
+        values = {'site': site, 'last_seq': upto, 'local_seq': seq}
+        if state is None:
+            connection.execute(state_table.insert(), values)
+        else:
+            connection.execute(state_table.update()
+                               .where(state_table.c.site == site), values)
+    logging.info("Synced site {} up to {}: {} rows written, {} deleted, "
+                 "{} conflicts".format(site, upto, sum(upserted.values()),
+                                       sum(deleted.values()),
+                                       len(conflicts)))
+    return SyncResult(site, upto, upserted, deleted, conflicts)
@@ -14,32 +14,63 @@ of an hour, and to generate reports.
 # Robert Ross Wardrup, NotTheEconomist, dschetel
 # 08/31/2014
 
+import argparse
 import datetime
 import sys
 import os
 import os.path
 import logging
-import uuid
 
-from models import Job, Employee, Clocktime
+import database
+import instrumentation
+import timeparse
+from database import DB_NAME
+# pay_cents too, for the callers that still look for them here
+from rounding import hours_worked, pay_cents, round_to_nearest
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+# SQLAlchemy and the models are imported inside the functions that need
+# them, so that one-shot commands like --help start instantly.
 
+# Enable this flag (1) if debugging. Else leave at 0.
+debug = 1
 
-# TODO: Figure out what to do with jobdb. This DB kept the total daily time for each task.
+# Each unit of work -- a punch, a report, a config change -- gets its own
+# short-lived Session from this factory, so a kiosk left running for days
+# doesn't accumulate everything it ever loaded. Tests point it at their
+# own database.
+Session = database.new_session
 
-DB_NAME = "timesheet.db"
-engine = create_engine('sqlite:///{}'.format(DB_NAME))
-DBSession = sessionmaker(bind=engine)
 
-# Status variable - 0 = not in task. 1 = in task
-status = 0
+def unit_of_work():
+    """database.session_scope() over Session"""
+    return database.session_scope(Session)
 
-# Enable this flag (1) if debugging. Else leave at 0.
-debug = 1
 
-session = DBSession()
+def get_engine():
+    """The engine Session's sessions are bound to"""
+    session = Session()
+    try:
+        return session.get_bind()
+    finally:
+        session.close()
+
+
+class ClockState(object):
+    """Everything the interactive menu remembers from one action to the next
+
+    One of these is passed to every menu action in place of the old
+    module-level globals.
+    """
+
+    def __init__(self):
+        self.clocktime = None  # the open ClocktimeRecord, if clocked in
+        self.job = None  # and the JobRecord it's for
+        self.running = True  # cleared to leave the main menu
+
+    @property
+    def status(self):
+        """0 = not in task. 1 = in task"""
+        return 0 if self.clocktime is None else 1
 
 
 def query():
@@ -63,203 +94,181 @@ def query():
         sys.stdout.write("Please respond with 'yes' or 'no'")
 
 
-def project_start():
+def project_start(state):
     """
-    Prompts the user for project information, creates an id for
-    recalling data (will be used in the future) and returns
-    project name, project abbrev and id for use in other
-    functions.
+    Prompts the user for the job they're starting and their employee ID#,
+    clocks them in and returns the new ClocktimeRecord. Jobs that don't
+    exist yet are created on the fly. Someone already on the clock picks
+    their open shift back up instead.
     """
-    global p_uuid
-    global project_name
-    global clock_in
-    global status
+    import punchd
+    from models import Job, cache, records, search, shifts
 
     logging.debug("project_start called")
-    clock_in = datetime.datetime.now()
     abbrev = raw_input("What are you working on? (ABBREV): ")
-    project_name = raw_input("What is the name of this project?: ")
-    lead_name = raw_input("For whom are you working?: ")
-    p_uuid = str(uuid.uuid4())
-    logging.debug("UUID is {}".format(p_uuid))
+    with unit_of_work() as session:
+        job = cache.CACHE.job_by_abbr(session, abbrev)
+        if job is None:
+            candidates = search.INDEX.search(session, abbrev, limit=5)
+    job_id = job.id if job is not None else pick_job(candidates)
+    if job_id is None:
+        project_name = raw_input("What is the name of this project?: ")
+    employee_id = raw_input("What is your employee ID#?: ")
+    with unit_of_work() as session:
+        try:
+            employee = cache.CACHE.employee(session, int(employee_id))
+        except ValueError:
+            employee = None
+        if employee is None:
+            print("No employee with ID# {}".format(employee_id))
+            return None
+        shift = shifts.REGISTRY.current(session, employee.id)
+        if shift is not None:
+            state.clocktime = records.clocktime(session, shift.clocktime_id)
+            state.job = cache.CACHE.job(session, shift.job_id)
+            print("Already clocked in to {} since {:%I:%M %p}".format(
+                state.job.abbr, shift.time_in))
+            return state.clocktime
+        if job_id is None:
+            new_job = Job(name=project_name, abbr=abbrev, rate=0)
+            session.add(new_job)
+            session.flush()
+            job_id = new_job.id
+        job = cache.CACHE.job(session, job_id)
     logging.debug("abbrev is {}".format(abbrev))
-    logging.debug("project_name is {}".format(project_name))
+    logging.debug("project_name is {}".format(job.name))
 
+    try:
+        state.clocktime = clock_in(employee.id, job.id)
+    except punchd.PunchError as e:
+        print(e)
+        return None
+    state.job = job
     if debug == 1:
-        print "DEBUGGING: PID = {}".format(p_uuid)
-    status = 1
-    return p_uuid
+        print "DEBUGGING: Clocktime ID# = {}".format(state.clocktime.id)
+    return state.clocktime
 
 
-def round_to_nearest(num, b):
-    """Rounds num to the nearest base
+def pick_job(candidates):
+    """Offers search Candidates to choose from
 
-    round_to_nearest(7, 5) -> 5
+    Returns the chosen job's id, or None if there were none to offer or
+    none was chosen.
+    """
+    if not candidates:
+        return None
+    print("Did you mean:")
+    for number, candidate in enumerate(candidates, 1):
+        print("{}. {} ({})".format(number, candidate.abbr, candidate.name))
+    answer = raw_input("Number, or enter for none of these: ")
+    if answer.isdigit() and 1 <= int(answer) <= len(candidates):
+        return candidates[int(answer) - 1].id
+    return None
+
+
+def clock_in(employee_id, job_id, when=None):
+    """Opens and commits a new Clocktime for employee_id on job_id
+
+    Returns it as a ClocktimeRecord. Raises punchd.PunchError if the
+    shift would overlap another of the employee's, as a punch would.
     """
+    import punchd
+    from models import Clocktime, records
+    when = when or datetime.datetime.now()
+
+    def work(session):
+        punchd.check_shift(session, employee_id, when)
+        new_clocktime = Clocktime(employee_id=employee_id, job_id=job_id,
+                                  time_in=when)
+        session.add(new_clocktime)
+        session.flush()
+        return new_clocktime.id
+    with unit_of_work() as session:
+        clocktime_id = database.transaction(session, work)
+        return records.clocktime(session, clocktime_id)
+
+
+def clock_out(clocktime, when=None):
+    """Closes clocktime and commits it, along with its daily totals
+
+    clocktime is anything with the Clocktime's id. Returns the closed
+    ClocktimeRecord.
+    """
+    from models import Clocktime, records
+    when = when or datetime.datetime.now()
 
-    company_minutes = num + (b // 2)
-    return company_minutes - (company_minutes % b)
+    def work(session):
+        session.query(Clocktime).get(clocktime.id).time_out = when
+    with unit_of_work() as session:
+        database.transaction(session, work)
+        return records.clocktime(session, clocktime.id)
 
 
 # TODO: Make changes to do away with break/lunch specific code, as it essentially does the same thing.
-def break_submenu():
+def break_submenu(state):
     print "What are you doing?\n" \
           "1. Lunch\n" \
           "2. Break\n"
     answer = raw_input(">>>")
-    breaktime(answer)
-
+    breaktime(state, answer)
 
-def sel_timesheet_row():
-    """
-    Returns the current job's row, using the PID generated by project_start.
-    :return: the current job's row.
-    """
 
-    with conn:
-        lid = cur.lastrowid
-        cur.execute(
-            "SELECT UUID, Job_name, Job_abbrev, Stop_type, Stop_time, Date, "
-            "Lead_name, Start_time FROM timesheet WHERE Id = ?",
-            (lid,))
-        sel = cur.fetchall()
-        return sel
+def clock_out_menu(state):
+    breaktime(state, "home")
 
 
-def breaktime(answer):
-    """Prompts user to specify reason for break.
+def breaktime(state, answer):
+    """Stops the current task for lunch, a break, or the end of the day
 
-    :param answer: takes user input from timer function
+    :param answer: takes user input from break_submenu
 
-    No real reason for this other than just general bookkeeping.
-    Not a requirement. Would be nice to be able to pause the timer for breaks,
-    rather than having to start the script all over again.
+    The current Clocktime is closed (which updates the daily totals), and
+    after a lunch or break the user can resume the same job, which opens
+    a new one.
     """
-    global job_name
-    global job_abbrev
-    global lead_name
-    global stop_type
-    global start_time
-    global diff
-    global status
-
-    sel = sel_timesheet_row()
-    if debug == 1:
-        print("\nDEBUGGING MODE\n")
-        print("Timesheet Rows:")
-        print(sel)
-
-    for row in sel:
-        job_name = row[1]
-        job_abbrev = row[2]
-        stop_type = row[3]
-        lead_name = row[6]
-        start_time = row[7]
-
-    # TODO: Upon entering, check if project has been set up (see if sql entry is in memory?), otherwise
-    # an error is raised because some values are undefined.
-
+    import punchd
     logging.debug("Called choices with answer: {}".format(answer))
     if answer.lower() in {'1', '1.', 'lunch'}:
-        if status == 1:
-            now = update_now()
-            # Sel gets the last row printed, which should be the current job.
-            sel = sel_timesheet_row()
-            for row in sel:
-                print "Stopping {0}, ABBREV {1} for "\
-                      "lunch at {2} on {3}".format(
-                          row[1], row[2], row[4], row[5])
-                job_name = row[1]
-                job_abbrev = row[2]
-                stop_type = row[3]
-                lead_name = row[6]
-                start_time = row[7]
-            for row in sel:
-                print "Stopping {0}, ABBREV {1} for lunch at {2}".format(
-                    row[1], row[2], now)
-
-                # TODO: Check if the current job's PID matches all entries for same abbrev on same date.
-                # This should keep everything in order as far as time calculations.
-                # It should be as simple as subtracting break time from total logged hours for each PID.
-            stop_type = "lunch"
-            with conn:
-                cur.execute(
-                    "INSERT INTO timesheet("
-                    "UUID, Job_name, Job_abbrev, Stop_type, Stop_time)"
-                    "VALUES(?, ?, ?, ?, ?)",
-                    [p_uuid, job_name, job_abbrev, stop_type, now])
-
-            # Get time passed since beginning of task.
-            # TODO: Check hours calculation!!!
-            curr_time = datetime.datetime.now().strftime('%I:%M %p')
-            # diff is returning incorrect time
-            diff = datetime.datetime.strptime( curr_time, '%I:%M %p') -\
-                datetime.datetime.strptime(start_time, '%I:%M %p')
-            time = float(round_to_nearest(diff.seconds, 360)) / 3600
-            if debug == 1:
-                print("Variables -- Start Time {0}. Current Time: {1}. Diff: {2}. Time: {3}")\
-                    .format(start_time, curr_time, diff, time)
-            with jobdb:
-                if debug == 1:
-                    print("Connected to DB: jobdb.\n")
-                cur.execute(
-                    "INSERT INTO jobdb(UUID, Lead_name, Job_name, Job_abbrev, Time_worked, "
-                    "Date) VALUES(?, ?, ?, ?, ?, ?)", [p_uuid, lead_name, job_name, job_abbrev, time, date]
-                )
-
-            print ("Enjoy! You worked {0} hours on {1}.").format(time, job_name)
-            logging.info("Lunch break at {}".format(datetime.datetime.now()))
-            status = 0
-            raw_input("Press Enter to begin working again")
-            print("Are you still working on '{}' ? (y/n)").format(job_name)
-            answer = query()
-            if answer:
-                now = datetime.datetime.now().strftime('%I:%M %p')
-                print "Resuming '{0}' at: '{1}\n' ".format(job_name, now)
-                status = 1
-                cur.execute(
-                    "INSERT INTO timesheet(UUID, Job_name, Job_abbrev, Stop_type, Start_time) VALUES(?, ?, ?, ?, ?)",
-                    [p_uuid, job_name, job_abbrev, stop_type, now])
-                main_menu()
-            else:
-                status = 0
-                main_menu()
-            logging.info("Back from lunch at {}".format(now))
-        else:
-            raw_input("\nYou're not currently in job. Press enter to return to main menu.")
-            main_menu()
+        stop_type = "lunch"
     elif answer.lower() in {'2', '2.', 'break'}:
-        if status == 1:
-            now = update_now()
-            status = 0
-            logging.info("Taking a break at {}".format(now))
-            raw_input("Press Enter to begin working again")
-            print ("Are you still working on {}? (y/n)").format(job_name)
-            answer = query()
-            if answer:
-                cur.execute(
-                    "INSERT INTO timesheet(UUID, Job_name, Job_abbrev, Stop_type, Start_time) VALUES(?, ?, ?, ?, ?)",
-                    [p_uuid, job_name, job_abbrev, stop_type, now])
-                print "Resuming '{0}' at: '{1}' ".format(job_name, now)
-                logging.info("Back from break at {}".format(now))
-                status = 1
-                main_menu()
-            else:
-                status = 0
-                main_menu()
-        else:
-            raw_input("\nYou're not currently in job. Press enter to return to main menu.")
-            main_menu()
+        stop_type = "break"
     elif answer.lower() in {'3', '3.', 'heading home', 'home'}:
-        if status == 1:
-            print 'Take care!'
-            status = 0
-            now = update_now()
-            logging.info("Clocked out at {}".format(now))
-            return "end of day"
-        else:
-            raw_input("\nYou're not currently in job. Press enter to return to main menu.")
-            main_menu()
+        stop_type = "home"
+    else:
+        return None
+    if state.status != 1:
+        raw_input("\nYou're not currently in job. "
+                  "Press enter to return to main menu.")
+        return None
+
+    job = state.job
+    clocktime = clock_out(state.clocktime)
+    state.clocktime = state.job = None
+    if debug == 1:
+        print("\nDEBUGGING MODE\n")
+        print(clocktime)
+    logging.info("Stopped {} for {} at {}".format(job.abbr, stop_type,
+                                                  clocktime.time_out))
+    if stop_type == "home":
+        print 'Take care!'
+        return "end of day"
+
+    time = hours_worked(clocktime.seconds_worked)
+    print ("Enjoy! You worked {0} hours on {1}.").format(time, job.name)
+    raw_input("Press Enter to begin working again")
+    print("Are you still working on '{}' ? (y/n)").format(job.name)
+    answer = query()
+    if answer:
+        try:
+            state.clocktime = clock_in(clocktime.employee_id, job.id)
+        except punchd.PunchError as e:
+            print(e)
+            return None
+        state.job = job
+        print "Resuming '{0}' at: '{1}'\n".format(
+            job.name, state.clocktime.time_in.strftime('%I:%M %p'))
+        logging.info("Back from {} at {}".format(stop_type,
+                                                 state.clocktime.time_in))
 
 
 def time_formatter(time_input):
@@ -268,14 +277,7 @@ def time_formatter(time_input):
     Takes user input as 00:00, splits those using : as seperator, and returns
     the resulting timedelta object.
     """
-    FAIL_MSG = "Please check input format and try again. (00:00)"
-    split = time_input.split(":")
-    if len(split) != 2:
-        raise ValueError(FAIL_MSG)
-    try:
-        hours, minutes = map(int, split)
-    except ValueError:
-        raise ValueError(FAIL_MSG)
+    hours, minutes = timeparse.parse_duration(time_input)
     minutes = round_to_nearest(minutes, 6)
     d = datetime.timedelta(hours=hours, minutes=minutes)
     return d
@@ -283,91 +285,115 @@ def time_formatter(time_input):
 
 def get_time(time):
     """
-    Format user input time so that datetime can process it correctly.
+    Parses a user input time of day (3 PM, 3:05 p, 15:05, ...) into a
+    datetime. Raises timeparse.TimeFormatError if it can't.
     """
+    return timeparse.to_datetime(timeparse.parse_time(time))
 
-    global time_conc
 
-    if time.split(' ')[0] in {'1', '2', '3', '4', '5', '6',
-                              '7', '8', '9', '10', '11', '12'}:
-        time = time.split(' ')[0] + ':' + '00' + ' ' + time.split(' ')[1]
-        print(time)
-    try:
-        split_hour = time.split(':')[0]
-        split_minute = time.split(':')[1]
-        split_minute2 = split_minute.split(' ')[0]
-        split_ap = time.split(' ')[1]
-        if split_ap in {'a', 'A', 'p', 'P'}:
-            while split_ap in {'a', 'A'}:
-                split_ap = 'AM'
-            while split_ap in {'p', 'P'}:
-                split_ap = 'PM'
-            global _time_conc
-            _time_conc = split_hour + ':' + split_minute2 + ' ' + split_ap
-            time_conc = datetime.datetime.strptime(_time_conc, '%I:%M %p')
-        else:
-            time_conc = datetime.datetime.strptime(time, '%I:%M %p')
-    except SyntaxError:
-        print("Check format and try again.")
+def prompt_time(prompt):
+    """Asks for a time of day until get_time can parse the answer"""
+    while True:
+        try:
+            return get_time(raw_input(prompt))
+        except timeparse.TimeFormatError as e:
+            print("Check format and try again. {}".format(e))
 
-    return time_conc
+
+def formatter_menu(state):
+    time_input = raw_input("\nTime Formatter\n"
+                           "Please enter hours and minutes worked "
+                           "today in 00:00 format: ")
+    try:
+        d = time_formatter(time_input)
+        # TODO: what should we do with time_formatter? Time adustments?
+    except ValueError as e:
+        print(e)
 
 
-def total_time():
-    t_in = get_time(
-        raw_input(
-            "Please enter your start time in 00:00 AM/PM format: "))
-    t_out = get_time(
-        raw_input(
-            "Please enter your end time in 00:00 AM/PM format: "))
+def total_time(state):
+    t_in = prompt_time(
+        "Please enter your start time in 00:00 AM/PM format: ")
+    t_out = prompt_time(
+        "Please enter your end time in 00:00 AM/PM format: ")
     delta = t_out - t_in
     delta_minutes = float(round_to_nearest(delta.seconds, 360)) / 3600
     print "Your time sheet entry for {0} is {1} hours.".format(
         delta, delta_minutes)
     raw_input("\nPress enter to return to main menu.")
-    main_menu()
 
 
-def switch_task():
-    global job_name
-    global job_abbrev
-    now = update_now()
-    sel = sel_timesheet_row()
-    stop_type = "switch task"
-    for row in sel:
-        job_name = row[1]
-        job_abbrev = row[2]
-        stop_type = row[3]
-    with conn:
-        cur.execute(
-            "INSERT INTO timesheet(UUID, Job_name, Job_abbrev, Stop_type, Stop_time) VALUES(?, ?, ?, ?, ?)",
-            [p_uuid, job_name, job_abbrev, stop_type, now])
-    project_start()
-    main_menu()
+def switch_task(state):
+    """Clocks out of the current task and starts a new one"""
+    if state.status == 1:
+        clock_out(state.clocktime)
+        state.clocktime = state.job = None
+    project_start(state)
+
+
+def report(state, day=None):
+    """Prints the timesheet for day and waits to return to the menu"""
+    print_report(day)
+    raw_input("\nPress enter to return to main menu.")
 
 
-def report():
-    print("\nGenerating report for {0}\n").format(date)
-    with jobdb:
-        cur.execute(
-            "SELECT Job_name, Job_abbrev, Time_worked, Lead_name, Date FROM jobdb WHERE Date = ?", (date, ))
-        while True:
-            sel = cur.fetchall()
-            print("Job Name | Job Abbrev | Time Worked | Lead Name  | Date")
-            print("=======================================================")
-            for row in sel:
-                print("\n{0}    | {1}      | {2}        | {3}       | {4}") \
-                    .format(row[0], row[1], row[2], row[3], row[4])
-            raw_input("\nPress enter to return to main menu.")
-            main_menu()
+def print_report(day=None):
+    """Prints the timesheet for day (default today) and the week so far
 
+    Totals come from the daily rollup, so this doesn't depend on how
+    much clocktime history exists, and are cached until the data changes.
+    """
+    from models import reportcache, rollup
+    day = day or datetime.date.today()
+    print("\nGenerating report for {0}\n".format(day))
+    print("Job Name | Job Abbrev | Time Worked | Employee   | Date")
+    print("=======================================================")
+    with unit_of_work() as session:
+        totals = reportcache.REPORTS.totals(session, day,
+                                            day + rollup.ONE_DAY)
+        week_totals = reportcache.REPORTS.week_totals(session, day)
+    for row in totals:
+        print("{0}    | {1}      | {2}        | {3}       | {4}"
+              .format(row.job_name, row.abbr, hours_worked(row.seconds),
+                      row.name, row.date))
+    print("\nWeek to date")
+    print("=======================================================")
+    for row in week_totals:
+        print("{0}    | {1}      | {2}".format(
+            row.job_name, row.abbr, hours_worked(row.seconds)))
+
+
+def show_clocktimes(state, day=None):
+    """Prints every clocktime started on day (default today)"""
+    from models import records, rollup
+    day = day or datetime.date.today()
+    print("\nClocktimes for {0}\n".format(day))
+    with unit_of_work() as session:
+        rows = records.clocktimes(session, day, day + rollup.ONE_DAY)
+    for row in rows:
+        print(row)
+    raw_input("\nPress enter to return to main menu.")
 
-def config():
-    """Configure jobs and employees"""
 
-    global session
+def config(state):
+    """Configure jobs and employees
+
+    Each addition or edit is committed on its own, as soon as it's made.
+    """
+    from models import Job, Employee, cache, records, search
 
     # TODO: refactor these out into module-level so they're unit-testable
+    def save(table, work):
+        """Runs work(session) as one unit of work, reporting failures"""
+        try:
+            with unit_of_work() as session:
+                work(session)
+        except Exception as e:
+            logging.error("An error occurred updating "
+                          "the {} table {}".format(table, e))
+            print("There was an error committing changes. "
+                  "Rolling back database to last good state.")
+
     def add_job(**kwargs):
         """Helper function to create Jobs
 
@@ -379,9 +405,7 @@ def config():
                       field in fields}
             # store rate as int of cents/hour
             kwargs['rate'] = float(kwargs['rate']) * 100
-        new_job = Job(**kwargs)
-        session.add(new_job)
-        return new_job
+        save('jobs', lambda session: session.add(Job(**kwargs)))
 
     def add_employee(**kwargs):
         """Helper function to create Employees
@@ -392,9 +416,7 @@ def config():
             fields = ['firstname', 'lastname']
             kwargs = {field: raw_input("{}: ".format(field)) for
                       field in fields}
-        new_employee = Employee(**kwargs)
-        session.add(new_employee)
-        return new_employee
+        save('employees', lambda session: session.add(Employee(**kwargs)))
 
     def edit_job(jobs):
         """Helper function to edit jobs
@@ -404,10 +426,18 @@ def config():
         """
         show_tables(jobs)
         requested_job_abbr = raw_input("Job abbreviation? ")
-        # TODO: If nothing is found, or multiple is found, handle gracefully
-        job_to_edit = session.query(Job)\
-                             .filter_by(abbr=requested_job_abbr)\
-                             .one()
+        with unit_of_work() as session:
+            record = cache.CACHE.job_by_abbr(session, requested_job_abbr)
+            if record is None:
+                candidates = search.INDEX.search(session, requested_job_abbr,
+                                                 limit=5)
+        if record is None:
+            print("No job with abbreviation {}".format(requested_job_abbr))
+            job_id = pick_job(candidates)
+            if job_id is None:
+                return
+            with unit_of_work() as session:
+                record = cache.CACHE.job(session, job_id)
         print("1. Name\n"
               "2. Abbreviation\n"
               "3. Rate")
@@ -418,15 +448,16 @@ def config():
             val_to_change = 'abbr'
         elif answer.startswith('3'):  # Change rate
             val_to_change = 'rate'
-        old_val = getattr(job_to_edit, val_to_change)
+        old_val = getattr(record, val_to_change)
         new_val = raw_input("What do you want to change it to? ")
         if val_to_change == 'rate':
             new_val = int(float(new_val) * 100)
-        print(job_to_edit)
+        print(record)
         print("Changing {} to {}".format(old_val, new_val))
         confirm = raw_input("Are you sure? (y/n): ")
         if confirm == 'y':
-            change_table_value(job_to_edit, val_to_change, new_val)
+            save('jobs', lambda session: change_table_value(
+                session.query(Job).get(record.id), val_to_change, new_val))
         else:
             print("Cancelled")
 
@@ -456,8 +487,11 @@ def config():
         answer = raw_input(">>> ")
 
         if answer.startswith('1'):
+            jobs = None
             while True:
-                jobs = session.query(Job).all()
+                if jobs is None:  # only re-query after a change
+                    with unit_of_work() as session:
+                        jobs = records.jobs(session)
                 show_tables(jobs)
                 print("\n"
                       "1. Add Job\n"
@@ -465,19 +499,12 @@ def config():
                       "3. Back\n")
                 answer = raw_input(">>> ")
                 if answer.startswith('1'):
-                    # TODO: do something with new_job? What?
-                    new_job = add_job()
+                    add_job()
+                    jobs = None
                 elif answer.startswith('2'):
                     edit_job(jobs)
+                    jobs = None
                 elif answer.startswith('3'):
-                    try:
-                        session.commit()
-                    except Exception as e:
-                        logging.error("An error occurred updating "
-                                      "the jobs table {}".format(e))
-                        print("There was an error committing changes. "
-                              "Rolling back database to last good state.")
-                        session.rollback()
                     break  # break the loop and go up a level
                 else:
                     print("Invalid selection")
@@ -488,45 +515,437 @@ def config():
             break  # kick out of config function
 
 
-# TODO: Add code from v0.1 that prints current task at bottom of main menu if status == 1.
-def main_menu():
-    while True:
-        """Main menu for program. Prompts user for function."""
-        print "PYPER Timesheet Utility\n\n" \
-              "What would you like to do?\n" \
-              "1. Clock In\n" \
-              "2. Break Time\n" \
-              "3. Clock Out\n" \
-              "4. Config\n" \
-              "5. Timesheet Minute Formatter\n" \
-              "6. Calculate Total Time Worked\n" \
-              "7. Generate Today's Timesheet\n" \
-              "9. Quit\n"
+def quit_menu(state):
+    state.running = False
+
+
+# (key, label, action) for each main menu entry. Every action takes the
+# ClockState and returns to the menu loop when it's done.
+MENU = [('1', "Clock In", project_start),
+        ('2', "Break Time", break_submenu),
+        ('3', "Clock Out", clock_out_menu),
+        ('4', "Config", config),
+        ('5', "Timesheet Minute Formatter", formatter_menu),
+        ('6', "Calculate Total Time Worked", total_time),
+        ('7', "Generate Today's Timesheet", report),
+        ('8', "Show Today's Clocktimes", show_clocktimes),
+        ('9', "Quit", quit_menu)]
+MENU_ACTIONS = {key: action for key, _, action in MENU}
+
+
+def main_menu(state=None):
+    """Main menu for program. Prompts user for function.
+
+    Runs as a flat loop dispatching through MENU until an action clears
+    state.running, and returns the state.
+    """
+    state = state or ClockState()
+    while state.running:
+        lines = ["PYPER Timesheet Utility\n\nWhat would you like to do?"]
+        lines.extend("{}. {}".format(key, label) for key, label, _ in MENU)
+        if state.status == 1:
+            lines.append("\nCurrently working on {} ({}) since {:%I:%M %p}"
+                         .format(state.job.name, state.job.abbr,
+                                 state.clocktime.time_in))
+        print("\n".join(lines) + "\n")
         answer = raw_input(">>> ")
-        if answer.startswith('1'):
-            project_start()
-        if answer.startswith('2'):
-            break_submenu()
-        if answer.startswith('3'):
-            raise NotImplementedError()
-            # TODO: implement clock out
-        if answer.startswith('4'):
-            config()
-        if answer.startswith('5'):
-            time_input = raw_input("\nTime Formatter\n"
-                                   "Please enter hours and minutes worked "
-                                   "today in 00:00 format: ")
-            try:
-                d = time_formatter(time_input)
-                # TODO: what should we do with time_formatter? Time adustments?
-            except ValueError as e:
-                print(e)
-        if answer.startswith('6'):
-            total_time()
-        if answer.startswith('7'):
-            report()
-        if answer.startswith('9'):
-            break
+        action = MENU_ACTIONS.get(answer[:1])
+        if action is None:
+            print("Invalid selection")
+        else:
+            with instrumentation.timer('menu.' + action.__name__):
+                action(state)
+    return state
+
+
+def _punch_time(value):
+    """argparse type for --at: a time of day today"""
+    try:
+        return timeparse.to_datetime(timeparse.parse_time(value),
+                                     datetime.date.today())
+    except timeparse.TimeFormatError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _date(value):
+    """argparse type for YYYY-MM-DD dates"""
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "{!r}: expected a date as YYYY-MM-DD".format(value))
+
+
+def _punch(op, employee_id, job=None, at=None):
+    """Sends a punch to the daemon if one is running, else commits it here
+
+    Returns the reply dict either way.
+    """
+    import punchd
+    request = punchd.punch_request(op, employee_id, job, at)
+    try:
+        return punchd.send(request)
+    except punchd.DaemonUnavailable:
+        with unit_of_work() as session:
+            return punchd.commit_punch(session, request)
+
+
+def clock_in_command(args):
+    import punchd
+    reply = _punch('clock-in', args.employee, args.job, args.at)
+    if not reply['ok']:
+        return reply['error']
+    print("Clocked in to {} at {:%I:%M %p}".format(
+        reply['job'], punchd.parse_time(reply['time'])))
+
+
+def clock_out_command(args):
+    import punchd
+    reply = _punch('clock-out', args.employee, at=args.at)
+    if not reply['ok']:
+        return reply['error']
+    print("Clocked out at {:%I:%M %p}, {} hours".format(
+        punchd.parse_time(reply['time']), hours_worked(reply['seconds'])))
+
+
+def who_command(args):
+    from models import cache, shifts
+    with unit_of_work() as session:
+        on_the_clock = [(shift,
+                         cache.CACHE.employee(session, shift.employee_id),
+                         cache.CACHE.job(session, shift.job_id))
+                        for shift in shifts.REGISTRY.on_the_clock(session)]
+    for shift, employee, job in on_the_clock:
+        print("{:<24} {:<10} since {:%Y-%m-%d %I:%M %p}".format(
+            employee.name, job.abbr, shift.time_in))
+    if not on_the_clock:
+        print("Nobody is clocked in")
+
+
+def jobs_command(args):
+    from models import search
+    with unit_of_work() as session:
+        candidates = search.INDEX.search(session, args.text, args.limit)
+    for candidate in candidates:
+        print("{:<16} {}".format(candidate.abbr, candidate.name))
+    if not candidates:
+        print("No jobs match {!r}".format(args.text))
+
+
+def close_stale_command(args):
+    from models import shifts
+    max_shift = datetime.timedelta(hours=args.hours)
+    with unit_of_work() as session:
+        closed = database.transaction(
+            session,
+            lambda session: shifts.REGISTRY.close_stale(session, max_shift))
+    for shift in closed:
+        print("Closed clocktime ID# {} (employee ID# {}, in at {})".format(
+            shift.clocktime_id, shift.employee_id, shift.time_in))
+    print("Closed {} stale shifts".format(len(closed)))
+
+
+def audit_command(args):
+    import audit
+    max_gap = datetime.timedelta(hours=args.gap_hours)
+    count = 0
+    with unit_of_work() as session:
+        for issue in audit.audit(session.connection(), max_gap=max_gap):
+            print("{0.kind:<8} employee ID# {0.employee_id:<5} clocktime "
+                  "ID# {0.clocktime_id:<7} {0.start} - {0.end} (with ID# "
+                  "{0.other_id})".format(issue))
+            count += 1
+    print("{} issues".format(count))
+
+
+def report_command(args):
+    print_report(args.date)
+
+
+def export_command(args):
+    import csvio
+    end = args.end and args.end + datetime.timedelta(days=1)
+    with open(args.file, 'wb') as f, unit_of_work() as session:
+        count = csvio.export_csv(session.connection(), f, args.start, end,
+                                 args.employee, args.job)
+    print("Exported {} clocktimes to {}".format(count, args.file))
+
+
+def payroll_command(args):
+    import reports
+    end = args.end and args.end + datetime.timedelta(days=1)
+    with open(args.file, 'wb') as f:
+        count = reports.employee_report(get_engine().url.database, f,
+                                        args.start, end, args.period,
+                                        args.processes)
+    print("Wrote {} payroll lines to {}".format(count, args.file))
+
+
+def _minutes(seconds):
+    return "{:d}:{:02d}".format(*divmod(int(round(seconds / 60.0)), 60))
+
+
+def durations_command(args):
+    from models import durations, records
+    end = args.end and args.end + datetime.timedelta(days=1)
+    with unit_of_work() as session:
+        by_group = durations.distributions(session.connection(), args.start,
+                                           end, args.by, args.kind)
+        if args.by == 'job':
+            names = {job.id: job.abbr for job in records.jobs(session)}
+        else:
+            names = {employee.id: employee.name
+                     for employee in records.employees(session)}
+    print("{:<24} {:>7} {:>7} {:>7} {:>7}".format(
+        args.by.capitalize(), args.kind + "s", "median", "p90", "max"))
+    for key, sketch in sorted(by_group.items(),
+                              key=lambda item: names.get(item[0], u"")):
+        print(u"{:<24} {:>7} {:>7} {:>7} {:>7}".format(
+            names.get(key, u"ID# {}".format(key)), sketch.count,
+            _minutes(sketch.median), _minutes(sketch.quantile(0.9)),
+            _minutes(sketch.quantile(1))))
+    if not by_group:
+        print("No {}s in that range".format(args.kind))
+
+
+def sync_command(args):
+    import sync
+    source = database.make_engine(args.source)
+    target = database.make_engine(args.target) if args.target \
+        else get_engine()
+    try:
+        result = sync.sync(source, target, args.on_conflict)
+    except sync.SyncConflict as e:
+        return "Nothing synced: {}".format(e)
+    finally:
+        source.dispose()
+    for table in sync.TABLES:
+        print("{:<12} {:>8} written {:>8} deleted".format(
+            table.name, result.upserted[table.name],
+            result.deleted[table.name]))
+    for table_name, id_ in result.conflicts:
+        print("Conflict: {} ID# {} ({} kept)".format(
+            table_name, id_,
+            'incoming' if args.on_conflict == 'source' else 'ours'))
+
+
+def archive_command(args):
+    import archive
+    before = args.before or \
+        datetime.date.today() - datetime.timedelta(days=args.days)
+    engine = get_engine()
+    moved = archive.archive(engine,
+                            datetime.datetime.combine(before, datetime.time()),
+                            vacuum=args.vacuum)
+    for year in sorted(moved):
+        print("Moved {} clocktimes to {}".format(
+            moved[year], archive.archive_path(engine.url.database, year)))
+    print("Archived {} clocktimes".format(sum(moved.values())))
+
+
+def snapshot_command(args):
+    import snapshot
+    with unit_of_work() as session:
+        added = snapshot.update(session.connection(), args.directory,
+                                rebuild=args.rebuild)
+    rows, last_id = snapshot.state(args.directory)
+    print("Added {} clocktimes to {} ({} rows, up to ID# {})".format(
+        added, args.directory, rows, last_id))
+
+
+def menu_command(args):
+    os.system('cls' if os.name == 'nt' else 'clear')
+    main_menu()
+
+
+def instrumentation_parser():
+    """The options, before any subcommand, for profiling, stats and caching"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--report-cache', metavar='FILE',
+                        help="keep report results in FILE between runs")
+    parser.add_argument('--stats', metavar='FILE',
+                        help="time commands, menu actions and SQL, and "
+                             "write the counters and histograms to FILE "
+                             "as JSON")
+    parser.add_argument('--slow-ms', type=float, default=100,
+                        help="with --stats, log statements slower than "
+                             "this to {} (default 100)"
+                             .format(instrumentation.SLOW_LOG))
+    parser.add_argument('--profile', metavar='FILE',
+                        help="run under cProfile, saving its stats to FILE")
+    return parser
+
+
+def build_parser():
+    """The argparse parser for the one-shot subcommands"""
+    parser = argparse.ArgumentParser(
+        description="PYPER timesheet utility. Run without a command for "
+                    "the interactive menu.",
+        parents=[instrumentation_parser()])
+    subparsers = parser.add_subparsers(dest='command')
+
+    menu_parser = subparsers.add_parser(
+        'menu', help="the interactive menu (the default)")
+    menu_parser.set_defaults(func=menu_command)
+
+    clock_in_parser = subparsers.add_parser('clock-in', help="start a shift")
+    clock_in_parser.add_argument('employee', type=int, help="employee ID#")
+    clock_in_parser.add_argument('job', help="job abbreviation")
+    clock_in_parser.add_argument('--at', type=_punch_time,
+                                 help="time of day (default now)")
+    clock_in_parser.set_defaults(func=clock_in_command)
+
+    clock_out_parser = subparsers.add_parser('clock-out',
+                                             help="end a shift")
+    clock_out_parser.add_argument('employee', type=int, help="employee ID#")
+    clock_out_parser.add_argument('--at', type=_punch_time,
+                                  help="time of day (default now)")
+    clock_out_parser.set_defaults(func=clock_out_command)
+
+    who_parser = subparsers.add_parser('who',
+                                       help="list everyone on the clock")
+    who_parser.set_defaults(func=who_command)
+
+    jobs_parser = subparsers.add_parser(
+        'jobs', help="find jobs by abbreviation or (part of) their name")
+    jobs_parser.add_argument('text')
+    jobs_parser.add_argument('--limit', type=int, default=10,
+                             help="most matches to list (default 10)")
+    jobs_parser.set_defaults(func=jobs_command)
+
+    close_stale_parser = subparsers.add_parser(
+        'close-stale', help="close shifts left open by a crashed client")
+    close_stale_parser.add_argument('--hours', type=float, default=16,
+                                    help="longest real shift (default 16)")
+    close_stale_parser.set_defaults(func=close_stale_command)
+
+    audit_parser = subparsers.add_parser(
+        'audit', help="list overlapping, empty and long gapped shifts")
+    audit_parser.add_argument('--gap-hours', type=float, default=2,
+                              help="report gaps within a day longer than "
+                                   "this (default 2)")
+    audit_parser.set_defaults(func=audit_command)
+
+    report_parser = subparsers.add_parser('report',
+                                          help="print a day's timesheet")
+    report_parser.add_argument('--date', type=_date,
+                               help="YYYY-MM-DD (default today)")
+    report_parser.set_defaults(func=report_command)
+
+    archive_parser = subparsers.add_parser(
+        'archive', help="move old closed shifts to per-year archive files")
+    archive_parser.add_argument('--before', type=_date,
+                                help="archive shifts ended before this "
+                                     "YYYY-MM-DD")
+    archive_parser.add_argument('--days', type=int, default=365,
+                                help="or older than this many days "
+                                     "(default 365)")
+    archive_parser.add_argument('--vacuum', action='store_true',
+                                help="compact the database afterwards")
+    archive_parser.set_defaults(func=archive_command)
+
+    snapshot_parser = subparsers.add_parser(
+        'snapshot', help="update the columnar snapshot for analytics")
+    snapshot_parser.add_argument('directory')
+    snapshot_parser.add_argument('--rebuild', action='store_true',
+                                 help="rewrite it from scratch")
+    snapshot_parser.set_defaults(func=snapshot_command)
+
+    export_parser = subparsers.add_parser('export',
+                                          help="write clocktimes as CSV")
+    export_parser.add_argument('file')
+    export_parser.add_argument('--start', type=_date,
+                               help="first day to include, YYYY-MM-DD")
+    export_parser.add_argument('--end', type=_date,
+                               help="last day to include, YYYY-MM-DD")
+    export_parser.add_argument('--employee', type=int, help="employee ID#")
+    export_parser.add_argument('--job', type=int, help="job ID#")
+    export_parser.set_defaults(func=export_command)
+
+    payroll_parser = subparsers.add_parser(
+        'payroll', help="write hours and pay per employee, period and job "
+                        "as CSV")
+    payroll_parser.add_argument('file')
+    payroll_parser.add_argument('--start', type=_date,
+                                help="first day to include, YYYY-MM-DD")
+    payroll_parser.add_argument('--end', type=_date,
+                                help="last day to include, YYYY-MM-DD")
+    payroll_parser.add_argument('--period', default='month',
+                                choices=['day', 'week', 'month'],
+                                help="pay period (default month)")
+    payroll_parser.add_argument('--processes', type=int, default=1,
+                                help="worker processes to split the "
+                                     "employees across (default 1)")
+    payroll_parser.set_defaults(func=payroll_command)
+
+    durations_parser = subparsers.add_parser(
+        'durations', help="median and 90th percentile shift or break "
+                          "lengths (h:mm) per job or employee")
+    durations_parser.add_argument('--start', type=_date,
+                                  help="first day to include, YYYY-MM-DD")
+    durations_parser.add_argument('--end', type=_date,
+                                  help="last day to include, YYYY-MM-DD")
+    durations_parser.add_argument('--by', default='job',
+                                  choices=['job', 'employee'])
+    durations_parser.add_argument('--kind', default='shift',
+                                  choices=['shift', 'break'])
+    durations_parser.set_defaults(func=durations_command)
+
+    sync_parser = subparsers.add_parser(
+        'sync', help="copy what changed in another database since the "
+                     "last sync")
+    sync_parser.add_argument('source', help="database file to sync from")
+    sync_parser.add_argument('--target',
+                             help="database file to sync into (default "
+                                  "this one)")
+    sync_parser.add_argument('--on-conflict', default='error',
+                             choices=['error', 'source', 'target'],
+                             help="when both sides changed a row: stop, "
+                                  "take the source's or keep the target's "
+                                  "(default error)")
+    sync_parser.set_defaults(func=sync_command)
+    return parser
+
+
+def _timed_command(args):
+    with instrumentation.timer('command.' + args.command):
+        return args.func(args)
+
+
+def _stats_command(args):
+    if not args.stats:
+        return args.func(args)
+    with instrumentation.instrumented(get_engine(), args.stats,
+                                      slow_threshold=args.slow_ms / 1000.0):
+        return _timed_command(args)
+
+
+def run_command(args):
+    """Runs args.func under the --stats and --profile switches in args"""
+    if args.report_cache:
+        from models import reportcache
+        reportcache.REPORTS.path = args.report_cache
+    if args.profile:
+        with instrumentation.profiled(args.profile):
+            return _stats_command(args)
+    return _stats_command(args)
+
+
+def main(argv=None):
+    """Runs one subcommand, or the interactive menu if there is none
+
+    Returns the process exit status.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    _, command = instrumentation_parser().parse_known_args(argv)
+    if not command:
+        argv = argv + ['menu']
+    args = build_parser().parse_args(argv)
+    error = run_command(args)
+    if error:
+        sys.stderr.write(error + "\n")
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
@@ -540,5 +959,4 @@ if __name__ == "__main__":
                         format=FORMATTER_STRING,
                         level=LOGLEVEL)
 
-    os.system('cls' if os.name == 'nt' else 'clear')
-    main_menu()
+    sys.exit(main())
@@ -0,0 +1,17 @@
+"""The timesheet schema as it was before any indexes were declared
+
+For building old-style databases to migrate with update_metadata, in the
+tests and in benchmarks.bench_indexes:
+
+    for statement in OLD_SCHEMA:
+        engine.execute(statement)
+"""
+
+OLD_SCHEMA = [
+    "CREATE TABLE employees (id INTEGER PRIMARY KEY, "
+    "firstname VARCHAR(50), lastname VARCHAR(50))",
+    "CREATE TABLE jobs (id INTEGER PRIMARY KEY, name VARCHAR(50), "
+    "abbr VARCHAR(16), rate INTEGER)",
+    "CREATE TABLE clocktimes (id INTEGER PRIMARY KEY, time_in DATETIME, "
+    "time_out DATETIME, employee_id INTEGER REFERENCES employees(id), "
+    "job_id INTEGER REFERENCES jobs(id))"]
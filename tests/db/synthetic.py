@@ -0,0 +1,124 @@
+"""Seeded generator of realistic timesheet data, and a fixture using it
+
+generate() adds employees, jobs and their clocktimes for a run of days:
+day shifts split by a lunch break (and sometimes a short break, or a
+switch to another job after lunch), and night shifts that cross
+midnight. Each employee's shifts never overlap. The same seed always
+gives the same rows.
+
+    generate(connection, employees=1000, days=3 * 365)  # ~1.3M shifts
+"""
+
+import datetime
+import random
+from collections import defaultdict
+
+from sqlalchemy import func, select
+
+from models import Clocktime, Employee, Job, changes, durations, rollup
+from tests.db import TestDBBase
+
+FIRST_NAMES = ["Adam", "Beth", "Carlos", "Dana", "Eve", "Farid", "Grace",
+               "Hiro", "Ines", "Jon", "Kemi", "Lars", "Mina", "Noor"]
+LAST_NAMES = ["Smith", "Jones", "Garcia", "Nguyen", "Okafor", "Rossi",
+              "Schmidt", "Tanaka", "Walsh", "Yilmaz"]
+START = datetime.date(2014, 1, 6)  # a Monday
+NIGHT_SHARE = 0.2  # of employees, working 21:00-23:00 starts
+ABSENCE = 0.05  # chance of missing a working day
+CHUNK = 10000
+
+
+def _minutes(rng, low, high):
+    return datetime.timedelta(minutes=rng.randint(low, high))
+
+
+def _day_shifts(rng, day, night, job_ids, home_job):
+    """Yields (time_in, time_out, job_id) for one employee's working day"""
+    if night:
+        start = datetime.datetime.combine(day, datetime.time(21)) + \
+            _minutes(rng, 0, 120)
+    else:
+        start = datetime.datetime.combine(day, datetime.time(7)) + \
+            _minutes(rng, 0, 150)
+    morning_end = start + _minutes(rng, 210, 270)
+    yield start, morning_end, home_job
+    afternoon = morning_end + _minutes(rng, 30, 60)  # lunch
+    job = rng.choice(job_ids) if rng.random() < 0.3 else home_job
+    end = afternoon + _minutes(rng, 210, 270)
+    if rng.random() < 0.2:  # a short break in the afternoon
+        pause = afternoon + _minutes(rng, 60, 150)
+        yield afternoon, pause, job
+        afternoon = pause + _minutes(rng, 10, 20)
+    yield afternoon, end, job
+
+
+def generate(connection, employees=50, jobs=20, days=28, seed=0,
+             start=START):
+    """Adds employees, jobs and days of clocktimes through connection
+
+    New ids follow any existing rows. The daily rollup and duration
+    sketches are updated to match, and the rows share one change
+    sequence number. Returns the number of clocktimes added.
+    """
+    rng = random.Random(seed)
+    seq = changes.next_sequence(connection)
+    employee_table = Employee.__table__
+    job_table = Job.__table__
+    first_employee = (connection.execute(
+        select([func.max(employee_table.c.id)])).scalar() or 0) + 1
+    first_job = (connection.execute(
+        select([func.max(job_table.c.id)])).scalar() or 0) + 1
+    job_ids = range(first_job, first_job + jobs)
+    connection.execute(job_table.insert(), [
+        {'id': job_id, 'name': "Job {}".format(job_id),
+         'abbr': "SYN{:05d}".format(job_id),
+         'rate': rng.randrange(1500, 15000, 25), 'change_seq': seq}
+        for job_id in job_ids])
+    staff = []
+    for employee_id in range(first_employee, first_employee + employees):
+        staff.append((employee_id, rng.random() < NIGHT_SHARE,
+                      rng.choice(job_ids)))
+    connection.execute(employee_table.insert(), [
+        {'id': employee_id, 'firstname': rng.choice(FIRST_NAMES),
+         'lastname': rng.choice(LAST_NAMES), 'change_seq': seq}
+        for employee_id, _, _ in staff])
+
+    deltas = defaultdict(int)
+    chunk = []
+    count = 0
+    for offset in range(days):
+        day = start + datetime.timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+        for employee_id, night, home_job in staff:
+            if rng.random() < ABSENCE:
+                continue
+            for time_in, time_out, job_id in _day_shifts(rng, day, night,
+                                                         job_ids, home_job):
+                chunk.append({'time_in': time_in, 'time_out': time_out,
+                              'employee_id': employee_id, 'job_id': job_id,
+                              'change_seq': seq})
+                rollup.add_interval(deltas, time_in, time_out, employee_id,
+                                    job_id)
+        if len(chunk) >= CHUNK:
+            connection.execute(Clocktime.__table__.insert(), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        connection.execute(Clocktime.__table__.insert(), chunk)
+        count += len(chunk)
+    rollup.apply_deltas(connection, deltas)
+    durations.rebuild(connection)
+    return count
+
+
+class SyntheticDBBase(TestDBBase):
+    """TestDBBase plus generate()d data of SYNTHETIC's size and seed"""
+
+    SYNTHETIC = {'employees': 20, 'jobs': 8, 'days': 14, 'seed': 0}
+
+    def setUp(self):
+        TestDBBase.setUp(self)
+        self.session.flush()
+        self.clocktimes = generate(self.session.connection(),
+                                   **self.SYNTHETIC)
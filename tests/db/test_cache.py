@@ -0,0 +1,101 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from instrumentation import QueryCounter
+from models import Base, Deletion, Employee, Job, changes
+from models.cache import LookupCache
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestLookupCache(unittest.TestCase):
+
+    def setUp(self):
+        # committed data of its own, rather than the shared TESTDATA
+        self.engine = create_engine('sqlite:///')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add_all([Job(name="Python Time", abbr="PYTIME",
+                                  rate=20000),
+                              Employee(firstname="Adam", lastname="Smith")])
+        self.session.commit()
+        self.cache = LookupCache(maxsize=2)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_hits_without_queries(self):
+        """Repeat lookups in a transaction should not touch the db"""
+        job = self.cache.job_by_abbr(self.session, "PYTIME")
+        self.assertEqual((job.name, job.rate), ("Python Time", 20000))
+        with QueryCounter(self.engine) as counter:
+            self.assertEqual(self.cache.job_by_abbr(self.session, "PYTIME"),
+                             job)
+            self.assertEqual(self.cache.job(self.session, job.id), job)
+        self.assertEqual(counter.count, 0)
+        self.assertEqual(self.cache.stats()['hits'], 2)
+        self.assertIsNone(self.cache.job_by_abbr(self.session, "NOPE"))
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_lru_eviction(self):
+        """The least recently used entry should go first"""
+        self.session.add(Job(name="Other", abbr="OTHER", rate=100))
+        self.session.commit()
+        self.cache.job(self.session, 1)
+        self.cache.employee(self.session, 1)
+        self.cache.job(self.session, 1)
+        self.cache.job(self.session, 2)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.employee(self.session, 1).name,
+                         "Adam Smith")
+        self.assertEqual(self.cache.misses, 4)
+
+    def test_invalidated_on_commit(self):
+        """Committed edits should drop the stale entry"""
+        self.cache.job_by_abbr(self.session, "PYTIME")
+        job = self.session.query(Job).one()
+        job.abbr = "PY"
+        self.session.flush()
+        self.assertEqual(len(self.cache), 1)  # not committed yet
+        self.session.commit()
+        self.assertEqual(len(self.cache), 0)
+        self.assertIsNone(self.cache.job_by_abbr(self.session, "PYTIME"))
+        self.assertEqual(self.cache.job_by_abbr(self.session, "PY").id, 1)
+
+    def test_changes_from_elsewhere(self):
+        """Edits and deletes from another connection are seen next time"""
+        tmpdir = tempfile.mkdtemp()
+        engine = create_engine('sqlite:///{}'.format(
+            os.path.join(tmpdir, 'timesheet.db')))
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        session.add_all([Job(name="Python Time", abbr="PYTIME", rate=20000),
+                         Employee(firstname="Adam", lastname="Smith")])
+        session.commit()
+        try:
+            self.assertEqual(self.cache.job_by_abbr(session, "PYTIME").id, 1)
+            self.assertIsNotNone(self.cache.employee(session, 1))
+            session.commit()
+            # as another process, csvio or sync would, bypassing sessions
+            with engine.begin() as connection:
+                seq = changes.next_sequence(connection)
+                connection.execute(Job.__table__.update()
+                                   .values(abbr="PY", change_seq=seq))
+            self.assertIsNotNone(self.cache.employee(session, 1))
+            self.assertIsNone(self.cache.job_by_abbr(session, "PYTIME"))
+            self.assertEqual(self.cache.job_by_abbr(session, "PY").id, 1)
+            session.commit()
+            with engine.begin() as connection:
+                seq = changes.next_sequence(connection)
+                connection.execute(Employee.__table__.delete())
+                connection.execute(Deletion.__table__.insert().values(
+                    table_name='employees', row_id=1, change_seq=seq))
+            self.assertIsNone(self.cache.employee(session, 1))
+        finally:
+            session.close()
+            engine.dispose()
+            shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    unittest.main()
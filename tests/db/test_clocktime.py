@@ -15,6 +15,18 @@ class TestClocktime(TestDBBase, unittest.TestCase):
                                timedelta(hours=2),
                                delta=timedelta(minutes=6))
 
+    def test_open_clocktime(self):
+        """Open clocktimes have no timeworked yet"""
+        clocktime = Clocktime(time_in=datetime.today())
+        self.assertIsNone(clocktime.timeworked)
+
+    def test_seconds_worked(self):
+        """seconds_worked should agree in Python and SQL"""
+        clocktime = self.session.query(Clocktime).one()
+        in_sql = self.session.query(Clocktime.seconds_worked).scalar()
+        self.assertEqual(clocktime.seconds_worked, in_sql)
+        self.assertAlmostEqual(in_sql, 7200, delta=1)
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,75 @@
+from datetime import date, datetime, timedelta
+from models import Clocktime, DailyTotal, rollup
+from tests.db import TestDBBase, TESTDATA
+import unittest
+
+
+class TestDailyTotal(TestDBBase, unittest.TestCase):
+
+    def totals(self):
+        return {(row.date, row.abbr): row.seconds for row in
+                rollup.totals(self.session, date.min, date.max)}
+
+    def add_shift(self, time_in, time_out=None):
+        # set ids rather than relationships so the shared TESTDATA objects'
+        # clocktimes collections aren't changed for the other tests
+        self.session.flush()
+        clocktime = Clocktime(time_in=time_in, time_out=time_out,
+                              employee_id=TESTDATA['employee'].id,
+                              job_id=TESTDATA['job'].id)
+        self.session.add(clocktime)
+        self.session.flush()
+        return clocktime
+
+    def test_daily_total(self):
+        """Tests the daily_total db object is kept up to date on flush"""
+        self.session.flush()
+        today = TESTDATA['clocktime'].time_in.date()
+        total = self.session.query(DailyTotal).filter_by(date=today).one()
+        self.assertEqual(total.employee, TESTDATA['employee'])
+        self.assertEqual(total.job, TESTDATA['job'])
+
+    def test_split_by_day(self):
+        """A shift crossing midnight should count towards both days"""
+        self.assertEqual(
+            list(rollup.split_by_day(datetime(2014, 9, 1, 22),
+                                     datetime(2014, 9, 2, 2, 30))),
+            [(date(2014, 9, 1), 7200), (date(2014, 9, 2), 9000)])
+        self.assertEqual(
+            list(rollup.split_by_day(datetime(2014, 9, 1, 22), None)), [])
+
+    def test_close_edit_delete(self):
+        """Closing, editing and deleting clocktimes should adjust totals"""
+        day = date(2014, 9, 1)
+        clocktime = self.add_shift(datetime(2014, 9, 1, 22))
+        self.assertNotIn((day, "PYTIME"), self.totals())
+        clocktime.time_out = datetime(2014, 9, 2, 1)
+        self.session.flush()
+        self.assertEqual(self.totals()[(day, "PYTIME")], 7200)
+        self.assertEqual(self.totals()[(day + timedelta(days=1),
+                                        "PYTIME")], 3600)
+        clocktime.time_in = datetime(2014, 9, 1, 23)
+        self.session.flush()
+        self.assertEqual(self.totals()[(day, "PYTIME")], 3600)
+        self.session.delete(clocktime)
+        self.session.flush()
+        self.assertEqual(self.totals()[(day, "PYTIME")], 0)
+
+    def test_rebuild(self):
+        """rebuild should match the incrementally maintained totals"""
+        self.add_shift(datetime(2014, 9, 1, 8), datetime(2014, 9, 1, 12))
+        self.add_shift(datetime(2014, 9, 1, 13), datetime(2014, 9, 2, 1))
+        before = self.totals()
+        rollup.rebuild(self.session.connection())
+        self.assertEqual(self.totals(), before)
+
+    def test_week_totals(self):
+        """week_totals should only sum Monday through the given day"""
+        self.add_shift(datetime(2014, 8, 31, 8), datetime(2014, 8, 31, 9))
+        self.add_shift(datetime(2014, 9, 1, 8), datetime(2014, 9, 1, 10))
+        self.add_shift(datetime(2014, 9, 3, 8), datetime(2014, 9, 3, 11))
+        (row,) = rollup.week_totals(self.session, date(2014, 9, 3))
+        self.assertEqual((row.abbr, row.seconds), ("PYTIME", 5 * 3600))
+
+if __name__ == "__main__":
+    unittest.main()
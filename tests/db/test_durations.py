@@ -0,0 +1,107 @@
+from datetime import date, datetime, timedelta
+import random
+from sqlalchemy import select
+from models import Clocktime, DailySketch, durations
+from models.durations import LogHistogram, distributions
+from tests.db import TESTDATA
+from tests.db.synthetic import SyntheticDBBase
+import unittest
+
+
+def exact_quantile(values, q):
+    values = sorted(values)
+    return values[max(int(-(-q * len(values) // 1)), 1) - 1]
+
+
+class TestLogHistogram(unittest.TestCase):
+
+    def test_quantiles(self):
+        """quantiles should be within GAMMA of the exact ones"""
+        rng = random.Random(0)
+        values = [rng.lognormvariate(9, 0.6) for _ in range(5000)]
+        sketch = LogHistogram()
+        for value in values:
+            sketch.add(value)
+        for q in (0.01, 0.5, 0.9, 0.99, 1):
+            exact = exact_quantile(values, q)
+            self.assertLessEqual(abs(sketch.quantile(q) - exact),
+                                 exact * (durations.GAMMA - 1))
+        self.assertLess(len(sketch.bins), 200)
+        self.assertEqual(LogHistogram().median, None)
+        self.assertEqual(LogHistogram.decode(sketch.encode()), sketch)
+
+    def test_merge(self):
+        """merged histograms are the histogram of all the values"""
+        first, second, both = LogHistogram(), LogHistogram(), LogHistogram()
+        for value in range(0, 30000, 7):
+            (first if value % 2 else second).add(value)
+            both.add(value)
+        self.assertEqual(first.merge(second), both)
+        self.assertEqual(first.count, both.count)
+
+
+class TestDurations(SyntheticDBBase, unittest.TestCase):
+
+    def stored(self):
+        table = DailySketch.__table__
+        return sorted(self.session.execute(select(list(table.c))).fetchall())
+
+    def shift_lengths(self, job_id=None):
+        query = self.session.query(Clocktime)\
+                            .filter(Clocktime.time_out != None)
+        if job_id is not None:
+            query = query.filter(Clocktime.job_id == job_id)
+        return [clocktime.seconds_worked for clocktime in query]
+
+    def test_distributions(self):
+        """merged day sketches match the shifts they were built from"""
+        by_job = distributions(self.session.connection(), None, None)
+        job_id = max(by_job, key=lambda key: by_job[key].count)
+        lengths = self.shift_lengths(job_id)
+        self.assertEqual(by_job[job_id].count, len(lengths))
+        for q in (0.5, 0.9):
+            exact = exact_quantile(lengths, q)
+            self.assertLessEqual(abs(by_job[job_id].quantile(q) - exact),
+                                 exact * (durations.GAMMA - 1))
+        (everyone,) = distributions(self.session.connection(), None, None,
+                                    by=None).values()
+        self.assertEqual(everyone.count, len(self.shift_lengths()))
+        breaks = distributions(self.session.connection(), None, None,
+                               by='employee', kind='break')
+        # lunch breaks, mostly
+        median = max(breaks.values(), key=lambda sketch: sketch.count).median
+        self.assertTrue(15 * 60 <= median <= 90 * 60, median)
+
+    def test_flush_keeps_sketches(self):
+        """adding, editing and deleting shifts matches a rebuild"""
+        # the synthetic shifts, leaving the shared TESTDATA one alone
+        first_id = TESTDATA['clocktime'].id + 1
+        clocktime = self.session.query(Clocktime)\
+                                .filter(Clocktime.id >= first_id)\
+                                .order_by(Clocktime.id).first()
+        clocktime.time_out += timedelta(minutes=30)
+        moved = self.session.query(Clocktime).get(clocktime.id + 5)
+        moved.time_in -= timedelta(days=1)
+        moved.time_out -= timedelta(days=1)
+        self.session.delete(self.session.query(Clocktime)
+                            .get(clocktime.id + 9))
+        self.session.add(Clocktime(employee_id=2, job_id=1,
+                                   time_in=datetime(2014, 1, 11, 9),
+                                   time_out=datetime(2014, 1, 11, 12)))
+        self.session.flush()
+        incremental = self.stored()
+        durations.rebuild(self.session.connection())
+        self.assertEqual(self.stored(), incremental)
+
+    def test_date_range(self):
+        """only the days in range are merged"""
+        first_week = distributions(self.session.connection(),
+                                   date(2014, 1, 6), date(2014, 1, 13),
+                                   by=None)[None]
+        lengths = [clocktime.seconds_worked for clocktime in
+                   self.session.query(Clocktime)
+                   .filter(Clocktime.time_in < datetime(2014, 1, 13))]
+        self.assertEqual(first_week.count, len(lengths))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+from instrumentation import QueryCounter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Clocktime, Employee, Job, queries
+from tests.db import TestDBBase, TESTDATA
+import unittest
+
+
+class TestQueries(TestDBBase, unittest.TestCase):
+
+    def test_clocktimes_bounded_queries(self):
+        """Listing 10k clocktimes should issue at most 3 queries"""
+        # a separate database, so the employee and job aren't already
+        # sitting in the session's identity map
+        engine = create_engine('sqlite:///')
+        Base.metadata.create_all(engine)
+        # and many of each, since lazy loads of the same one are served
+        # from the identity map after the first
+        engine.execute(Employee.__table__.insert(), [
+            {'firstname': "Adam", 'lastname': str(i)} for i in range(100)])
+        engine.execute(Job.__table__.insert(), [
+            {'name': "Python Time", 'abbr': "PY{}".format(i), 'rate': 20000}
+            for i in range(100)])
+        start = datetime(2014, 9, 1, 8)
+        engine.execute(Clocktime.__table__.insert(), [
+            {'time_in': start + timedelta(hours=i),
+             'time_out': start + timedelta(hours=i, minutes=30),
+             'employee_id': i % 100 + 1, 'job_id': i % 97 + 1}
+            for i in range(10000)])
+        session = sessionmaker(bind=engine)()
+        with QueryCounter(engine) as counter:
+            lines = [str(clocktime) for clocktime in
+                     queries.clocktimes(session)]
+        self.assertEqual(len(lines), 10000)
+        self.assertIn("Employee: Adam 0, Job: PY0", lines[0])
+        self.assertLessEqual(counter.count, 3)
+
+    def test_clocktimes_filters(self):
+        """clocktimes should filter on time_in, employee and job"""
+        self.session.flush()
+        clocktime = TESTDATA['clocktime']
+        self.assertEqual(queries.clocktimes(
+            self.session, employee_id=TESTDATA['employee'].id).all(),
+            [clocktime])
+        self.assertEqual(queries.clocktimes(
+            self.session, start=clocktime.time_in + timedelta(seconds=1),
+            job_id=TESTDATA['job'].id).all(), [])
+
+if __name__ == "__main__":
+    unittest.main()
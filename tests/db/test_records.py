@@ -0,0 +1,55 @@
+from datetime import timedelta
+from instrumentation import QueryCounter
+from models import Clocktime, Employee, Job, queries, records
+from tests.db import TESTDATA
+from tests.db.synthetic import SyntheticDBBase
+import unittest
+
+
+class TestRecords(SyntheticDBBase, unittest.TestCase):
+
+    def test_clocktimes_match_orm(self):
+        """ClocktimeRecords should print and compute like Clocktimes"""
+        orm = queries.clocktimes(self.session).all()
+        with QueryCounter(self.session.get_bind()) as counter:
+            rows = records.clocktimes(self.session)
+        self.assertEqual(counter.count, 1)
+        self.assertEqual([str(row) for row in rows],
+                         [str(clocktime) for clocktime in orm])
+        self.assertEqual([(row.timeworked, row.seconds_worked, row.name,
+                           row.job.rate) for row in rows],
+                         [(clocktime.timeworked, clocktime.seconds_worked,
+                           clocktime.employee.name, clocktime.job.rate)
+                          for clocktime in orm])
+
+    def test_clocktimes_filters(self):
+        """clocktimes should filter like queries.clocktimes"""
+        clocktime = TESTDATA['clocktime']
+        rows = records.clocktimes(self.session,
+                                  employee_id=TESTDATA['employee'].id)
+        self.assertEqual([row.id for row in rows], [clocktime.id])
+        self.assertEqual(records.clocktimes(
+            self.session, start=clocktime.time_in + timedelta(seconds=1),
+            job_id=TESTDATA['job'].id), [])
+        start = self.session.query(Clocktime.time_in)\
+            .order_by(Clocktime.time_in).offset(50).limit(1).scalar()
+        self.assertEqual(
+            [row.id for row in records.clocktimes(self.session, end=start,
+                                                  job_id=2)],
+            [row.id for row in queries.clocktimes(self.session, end=start,
+                                                  job_id=2)])
+
+    def test_jobs_and_employees(self):
+        """jobs and employees should list every row, printed the same"""
+        self.assertEqual(
+            [str(job) for job in records.jobs(self.session)],
+            [str(job) for job in self.session.query(Job).order_by(Job.id)])
+        self.assertEqual(
+            [str(employee) for employee in records.employees(self.session)],
+            [str(employee) for employee in
+             self.session.query(Employee).order_by(Employee.id)])
+        self.session.add(Job(name="New", abbr="NEW", rate=100))
+        self.assertEqual(records.jobs(self.session)[-1].abbr, "NEW")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+from datetime import date, datetime, timedelta
+import os
+import shutil
+import tempfile
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from instrumentation import QueryCounter
+from models import Base, Clocktime, Employee, Job, rollup
+from models.reportcache import ReportCache
+import unittest
+
+DAY = date(2014, 9, 3)
+
+
+class TestReportCache(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add_all([
+            Job(id=1, name="Python Time", abbr="PYTIME", rate=20000),
+            Employee(id=1, firstname="Adam", lastname="Smith")])
+        self.add_shift(datetime(2014, 9, 3, 8), hours=8)
+        self.session.commit()
+        self.cache = ReportCache(maxsize=2)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(self.tmpdir)
+
+    def add_shift(self, time_in, hours):
+        self.session.add(Clocktime(employee_id=1, job_id=1, time_in=time_in,
+                                   time_out=time_in + timedelta(hours=hours)))
+
+    def totals(self, cache=None):
+        if cache is None:
+            cache = self.cache
+        return [(row.abbr, row.seconds) for row in
+                cache.totals(self.session, DAY, DAY + rollup.ONE_DAY)]
+
+    def test_hits(self):
+        """a repeat report costs one small query"""
+        self.assertEqual(self.totals(), [("PYTIME", 28800)])
+        self.session.commit()
+        with QueryCounter(self.engine, record=True) as counter:
+            self.assertEqual(self.totals(), [("PYTIME", 28800)])
+        self.assertEqual(counter.count, 1)
+        self.assertIn("change_counter", counter.statements[0])
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']),
+                         (1, 1, 1))
+        self.assertEqual(self.cache.week_totals(self.session, DAY)[0].seconds,
+                         28800)
+
+    def test_rebuilt_after_writes(self):
+        """any clocktime, job or employee commit makes reports stale"""
+        self.totals()
+        self.add_shift(datetime(2014, 9, 3, 18), hours=1)
+        # uncommitted changes are reported, but not cached
+        self.assertEqual(self.totals(), [("PYTIME", 32400)])
+        self.session.rollback()
+        self.assertEqual(self.totals(), [("PYTIME", 28800)])
+        self.assertEqual(self.cache.hits, 1)
+        self.session.query(Job).get(1).abbr = "PYT"
+        self.session.commit()
+        self.assertEqual(self.totals(), [("PYT", 28800)])
+        self.assertEqual(self.cache.stale, 1)
+
+    def test_lru(self):
+        """the least recently used report goes when the cache is full"""
+        for day in range(5):
+            self.cache.totals(self.session, date(2014, 9, day + 1),
+                              date(2014, 9, day + 2))
+        self.assertEqual(len(self.cache), 2)
+        self.cache.totals(self.session, date(2014, 9, 5), date(2014, 9, 6))
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_persisted(self):
+        """a cache with a path is shared with the next one, same data only"""
+        path = os.path.join(self.tmpdir, "reports.cache")
+        self.totals(ReportCache(path=path))
+        cache = ReportCache(path=path)
+        self.assertEqual(self.totals(cache), [("PYTIME", 28800)])
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        # another database at the same generation doesn't get them
+        other = create_engine('sqlite:///')
+        Base.metadata.create_all(other)
+        self.session.close()
+        self.session = sessionmaker(bind=other)()
+        cache = ReportCache(path=path)
+        self.assertEqual(self.totals(cache), [])
+        self.assertEqual(cache.misses, 1)
+    def test_save_fails(self):
+        """a cache that can't be written is logged, not raised"""
+        path = os.path.join(self.tmpdir, "missing", "reports.cache")
+        self.assertEqual(self.totals(ReportCache(path=path)),
+                         [("PYTIME", 28800)])
+        path = os.path.join(self.tmpdir, "reports.cache")
+        self.totals(ReportCache(path=path))
+        self.assertEqual(os.listdir(self.tmpdir), ["reports.cache"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from instrumentation import QueryCounter
+from models import Base, Job
+from models.search import EXACT, JobIndex, trigrams
+import unittest
+
+
+class TestJobIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add_all([
+            Job(id=1, name="Python Time", abbr="PYTIME", rate=20000),
+            Job(id=2, name="Pyramid Website", abbr="PYRWEB", rate=15000),
+            Job(id=3, name="Warehouse Inventory", abbr="WHINV", rate=9000),
+            Job(id=4, name="Website Redesign", abbr="WEBRD", rate=12000)])
+        self.session.commit()
+        self.index = JobIndex()
+
+    def tearDown(self):
+        self.session.close()
+
+    def abbrs(self, text, **kwargs):
+        return [candidate.abbr for candidate in
+                self.index.search(self.session, text, **kwargs)]
+
+    def test_trigrams(self):
+        self.assertEqual(trigrams("Ab"), set([u"  a", u" ab", u"ab "]))
+
+    def test_lazy_load(self):
+        """the index should load with one query, on first use only"""
+        self.assertEqual(len(self.index), 0)
+        with QueryCounter(self.engine) as counter:
+            self.abbrs("py")
+            self.abbrs("web")
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(len(self.index), 4)
+
+    def test_ranking(self):
+        """exact abbr, then abbr prefixes, then name prefixes, then fuzzy"""
+        self.assertEqual(self.abbrs("pytime"), ["PYTIME"])
+        self.assertEqual(self.index.search(self.session, "PYTIME")[0].score,
+                         EXACT)
+        self.assertEqual(self.abbrs("py"), ["PYRWEB", "PYTIME"])
+        # WEBRD's abbr, then the names with a word starting "web"
+        self.assertEqual(self.abbrs("web"), ["WEBRD", "PYRWEB"])
+        self.assertEqual(self.abbrs("inventory"), ["WHINV"])
+        self.assertEqual(self.abbrs("warehose invntory"), ["WHINV"])
+        self.assertEqual(self.abbrs("zzzz"), [])
+        self.assertEqual(self.abbrs(""), [])
+        self.assertEqual(self.abbrs("py", limit=1), ["PYRWEB"])
+
+    def test_incremental(self):
+        """committed jobs should be added, changed and removed in place"""
+        self.abbrs("py")
+        self.session.add(Job(id=5, name="Python Training", abbr="PYTRAIN",
+                             rate=0))
+        self.session.flush()
+        self.assertNotIn("PYTRAIN", self.abbrs("pytr"))  # not committed
+        self.session.commit()
+        with QueryCounter(self.engine) as counter:
+            self.assertEqual(self.abbrs("pytr")[0], "PYTRAIN")
+        self.assertEqual(counter.count, 0)
+        job = self.session.query(Job).get(3)
+        job.abbr, job.name = "STOCK", "Stock Count"
+        self.session.commit()
+        self.assertEqual(self.abbrs("whinv"), [])
+        self.assertEqual(self.abbrs("stock"), ["STOCK"])
+        self.session.delete(self.session.query(Job).get(5))
+        self.session.commit()
+        self.assertNotIn("PYTRAIN", self.abbrs("pytr"))
+        self.session.add(Job(id=6, name="Gone", abbr="GONE", rate=0))
+        self.session.rollback()
+        self.assertEqual(self.abbrs("gone"), [])
+
+if __name__ == "__main__":
+    unittest.main()
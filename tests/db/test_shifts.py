@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from instrumentation import QueryCounter
+from models import Base, Clocktime, Employee, Job, changes
+from models.shifts import ShiftRegistry
+import os
+import shutil
+import tempfile
+import unittest
+
+NOW = datetime(2014, 9, 1, 12)
+
+
+class TestShiftRegistry(unittest.TestCase):
+
+    def setUp(self):
+        # committed data of its own, rather than the shared TESTDATA
+        self.engine = create_engine('sqlite:///')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add_all([Job(id=1, name="Python Time", abbr="PYTIME",
+                                  rate=20000),
+                              Employee(id=1, firstname="Adam",
+                                       lastname="Smith"),
+                              Employee(id=2, firstname="Eve",
+                                       lastname="Jones"),
+                              Clocktime(employee_id=1, job_id=1,
+                                        time_in=NOW - timedelta(hours=9),
+                                        time_out=NOW - timedelta(hours=1))])
+        self.session.commit()
+        self.registry = ShiftRegistry()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_kept_in_sync(self):
+        """Commits should update the registry, checked with one query"""
+        self.assertIsNone(self.registry.current(self.session, 1))
+        clocktime = Clocktime(employee_id=1, job_id=1, time_in=NOW)
+        self.session.add(clocktime)
+        self.session.flush()
+        self.assertIsNone(self.registry.current(self.session, 1))
+        self.session.commit()
+        with QueryCounter(self.engine) as counter:
+            shift = self.registry.current(self.session, 1)
+            self.assertEqual(self.registry.on_the_clock(self.session),
+                             [shift])
+        # the change sequence number, nothing more
+        self.assertEqual(counter.count, 1)
+        self.assertEqual((shift.employee_id, shift.job_id, shift.time_in),
+                         (1, 1, NOW))
+
+        clocktime.time_out = NOW + timedelta(hours=1)
+        self.session.flush()
+        self.session.rollback()
+        self.assertEqual(self.registry.current(self.session, 1), shift)
+        clocktime = self.session.query(Clocktime).get(shift.clocktime_id)
+        clocktime.time_out = NOW + timedelta(hours=1)
+        self.session.commit()
+        self.assertEqual(self.registry.on_the_clock(self.session), [])
+
+    def test_punch_from_elsewhere(self):
+        """Punches committed by another connection are seen next time"""
+        tmpdir = tempfile.mkdtemp()
+        engine = create_engine('sqlite:///{}'.format(
+            os.path.join(tmpdir, 'timesheet.db')))
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        session.add_all([Job(id=1, name="Python Time", abbr="PYTIME",
+                             rate=20000),
+                         Employee(id=1, firstname="Adam", lastname="Smith")])
+        session.commit()
+        clocktimes = Clocktime.__table__
+        try:
+            self.assertIsNone(self.registry.current(session, 1))
+            session.commit()
+            # as the punch daemon or another terminal would
+            with engine.begin() as connection:
+                seq = changes.next_sequence(connection)
+                clocktime_id = connection.execute(clocktimes.insert().values(
+                    employee_id=1, job_id=1, time_in=NOW,
+                    change_seq=seq)).inserted_primary_key[0]
+            shift = self.registry.current(session, 1)
+            self.assertEqual((shift.clocktime_id, shift.time_in),
+                             (clocktime_id, NOW))
+            session.commit()
+            with engine.begin() as connection:
+                seq = changes.next_sequence(connection)
+                connection.execute(clocktimes.update().values(
+                    time_out=NOW + timedelta(hours=1), change_seq=seq))
+            self.assertEqual(self.registry.on_the_clock(session), [])
+        finally:
+            session.close()
+            engine.dispose()
+            shutil.rmtree(tmpdir)
+
+    def test_close_stale(self):
+        """Old and duplicate open shifts should be found and closed"""
+        self.session.add_all([
+            Clocktime(employee_id=1, job_id=1,
+                      time_in=NOW - timedelta(hours=3)),
+            Clocktime(employee_id=1, job_id=1,
+                      time_in=NOW - timedelta(hours=2)),
+            Clocktime(employee_id=2, job_id=1,
+                      time_in=NOW - timedelta(hours=20))])
+        self.session.commit()
+        self.assertEqual(len(self.registry.on_the_clock(self.session)), 2)
+        stale = self.registry.stale(self.session, now=NOW)
+        self.assertEqual([(shift.employee_id, shift.time_in)
+                          for shift in stale],
+                         [(2, NOW - timedelta(hours=20)),
+                          (1, NOW - timedelta(hours=3))])
+        self.assertEqual(self.registry.close_stale(self.session, now=NOW),
+                         stale)
+        self.session.commit()
+        self.assertEqual(self.registry.stale(self.session, now=NOW), [])
+        self.assertEqual(
+            [shift.time_in for shift in
+             self.registry.on_the_clock(self.session)],
+            [NOW - timedelta(hours=2)])
+        closed = self.session.query(Clocktime)\
+                             .get(stale[0].clocktime_id)
+        self.assertEqual(closed.time_out, closed.time_in)
+        fresh = ShiftRegistry()
+        self.assertEqual(fresh.on_the_clock(self.session),
+                         self.registry.on_the_clock(self.session))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from audit import audit
+from models import Base, Clocktime, DailyTotal
+from models.rollup import rebuild
+from tests.db.synthetic import SyntheticDBBase, generate
+import unittest
+
+
+class TestSynthetic(SyntheticDBBase, unittest.TestCase):
+
+    def rows(self):
+        clocktimes = Clocktime.__table__
+        return self.session.execute(
+            select([clocktimes.c.employee_id, clocktimes.c.job_id,
+                    clocktimes.c.time_in, clocktimes.c.time_out])
+            .where(clocktimes.c.employee_id > 1)
+            .order_by(clocktimes.c.id)).fetchall()
+
+    def test_same_seed_same_rows(self):
+        """the same seed should generate the same rows again"""
+        engine = create_engine('sqlite:///')
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        session.execute("INSERT INTO employees (id) VALUES (1)")
+        session.execute("INSERT INTO jobs (id) VALUES (1)")
+        generate(session.connection(), **self.SYNTHETIC)
+        self.assertEqual(len(self.rows()), self.clocktimes)
+        clocktimes = Clocktime.__table__
+        other = session.execute(
+            select([clocktimes.c.employee_id, clocktimes.c.job_id,
+                    clocktimes.c.time_in, clocktimes.c.time_out])
+            .order_by(clocktimes.c.id)).fetchall()
+        self.assertEqual(other, self.rows())
+
+    def test_no_overlaps(self):
+        """no employee's generated shifts should overlap"""
+        issues = list(audit(self.session.connection()))
+        self.assertEqual([], [issue for issue in issues
+                              if issue.kind != 'gap'])
+
+    def test_shapes(self):
+        """there should be night shifts, breaks and weekends off"""
+        rows = self.rows()
+        self.assertTrue(any(time_in.date() != time_out.date()
+                            for _, _, time_in, time_out in rows))
+        # a break splits a day into more than one clocktime
+        days = set((employee_id, time_in.date())
+                   for employee_id, _, time_in, _ in rows)
+        self.assertLess(len(days), len(rows))
+        # weekends off, but for Friday night shifts running into Saturday
+        self.assertTrue(all(time_in.weekday() < 5 or time_in.hour < 12
+                            for _, _, time_in, _ in rows))
+
+    def test_rollup_matches(self):
+        """generate should fill daily_totals as a rebuild would"""
+        totals = DailyTotal.__table__
+        query = select([totals.c.date, totals.c.employee_id,
+                        totals.c.job_id, totals.c.seconds])\
+            .where(totals.c.employee_id > 1)\
+            .order_by(totals.c.date, totals.c.employee_id, totals.c.job_id)
+        generated = self.session.execute(query).fetchall()
+        self.session.flush()
+        rebuild(self.session.connection())
+        self.assertEqual(generated, self.session.execute(query).fetchall())
+        self.assertGreater(self.session.query(
+            func.count(DailyTotal.date)).scalar(), 0)
+
+if __name__ == "__main__":
+    unittest.main()
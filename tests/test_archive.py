@@ -0,0 +1,107 @@
+from datetime import date, datetime, timedelta
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import archive
+import batch
+import csvio
+import payroll
+from models import Base, Clocktime, DailySketch, DailyTotal, Employee, Job, \
+    durations
+
+START = datetime(2012, 12, 30, 8)
+
+
+class Test_Archive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'timesheet.db')
+        self.engine = create_engine('sqlite:///{}'.format(self.path))
+        Base.metadata.create_all(self.engine)
+        session = sessionmaker(bind=self.engine)()
+        session.add_all([Job(id=1, name="Python Time", abbr="PYTIME",
+                             rate=20000),
+                         Employee(id=1, firstname="Adam", lastname="Smith")])
+        # a shift a week from 2012-12-30 through 2014-02-02, then an open one
+        for week in range(58):
+            time_in = START + timedelta(weeks=week)
+            session.add(Clocktime(employee_id=1, job_id=1, time_in=time_in,
+                                  time_out=time_in + timedelta(hours=8)))
+        session.add(Clocktime(employee_id=1, job_id=1,
+                              time_in=START + timedelta(weeks=58)))
+        session.commit()
+        session.close()
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def reports(self):
+        with self.engine.connect() as connection:
+            csv_file = StringIO()
+            csvio.export_csv(connection, csv_file)
+            return (csv_file.getvalue(),
+                    payroll.payroll(connection, period='month'),
+                    len(batch.load_arrays(connection,
+                                          datetime(2013, 6, 1))['rate']))
+
+    def test_archive(self):
+        """archived rows leave the hot file but stay in every report"""
+        before = self.reports()
+        moved = archive.archive(self.engine, datetime(2014, 1, 1),
+                                chunk_size=7)
+        self.assertEqual(moved, {2012: 1, 2013: 52})
+        self.assertEqual(archive.archive_years(self.path), [2012, 2013])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.tmpdir, 'timesheet-2013.db')))
+        hot = self.engine.execute("SELECT count(*) FROM clocktimes")
+        self.assertEqual(hot.scalar(), 6)
+        self.assertEqual(self.reports(), before)
+        self.assertEqual(self.engine.execute(
+            "SELECT sum(seconds) FROM daily_totals").scalar(), 58 * 8 * 3600)
+        with self.engine.connect() as connection:
+            recent = archive.clocktimes(connection, datetime(2014, 1, 1))
+            self.assertIs(recent, Clocktime.__table__)
+        self.assertEqual(archive.archive(self.engine, datetime(2014, 1, 1)),
+                         {})
+
+    def test_newest_stays(self):
+        """the newest clocktime is never archived, even if it's closed"""
+        self.engine.execute("DELETE FROM clocktimes WHERE time_out IS NULL")
+        moved = archive.archive(self.engine, datetime(2015, 1, 1))
+        self.assertEqual(sum(moved.values()), 57)
+        self.assertEqual(self.engine.execute(
+            "SELECT count(*) FROM clocktimes").scalar(), 1)
+    def test_durations(self):
+        """archived days keep their sketches when a day next to them changes"""
+        def sketches():
+            return sorted(self.engine.execute(
+                DailySketch.__table__.select()).fetchall())
+
+        archive.archive(self.engine, datetime(2014, 1, 1))
+        # the day after the last archived shift, 2013-12-29
+        session = sessionmaker(bind=self.engine)()
+        session.add(Clocktime(employee_id=1, job_id=1,
+                              time_in=datetime(2013, 12, 30, 8),
+                              time_out=datetime(2013, 12, 30, 12)))
+        session.commit()
+        session.close()
+        with self.engine.connect() as connection:
+            shifts = durations.distributions(connection, None, None, by=None)
+            self.assertEqual(shifts[None].count, 59)
+            last = durations.distributions(
+                connection, date(2013, 12, 29), date(2013, 12, 30))
+            self.assertEqual(last[1].median, durations.bin_value(
+                durations.bin_of(8 * 3600)))
+        incremental = sketches()
+        with self.engine.begin() as connection:
+            durations.rebuild(connection)
+        self.assertEqual(sketches(), incremental)
+
+if __name__ == "__main__":
+    unittest.main()
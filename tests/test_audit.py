@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import audit
+from models import Base, Clocktime, Employee, Job
+import unittest
+
+DAY = datetime(2014, 9, 1)
+
+
+def hours(start, end=None):
+    return (DAY + timedelta(hours=start),
+            None if end is None else DAY + timedelta(hours=end))
+
+
+class Test_Audit(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///')
+        Base.metadata.create_all(self.engine)
+        session = sessionmaker(bind=self.engine)()
+        session.add_all([Job(id=1, name="Python Time", abbr="PYTIME",
+                             rate=20000),
+                         Employee(id=1, firstname="Adam", lastname="Smith"),
+                         Employee(id=2, firstname="Eve", lastname="Jones")])
+        shifts = [(1, 8, 12), (1, 11, 13), (1, 12.5, 14), (1, 17, 18),
+                  (1, 19, 19), (2, 8, 17), (2, 20, None), (2, 21, 22)]
+        for id_, (employee_id, start, end) in enumerate(shifts, 1):
+            time_in, time_out = hours(start, end)
+            session.add(Clocktime(id=id_, employee_id=employee_id, job_id=1,
+                                  time_in=time_in, time_out=time_out))
+        session.commit()
+        session.close()
+
+    def test_audit(self):
+        """audit should find overlaps, long gaps and empty shifts"""
+        issues = list(audit.audit(self.engine, max_gap=timedelta(hours=2)))
+        self.assertEqual(
+            [(issue.kind, issue.clocktime_id, issue.other_id)
+             for issue in issues],
+            [('overlap', 2, 1), ('overlap', 3, 2), ('gap', 4, 3),
+             ('duration', 5, None), ('gap', 7, 6), ('overlap', 8, 7)])
+        self.assertEqual((issues[0].start, issues[0].end), hours(11, 12))
+        self.assertEqual((issues[2].start, issues[2].end), hours(14, 17))
+        self.assertEqual(issues[-1].end, hours(0, 22)[1])
+        self.assertEqual(len(list(audit.audit(self.engine,
+                                              employee_id=2))), 1)
+
+    def test_check_interval(self):
+        """check_interval should find the shifts a new one would overlap"""
+        check = lambda *args, **kwargs: [
+            (issue.kind, issue.other_id) for issue in
+            audit.check_interval(self.engine, *args, **kwargs)]
+        self.assertEqual(check(2, *hours(17, 19)), [])
+        self.assertEqual(check(2, *hours(7, 9)), [('overlap', 6)])
+        self.assertEqual(check(2, *hours(16, 23)),
+                         [('overlap', 6), ('overlap', 7)])
+        self.assertEqual(check(2, *hours(20.5, 20.75)), [('overlap', 7)])
+        self.assertEqual(check(2, *hours(9, 8)), [('duration', None)])
+        self.assertEqual(check(2, *hours(8, 16), clocktime_id=6), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from models import Clocktime, Job
+from tests.db import TestDBBase, TESTDATA
+import random
+import unittest
+import batch
+import tc
+
+
+class Test_Batch(TestDBBase, unittest.TestCase):
+
+    def test_matches_scalar(self):
+        """batch rounding and pay should match tc exactly"""
+        rng = random.Random(0)
+        seconds = [rng.randint(0, 86400) for _ in range(5000)] + \
+                  [0, 179, 180, 359, 360, 540]
+        rates = [rng.randint(0, 10000) for _ in seconds]
+        self.assertEqual(list(batch.round_to_nearest(seconds)),
+                         [tc.round_to_nearest(s, 360) for s in seconds])
+        self.assertEqual([t / 10.0 for t in batch.tenths(seconds)],
+                         [tc.hours_worked(s) for s in seconds])
+        self.assertEqual(list(batch.pay_cents(seconds, rates)),
+                         [tc.pay_cents(s, r) for s, r in zip(seconds, rates)])
+
+    def test_aggregate(self):
+        """aggregate should total per employee and job from the database"""
+        clocktime = TESTDATA['clocktime']
+        self.session.flush()
+        self.session.add(Clocktime(
+            time_in=clocktime.time_in, employee_id=TESTDATA['employee'].id,
+            job_id=TESTDATA['job'].id))  # open shifts are skipped
+        self.session.flush()
+        arrays = batch.load_arrays(self.session.connection())
+        totals = batch.aggregate(arrays)
+        key = (TESTDATA['employee'].id, TESTDATA['job'].id)
+        seconds = clocktime.seconds_worked
+        self.assertEqual(totals, {key: (
+            seconds, tc.round_to_nearest(seconds, 360) // 360,
+            tc.pay_cents(seconds, TESTDATA['job'].rate))})
+        self.assertEqual(batch.by_employee(totals),
+                         {key[0]: totals[key]})
+        self.assertEqual(batch.aggregate(batch.load_arrays(
+            self.session.connection(),
+            start=clocktime.time_in + timedelta(seconds=1))), {})
+
+    def test_matches_objects(self):
+        """aggregate should match tc's arithmetic on each Clocktime"""
+        self.session.flush()
+        rng = random.Random(0)
+        for _ in range(100):
+            time_in = datetime(2014, 9, 1) + timedelta(
+                seconds=rng.randint(0, 30 * 86400),
+                microseconds=rng.randint(0, 999999))
+            self.session.add(Clocktime(
+                employee_id=TESTDATA['employee'].id,
+                job_id=TESTDATA['job'].id, time_in=time_in,
+                time_out=time_in + timedelta(
+                    seconds=rng.randint(0, 40000),
+                    microseconds=rng.randint(0, 999999))))
+        # 179.8 s across midnight, which is 180 whole seconds
+        self.session.add(Clocktime(
+            employee_id=TESTDATA['employee'].id, job_id=TESTDATA['job'].id,
+            time_in=datetime(2014, 8, 31, 23, 57, 0, 600000),
+            time_out=datetime(2014, 9, 1, 0, 0, 0, 400000)))
+        self.session.flush()
+        expected = [0, 0, 0]
+        for clocktime in self.session.query(Clocktime):
+            seconds = int(clocktime.timeworked.total_seconds())
+            expected[0] += seconds
+            expected[1] += tc.round_to_nearest(seconds, 360) // 360
+            expected[2] += tc.pay_cents(seconds, clocktime.job.rate)
+        totals = batch.aggregate(batch.load_arrays(self.session.connection()))
+        self.assertEqual(totals, {(TESTDATA['employee'].id,
+                                   TESTDATA['job'].id): tuple(expected)})
+
+    def test_nulls(self):
+        """shifts with no employee, or a job with no rate, still load"""
+        clocktime = TESTDATA['clocktime']
+        job = Job(name="Unpriced", abbr="NORATE")
+        self.session.add(job)
+        self.session.flush()
+        for employee_id, job_id in ((None, TESTDATA['job'].id),
+                                    (TESTDATA['employee'].id, job.id)):
+            self.session.add(Clocktime(
+                employee_id=employee_id, job_id=job_id,
+                time_in=clocktime.time_in, time_out=clocktime.time_out))
+        self.session.flush()
+        totals = batch.aggregate(batch.load_arrays(self.session.connection()))
+        seconds = clocktime.seconds_worked
+        tenths = tc.round_to_nearest(seconds, 360) // 360
+        self.assertEqual(totals[(0, TESTDATA['job'].id)],
+                         (seconds, tenths,
+                          tc.pay_cents(seconds, TESTDATA['job'].rate)))
+        self.assertEqual(totals[(TESTDATA['employee'].id, job.id)],
+                         (seconds, tenths, 0))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+from StringIO import StringIO
+from sqlalchemy import create_engine
+from models import Base, Clocktime, DailyTotal, Employee, Job
+from tests.db import TestDBBase, TESTDATA
+import csv
+import csvio
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class Test_CSVIO(TestDBBase, unittest.TestCase):
+
+    def export(self, **filters):
+        self.session.flush()
+        out = StringIO()
+        count = csvio.export_csv(self.session.connection(), out,
+                                 batch_size=1, **filters)
+        return count, list(csv.DictReader(StringIO(out.getvalue())))
+
+    def test_export_csv(self):
+        """export_csv should write one row per matching clocktime"""
+        count, rows = self.export()
+        self.assertEqual(count, 1)
+        self.assertEqual(rows[0]['employee'], "Adam Smith")
+        self.assertEqual(rows[0]['job_abbr'], "PYTIME")
+        self.assertEqual(rows[0]['hours'], "2.0")
+        self.assertEqual(csvio.parse_datetime(rows[0]['time_in']),
+                         TESTDATA['clocktime'].time_in)
+        count, rows = self.export(
+            start=TESTDATA['clocktime'].time_in + timedelta(seconds=1))
+        self.assertEqual((count, rows), (0, []))
+        count, rows = self.export(job_id=TESTDATA['job'].id + 1)
+        self.assertEqual(count, 0)
+
+    def test_import_csv(self):
+        """import_csv should load what export_csv writes, with totals"""
+        count, rows = self.export()
+        engine = create_engine('sqlite:///')
+        Base.metadata.create_all(engine)
+        engine.execute(Employee.__table__.insert(),
+                       firstname="Adam", lastname="Smith")
+        engine.execute(Job.__table__.insert(),
+                       name="Python Time", abbr="PYTIME", rate=20000)
+        out = StringIO()
+        csv.DictWriter(out, csvio.FIELDS).writeheader()
+        csv.DictWriter(out, csvio.FIELDS).writerows(rows * 3)
+        out.seek(0)
+        self.assertEqual(csvio.import_csv(engine, out, chunk_size=2), 3)
+        self.assertEqual(engine.execute(
+            "SELECT count(*) FROM clocktimes").scalar(), 3)
+        self.assertEqual(engine.execute(
+            "SELECT sum(seconds) FROM daily_totals").scalar(),
+            3 * TESTDATA['clocktime'].seconds_worked)
+
+    def test_import_unknown_job(self):
+        """import_csv should name the line with an unknown job"""
+        engine = create_engine('sqlite:///')
+        Base.metadata.create_all(engine)
+        out = StringIO("employee,job_abbr,time_in,time_out\n"
+                       "Adam Smith,NOPE,2014-09-01 08:00:00,\n")
+        self.assertRaisesRegexp(ValueError, "Line 2", csvio.import_csv,
+                                engine, out)
+
+    def test_import_bad_timestamp(self):
+        """a bad row fails the whole import, naming its line"""
+        engine = create_engine('sqlite:///')
+        Base.metadata.create_all(engine)
+        engine.execute(Employee.__table__.insert(),
+                       firstname="Adam", lastname="Smith")
+        engine.execute(Job.__table__.insert(),
+                       name="Python Time", abbr="PYTIME", rate=20000)
+        out = StringIO("employee,job_abbr,time_in,time_out\n" +
+                       "Adam Smith,PYTIME,2014-09-01 08:00:00,\n" * 3 +
+                       "Adam Smith,PYTIME,yesterday,\n")
+        self.assertRaisesRegexp(ValueError, "Line 5: Unrecognized timestamp",
+                                csvio.import_csv, engine, out, chunk_size=2)
+        self.assertEqual(engine.execute(
+            "SELECT count(*) FROM clocktimes").scalar(), 0)
+
+    def test_main_end_inclusive(self):
+        """csvio export --end includes that day, as tc.py export does"""
+        self.session.flush()
+        tmpdir = tempfile.mkdtemp()
+        old_get_engine = csvio.get_engine
+        csvio.get_engine = self.session.get_bind
+        try:
+            path = os.path.join(tmpdir, "out.csv")
+            today = str(TESTDATA['clocktime'].time_in.date())
+            csvio.main(['export', path, '--start', today, '--end', today])
+            with open(path, 'rb') as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 1)
+        finally:
+            csvio.get_engine = old_get_engine
+            shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+import database
+from models import Base, Employee
+
+
+class Test_Database(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'timesheet.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_pragmas(self):
+        """make_engine should set WAL, synchronous and busy_timeout"""
+        engine = database.make_engine(self.path, busy_timeout=1234)
+        self.assertEqual(engine.execute("PRAGMA journal_mode").scalar(),
+                         'wal')
+        self.assertEqual(engine.execute("PRAGMA synchronous").scalar(), 1)
+        self.assertEqual(engine.execute("PRAGMA busy_timeout").scalar(),
+                         1234)
+        engine.dispose()
+
+    def test_transaction_retries(self):
+        """transaction should rerun the work only while the db is locked"""
+        session = sessionmaker(bind=database.make_engine(self.path))()
+        calls = []
+
+        def work(session):
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError("INSERT", {}, sqlite3.OperationalError(
+                    "database is locked"))
+            return len(calls)
+        self.assertEqual(database.transaction(session, work, backoff=0), 3)
+        del calls[:]
+        self.assertRaises(OperationalError, database.transaction, session,
+                          work, retries=1, backoff=0)
+        self.assertEqual(len(calls), 2)
+
+        def broken(session):
+            calls.append(1)
+            raise OperationalError("INSERT", {}, sqlite3.OperationalError(
+                "no such table: employees"))
+        del calls[:]
+        self.assertRaises(OperationalError, database.transaction, session,
+                          broken, backoff=0)
+        self.assertEqual(len(calls), 1)
+
+    def test_transaction_waits_for_writer(self):
+        """a commit blocked by another writer should retry until it's done"""
+        engine = database.make_engine(self.path, busy_timeout=20)
+        Base.metadata.create_all(engine)
+        blocker = sqlite3.connect(self.path, check_same_thread=False)
+        blocker.isolation_level = None
+        blocker.execute("BEGIN IMMEDIATE")
+        timer = threading.Timer(0.2, blocker.execute, ["COMMIT"])
+        timer.start()
+        session = sessionmaker(bind=engine)()
+
+        def work(session):
+            session.add(Employee(firstname="Adam", lastname="Smith"))
+        database.transaction(session, work, retries=10, backoff=0.02)
+        timer.join()
+        blocker.close()
+        self.assertEqual(session.query(Employee).count(), 1)
+        session.close()
+        engine.dispose()
+
+if __name__ == "__main__":
+    unittest.main()
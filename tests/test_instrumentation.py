@@ -0,0 +1,80 @@
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+import instrumentation
+from instrumentation import Histogram, QueryCounter, instrumented, timer
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class Test_Instrumentation(unittest.TestCase):
+
+    def test_query_counter(self):
+        """QueryCounter should count statements only while active"""
+        engine = create_engine('sqlite:///')
+        with QueryCounter(engine, record=True) as counter:
+            engine.execute("SELECT 1")
+            with counter.operation('two'):
+                engine.execute("SELECT 2")
+                engine.execute("SELECT 3")
+        engine.execute("SELECT 4")
+        self.assertEqual(counter.count, 3)
+        self.assertEqual(dict(counter.by_operation), {'two': 2})
+        self.assertEqual(counter.statements,
+                         ["SELECT 1", "SELECT 2", "SELECT 3"])
+
+    def test_histogram(self):
+        """Histogram should count timings into millisecond buckets"""
+        histogram = Histogram()
+        for seconds in (0.00005, 0.0003, 0.0003, 1000):
+            histogram.add(seconds)
+        result = histogram.as_dict()
+        self.assertEqual(result['count'], 4)
+        self.assertEqual(result['max_ms'], 1000000)
+        self.assertEqual(result['buckets'], [[0.1, 1], [0.4, 2], [None, 1]])
+
+
+class Test_Instrumented(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stats = os.path.join(self.directory, "stats.json")
+        self.slow_log = os.path.join(self.directory, "slow.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_disabled(self):
+        """timer should be a no-op outside instrumented()"""
+        self.assertIsNone(instrumentation.STATS)
+        with timer('nothing') as recorder:
+            self.assertIsNone(recorder)
+
+    def test_instrumented(self):
+        """instrumented() should time blocks and SQL, and dump them"""
+        engine = create_engine('sqlite:///')
+        with instrumented(engine, self.stats, self.slow_log,
+                          slow_threshold=0) as stats:
+            with timer('work'):
+                engine.execute("SELECT 1")
+                self.assertRaises(OperationalError, engine.execute,
+                                  "SELECT nonsense")
+            stats.count('things', 2)
+        engine.execute("SELECT 2")
+        self.assertIsNone(instrumentation.STATS)
+        with open(self.stats) as f:
+            result = json.load(f)
+        self.assertEqual(result['counters'],
+                         {'things': 2, 'sql errors': 1})
+        self.assertEqual(result['histograms']['work']['count'], 1)
+        self.assertEqual(result['histograms']['sql']['count'], 1)
+        self.assertEqual(result['histograms']['sql: SELECT 1']['count'], 1)
+        with open(self.slow_log) as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn("SELECT 1", lines[0])
+
+if __name__ == "__main__":
+    unittest.main()
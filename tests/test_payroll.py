@@ -0,0 +1,97 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from models import Clocktime, DailyTotal, Job
+from tests.db import TestDBBase, TESTDATA
+import payroll
+import random
+import tc
+import unittest
+
+
+class Test_Payroll(TestDBBase, unittest.TestCase):
+
+    def setUp(self):
+        super(Test_Payroll, self).setUp()
+        self.session.flush()
+        other = Job(name="Other", abbr="OTHER", rate=1555)
+        self.session.add(other)
+        self.session.flush()
+        rng = random.Random(0)
+        for i in range(200):
+            time_in = datetime(2014, 9, 1, 8) + timedelta(
+                hours=rng.randint(0, 24 * 60), seconds=rng.randint(0, 3599),
+                microseconds=rng.randint(0, 999999))
+            self.session.add(Clocktime(
+                time_in=time_in,
+                time_out=time_in + timedelta(
+                    seconds=rng.randint(0, 40000),
+                    microseconds=rng.randint(0, 999999)),
+                employee_id=TESTDATA['employee'].id,
+                job_id=rng.choice([TESTDATA['job'].id, other.id])))
+        # 179.8 s from the microseconds, across midnight: 180 whole seconds
+        self.boundary = Clocktime(
+            time_in=datetime(2014, 8, 31, 23, 57, 0, 600000),
+            time_out=datetime(2014, 9, 1, 0, 0, 0, 400000),
+            employee_id=TESTDATA['employee'].id, job_id=other.id)
+        self.session.add(self.boundary)
+        self.session.flush()
+
+    def test_payroll(self):
+        """payroll should match totals computed from Clocktime objects"""
+        expected = defaultdict(lambda: [0, 0, 0, 0])
+        for clocktime in self.session.query(Clocktime):
+            time_in = clocktime.time_in
+            monday = time_in.date() - timedelta(days=time_in.weekday())
+            total = expected[(monday, clocktime.employee_id,
+                              clocktime.job_id)]
+            seconds = int(clocktime.timeworked.total_seconds())
+            total[0] += 1
+            total[1] += seconds
+            total[2] += tc.round_to_nearest(seconds, 360) // 360
+            total[3] += tc.pay_cents(seconds, clocktime.job.rate)
+        lines = payroll.payroll(self.session.connection())
+        self.assertEqual(
+            {(l.period, l.employee_id, l.job_id): list(l[3:]) for l in lines},
+            dict(expected))
+        self.assertEqual(sum(l.cents for l in lines), sum(
+            l.cents for l in payroll.billing(self.session.connection())))
+
+    def test_payroll_filters(self):
+        """payroll should honour the date range and period arguments"""
+        lines = payroll.payroll(self.session.connection(),
+                                start=datetime(2014, 9, 1),
+                                end=datetime(2014, 9, 2), period=None)
+        self.assertEqual({l.period for l in lines}, {None})
+        self.assertEqual(
+            sum(l.shifts for l in lines),
+            self.session.query(Clocktime)
+                .filter(Clocktime.time_in >= datetime(2014, 9, 1),
+                        Clocktime.time_in < datetime(2014, 9, 2)).count())
+        lines = payroll.payroll(self.session.connection(), period='month')
+        self.assertEqual({l.period.day for l in lines}, {1})
+        self.assertRaises(ValueError, payroll.payroll,
+                          self.session.connection(), period='fortnight')
+
+    def test_boundary(self):
+        """every total counts a shift's whole seconds the same way"""
+        self.assertEqual(self.boundary.seconds_worked, 180)
+        self.assertEqual(tc.hours_worked(self.boundary.seconds_worked), 0.1)
+        lines = payroll.payroll(self.session.connection(),
+                                end=datetime(2014, 9, 1), period=None)
+        self.assertEqual([(l.seconds, l.tenths) for l in lines], [(180, 1)])
+        # the day's whole rollup, as the day's only shift
+        self.assertEqual(self.session.query(DailyTotal.seconds)
+                         .filter(DailyTotal.date == date(2014, 8, 31))
+                         .scalar(), 180)
+
+    def test_overtime(self):
+        """overtime should pay the premium on hours over the threshold"""
+        lines = [payroll.PayrollLine(date(2014, 9, 1), 1, 1, 5, 0, 300, 30000),
+                 payroll.PayrollLine(date(2014, 9, 1), 1, 2, 2, 0, 150, 30000),
+                 payroll.PayrollLine(date(2014, 9, 1), 2, 1, 4, 0, 400, 40000)]
+        self.assertEqual(payroll.overtime(lines), [
+            payroll.Overtime(date(2014, 9, 1), 1, 450, 50, 3333),
+            payroll.Overtime(date(2014, 9, 1), 2, 400, 0, 0)])
+
+if __name__ == "__main__":
+    unittest.main()
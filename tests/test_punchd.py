@@ -0,0 +1,99 @@
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from sqlalchemy.orm import sessionmaker
+import database
+import punchd
+from models import Base, Clocktime, DailyTotal, Employee, Job, cache
+
+
+class Test_Punchd(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.engine = database.make_engine(
+            os.path.join(self.tmpdir, 'timesheet.db'))
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add(Job(id=1, name="Python Time", abbr="PYTIME",
+                             rate=20000))
+        self.session.add_all([Employee(id=i, firstname="Worker",
+                                       lastname=str(i))
+                              for i in range(1, 21)])
+        self.session.commit()
+        cache.CACHE.invalidate()
+        self.path = os.path.join(self.tmpdir, 'timeclock.sock')
+        self.server = punchd.make_server(self.path, self.session,
+                                         window=0.05)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        punchd.shutdown(self.server)
+        self.thread.join()
+        self.session.close()
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+        cache.CACHE.invalidate()
+
+    def test_group_commit(self):
+        """concurrent punches should be committed together and acknowledged"""
+        start = datetime.datetime(2014, 9, 1, 8)
+        replies = {}
+
+        def punch(employee_id):
+            client = punchd.Client(self.path)
+            replies[employee_id] = [
+                client.request(punchd.punch_request(
+                    'clock-in', employee_id, 'PYTIME', start)),
+                client.request(punchd.punch_request(
+                    'clock-out', employee_id,
+                    at=start + datetime.timedelta(hours=1)))]
+            client.close()
+        threads = [threading.Thread(target=punch, args=(i,))
+                   for i in range(1, 21)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for clock_in, clock_out in replies.values():
+            self.assertTrue(clock_in['ok'])
+            self.assertEqual(clock_out['seconds'], 3600)
+        stats = punchd.send({'op': 'stats'}, self.path)
+        self.assertEqual(stats['punches'], 40)
+        self.assertLess(stats['batches'], 40)
+
+        session = sessionmaker(bind=self.engine)()
+        self.assertEqual(session.query(Clocktime)
+                         .filter(Clocktime.time_out != None).count(), 20)
+        self.assertEqual(session.query(DailyTotal).count(), 20)
+        session.close()
+
+    def test_errors(self):
+        """bad punches get an error reply without affecting others"""
+        send = lambda request: punchd.send(request, self.path)
+        self.assertTrue(send(punchd.punch_request('clock-in', 1, 'PYTIME'))
+                        ['ok'])
+        reply = send(punchd.punch_request('clock-in', 1, 'PYTIME'))
+        self.assertIn("already clocked in", reply['error'])
+        self.assertIn("not clocked in",
+                      send(punchd.punch_request('break', 2))['error'])
+        self.assertIn("No job", send(punchd.punch_request(
+            'clock-in', 2, 'NOPE'))['error'])
+        self.assertIn("Unknown operation", send({'op': 'nap'})['error'])
+        self.assertTrue(send(punchd.punch_request('break', 1))['ok'])
+        early = datetime.datetime.now() - datetime.timedelta(minutes=1)
+        self.assertIn("would overlap", send(punchd.punch_request(
+            'clock-in', 1, 'PYTIME', early))['error'])
+        send(punchd.punch_request('clock-in', 2, 'PYTIME'))
+        self.assertIn("Can't clock out", send(punchd.punch_request(
+            'clock-out', 2, at=early))['error'])
+        self.assertRaises(punchd.DaemonUnavailable, punchd.send,
+                          {'op': 'stats'},
+                          os.path.join(self.tmpdir, 'nothing.sock'))
+
+if __name__ == "__main__":
+    unittest.main()
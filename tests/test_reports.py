@@ -0,0 +1,86 @@
+from datetime import datetime
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from sqlalchemy import create_engine
+import payroll
+import reports
+from models import Base
+from tests.db import synthetic
+
+
+class Test_Reports(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'timesheet.db')
+        self.engine = create_engine('sqlite:///{}'.format(self.path))
+        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            synthetic.generate(connection, employees=13, jobs=5, days=45)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def report(self, *args, **kwargs):
+        out = StringIO()
+        count = reports.employee_report(self.path, out, *args, **kwargs)
+        return count, out.getvalue()
+
+    def test_employee_ranges(self):
+        with self.engine.connect() as connection:
+            self.assertEqual(reports.employee_ranges(connection, 4),
+                             [(1, 4), (5, 8), (9, 12), (13, 13)])
+            self.assertEqual(reports.employee_ranges(connection, 1),
+                             [(1, 13)])
+            self.assertEqual(len(reports.employee_ranges(connection, 50)), 13)
+
+    def test_parallel_matches_serial(self):
+        """splitting the employees across processes changes no bytes"""
+        start, end = datetime(2014, 1, 1), datetime(2014, 2, 1)
+        # shifts with no employee, or one that isn't in employees
+        for employee_id in (None, 99):
+            self.engine.execute(
+                "INSERT INTO clocktimes (employee_id, job_id, time_in, "
+                "time_out) VALUES (?, 1, '2014-01-06 09:00:00.000000', "
+                "'2014-01-06 17:00:00.000000')", (employee_id,))
+        count, serial = self.report(start, end, 'week')
+        self.assertEqual(self.report(start, end, 'week', processes=2),
+                         (count, serial))
+        self.assertEqual(self.report(start, end, 'week', processes=3,
+                                     chunks=13), (count, serial))
+        rows = list(csv.reader(StringIO(serial)))
+        self.assertEqual(rows[0], reports.FIELDS)
+        self.assertEqual(len(rows), count + 1)
+        ids = [int(row[0]) if row[0] else None for row in rows[1:]]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual((ids[0], ids[-1]), (None, 99))
+
+    def test_totals(self):
+        """the report's hours and pay add up to payroll()'s"""
+        count, out = self.report(period='month')
+        with self.engine.connect() as connection:
+            lines = payroll.payroll(connection, period='month')
+        rows = list(csv.DictReader(StringIO(out)))
+        self.assertEqual(count, len(lines))
+        self.assertEqual(sum(int(row['hours'].replace(".", ""))
+                             for row in rows),
+                         sum(line.tenths for line in lines))
+        self.assertEqual(sum(int(row['pay'].replace(".", ""))
+                             for row in rows),
+                         sum(line.cents for line in lines))
+
+    def test_read_only(self):
+        """workers can't write to the database"""
+        engine = reports.database.make_engine(self.path, journal_mode=None,
+                                              read_only=True)
+        with self.assertRaises(Exception):
+            engine.execute("DELETE FROM clocktimes")
+        engine.dispose()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import batch
+import snapshot
+from models import Base, Clocktime, Employee, Job
+
+START = datetime(2014, 9, 1, 8)
+
+
+class Test_Snapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmpdir, 'snapshot')
+        self.engine = create_engine('sqlite:///')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add_all([Job(id=1, name="Python Time", abbr="PYTIME",
+                                  rate=20000),
+                              Job(id=2, name="Other", abbr="OTHER",
+                                  rate=1500)] +
+                             [Employee(id=i, firstname="Worker",
+                                       lastname=str(i)) for i in (1, 2, 3)])
+        self.add_shifts(0, 10)
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(self.tmpdir)
+
+    def add_shifts(self, first, last):
+        for n in range(first, last):
+            time_in = START + timedelta(hours=n * 10)
+            self.session.add(Clocktime(
+                employee_id=n % 3 + 1, job_id=n % 2 + 1, time_in=time_in,
+                time_out=time_in + timedelta(minutes=30 + n * 7)))
+
+    def update(self, **kwargs):
+        return snapshot.update(self.session.connection(), self.directory,
+                               batch_size=4, **kwargs)
+
+    def test_matches_database(self):
+        """load() should give the same arrays as batch.load_arrays"""
+        self.assertEqual(self.update(), 10)
+        arrays = snapshot.load(self.directory)
+        self.assertIsInstance(arrays['time_in'].base, np.memmap)
+        self.assertFalse(arrays['time_in'].flags.writeable)
+        expected = batch.load_arrays(self.session.connection())
+        for column in expected:
+            self.assertEqual(list(arrays[column]), list(expected[column]))
+        self.assertEqual(batch.aggregate(arrays), batch.aggregate(expected))
+        self.assertEqual(snapshot.state(self.directory), (10, 10))
+
+    def test_incremental(self):
+        """update() should append only new rows, stopping at open shifts"""
+        self.update()
+        self.session.add(Clocktime(employee_id=1, job_id=1,
+                                   time_in=START + timedelta(days=30)))
+        self.add_shifts(10, 15)
+        self.session.commit()
+        self.assertEqual(self.update(), 0)  # id 11 is still open
+        self.session.query(Clocktime).get(11).time_out = \
+            START + timedelta(days=30, hours=1)
+        self.session.commit()
+        self.assertEqual(self.update(), 6)
+        arrays = snapshot.load(self.directory)
+        self.assertEqual(list(arrays['id']), range(1, 17))
+        self.assertEqual(self.update(), 0)
+        self.assertEqual(self.update(rebuild=True), 16)
+        self.assertEqual(snapshot.state(self.directory), (16, 16))
+
+    def test_bad_file(self):
+        """A file without the snapshot header should be refused"""
+        self.update()
+        with open(os.path.join(self.directory, 'rate.col'), 'r+b') as f:
+            f.write(b"NOTASNAP")
+        self.assertRaises(snapshot.SnapshotError, snapshot.load,
+                          self.directory)
+
+if __name__ == "__main__":
+    unittest.main()
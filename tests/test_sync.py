@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+import unittest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+import sync
+from instrumentation import QueryCounter
+from models import (Base, Clocktime, DailySketch, DailyTotal, Employee, Job,
+                    changes)
+from tests.db import synthetic
+
+START = datetime(2014, 9, 1, 8)
+
+
+class Test_Sync(unittest.TestCase):
+
+    def setUp(self):
+        self.kiosk = create_engine('sqlite:///')
+        self.central = create_engine('sqlite:///')
+        for engine in (self.kiosk, self.central):
+            Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=self.kiosk)()
+        self.session.add_all([
+            Job(id=1, name="Python Time", abbr="PYTIME", rate=20000),
+            Employee(id=1, firstname="Adam", lastname="Smith")])
+        for day in range(5):
+            time_in = START + timedelta(days=day)
+            self.session.add(Clocktime(employee_id=1, job_id=1,
+                                       time_in=time_in,
+                                       time_out=time_in + timedelta(hours=8)))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    def rows(self, engine, model):
+        table = model.__table__
+        return engine.execute(
+            select(sync._data_columns(table)).order_by(*table.primary_key)
+        ).fetchall()
+
+    def assertSynced(self):
+        for model in (Employee, Job, Clocktime, DailyTotal, DailySketch):
+            self.assertEqual(self.rows(self.central, model),
+                             self.rows(self.kiosk, model))
+
+    def test_stamps(self):
+        """each flush stamps its changes with the next sequence number"""
+        seq = changes.current_sequence(self.kiosk)
+        self.assertEqual(set(seq for (seq,) in self.kiosk.execute(
+            "SELECT change_seq FROM clocktimes")), set([seq]))
+        clocktime = self.session.query(Clocktime).get(2)
+        clocktime.time_out += timedelta(hours=1)
+        self.session.commit()
+        self.assertEqual(clocktime.change_seq, seq + 1)
+        self.session.query(Clocktime).get(2).job_id = 1  # not a change
+        self.session.commit()
+        self.assertEqual(changes.current_sequence(self.kiosk), seq + 1)
+        self.session.delete(clocktime)
+        self.session.commit()
+        self.assertEqual(self.kiosk.execute(
+            "SELECT table_name, row_id, change_seq FROM deletions")
+            .fetchall(), [("clocktimes", 2, seq + 2)])
+        self.session.add(Clocktime(employee_id=1, job_id=1, time_in=START))
+        self.session.rollback()
+        self.assertEqual(changes.current_sequence(self.kiosk), seq + 2)
+
+    def test_sync(self):
+        """only what changed since the last sync is sent"""
+        result = sync.sync(self.kiosk, self.central)
+        self.assertEqual(result.upserted['clocktimes'], 5)
+        self.assertSynced()
+        # again: nothing to do
+        result = sync.sync(self.kiosk, self.central)
+        self.assertEqual(sum(result.upserted.values()), 0)
+        clocktime = self.session.query(Clocktime).get(3)
+        clocktime.time_out = clocktime.time_in + timedelta(hours=2)
+        self.session.delete(self.session.query(Clocktime).get(4))
+        self.session.add(Clocktime(employee_id=1, job_id=1,
+                                   time_in=START + timedelta(days=7),
+                                   time_out=START + timedelta(days=7,
+                                                              hours=3)))
+        self.session.commit()
+        result = sync.sync(self.kiosk, self.central)
+        self.assertEqual(result.upserted, {'clocktimes': 2, 'employees': 0,
+                                           'jobs': 0})
+        self.assertEqual(result.deleted['clocktimes'], 1)
+        self.assertSynced()
+
+    def test_cost_follows_changes(self):
+        """a sync's statements don't depend on the size of the database"""
+        with self.kiosk.begin() as connection:
+            synthetic.generate(connection, employees=20, jobs=3, days=10)
+        sync.sync(self.kiosk, self.central)
+        self.assertSynced()
+        self.session.query(Clocktime).get(1).job_id = 3
+        self.session.commit()
+        with QueryCounter(self.central) as counter:
+            result = sync.sync(self.kiosk, self.central)
+        self.assertEqual(sum(result.upserted.values()), 1)
+        self.assertLess(counter.count, 20)
+        self.assertSynced()
+
+    def test_sync_back(self):
+        """changes synced back and forth settle"""
+        sync.sync(self.kiosk, self.central)
+        result = sync.sync(self.central, self.kiosk)
+        self.assertEqual(sum(result.upserted.values()), 0)
+        session = sessionmaker(bind=self.central)()
+        session.query(Job).get(1).rate = 25000
+        session.commit()
+        result = sync.sync(self.central, self.kiosk)
+        self.assertEqual(result.upserted['jobs'], 1)
+        self.assertEqual(self.session.query(Job.rate).scalar(), 25000)
+        result = sync.sync(self.kiosk, self.central)
+        self.assertEqual(sum(result.upserted.values()), 0)
+        self.assertEqual(result.conflicts, [])
+        session.close()
+
+    def test_conflicts(self):
+        """rows changed on both sides follow on_conflict"""
+        sync.sync(self.kiosk, self.central)
+        session = sessionmaker(bind=self.central)()
+        session.query(Clocktime).get(1).time_out = START + \
+            timedelta(hours=4)
+        session.commit()
+        self.session.query(Clocktime).get(1).time_out = START + \
+            timedelta(hours=6)
+        self.session.query(Clocktime).get(2).time_out = START + \
+            timedelta(days=1, hours=6)
+        self.session.commit()
+        before = self.rows(self.central, Clocktime)
+        with self.assertRaises(sync.SyncConflict) as raised:
+            sync.sync(self.kiosk, self.central)
+        self.assertEqual(raised.exception.conflicts, [('clocktimes', 1)])
+        self.assertEqual(self.rows(self.central, Clocktime), before)
+        result = sync.sync(self.kiosk, self.central, on_conflict='target')
+        self.assertEqual(result.conflicts, [('clocktimes', 1)])
+        self.assertEqual(session.query(Clocktime.time_out)
+                         .filter_by(id=1).scalar(),
+                         START + timedelta(hours=4))
+        self.assertEqual(session.query(Clocktime.time_out)
+                         .filter_by(id=2).scalar(),
+                         START + timedelta(days=1, hours=6))
+        session.close()
+
+    def test_self(self):
+        self.assertRaises(ValueError, sync.sync, self.kiosk, self.kiosk)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,19 @@
 import unittest
 import tc
-from datetime import timedelta  # test against time_formatter output
+from datetime import date, datetime, timedelta
+from StringIO import StringIO
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Clocktime, DailyTotal, Employee, Job, cache, search, \
+    shifts
+import gc
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
 
 class Test_TC(unittest.TestCase):
     
@@ -19,5 +32,232 @@ class Test_TC(unittest.TestCase):
                          timedelta(hours=1, minutes=6))
         self.assertRaises(ValueError, tc.time_formatter, "wrong input")
 
+    def test_hours_worked(self):
+        """hours_worked should round seconds to the nearest tenth hour"""
+        self.assertEqual(tc.hours_worked(5570), 1.5)
+        self.assertEqual(tc.hours_worked(179), 0.0)
+        self.assertEqual(tc.hours_worked(180), 0.1)
+        self.assertEqual(tc.hours_worked(86400 + 3600), 25.0)
+
+
+class TCSessionTestBase(unittest.TestCase):
+    """Points tc at a fresh in-memory database and captures its output"""
+
+    def setUp(self):
+        engine = create_engine('sqlite:///')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.session.add_all([Employee(firstname="Adam", lastname="Smith"),
+                              Job(name="Python Time", abbr="PYTIME",
+                                  rate=20000)])
+        self.session.commit()
+        cache.CACHE.invalidate()
+        shifts.REGISTRY.invalidate()
+        search.INDEX.invalidate()
+        self.old_session, tc.Session = tc.Session, sessionmaker(bind=engine)
+        self.old_stdout, sys.stdout = sys.stdout, StringIO()
+        self.old_stderr, sys.stderr = sys.stderr, StringIO()
+
+    def tearDown(self):
+        tc.Session = self.old_session
+        sys.stdout = self.old_stdout
+        sys.stderr = self.old_stderr
+        self.session.close()
+        cache.CACHE.invalidate()
+        shifts.REGISTRY.invalidate()
+        search.INDEX.invalidate()
+
+
+class Test_TC_CLI(TCSessionTestBase):
+
+    def test_clock_in_out(self):
+        """clock-in then clock-out should record one closed shift"""
+        self.assertEqual(tc.main(['clock-in', '1', 'PYTIME', '--at', '0:00']),
+                         0)
+        self.assertEqual(tc.main(['clock-in', '1', 'PYTIME']), 1)
+        self.assertIn("already clocked in", sys.stderr.getvalue())
+        self.assertEqual(tc.main(['clock-out', '1', '--at', '2:00']), 0)
+        clocktime = self.session.query(Clocktime).one()
+        self.assertEqual(clocktime.seconds_worked, 7200)
+        self.assertEqual(self.session.query(DailyTotal.seconds).scalar(),
+                         7200)
+        self.assertEqual(tc.main(['clock-out', '1']), 1)
+        self.assertEqual(tc.main(['report', '--date', str(date.today())]),
+                         0)
+        self.assertIn("PYTIME", sys.stdout.getvalue())
+
+    def test_clock_in_overlap(self):
+        """the menu's clock in refuses overlapping shifts like punches do"""
+        import punchd
+        when = datetime(2014, 1, 6, 12)
+        self.session.add(Clocktime(employee_id=1, job_id=1,
+                                   time_in=when - timedelta(hours=4),
+                                   time_out=when + timedelta(hours=1)))
+        self.session.commit()
+        with self.assertRaises(punchd.PunchError):
+            tc.clock_in(1, 1, when)
+        self.assertEqual(self.session.query(Clocktime).count(), 1)
+        tc.clock_in(1, 1, when + timedelta(hours=1))
+        self.assertEqual(self.session.query(Clocktime).count(), 2)
+
+    def test_who_and_close_stale(self):
+        """who lists open shifts; close-stale closes the abandoned ones"""
+        self.assertEqual(tc.main(['who']), 0)
+        self.assertIn("Nobody is clocked in", sys.stdout.getvalue())
+        tc.main(['clock-in', '1', 'PYTIME'])
+        self.assertEqual(tc.main(['who']), 0)
+        self.assertIn("Adam Smith", sys.stdout.getvalue())
+        self.assertEqual(tc.main(['close-stale']), 0)
+        self.assertIn("Closed 0 stale shifts", sys.stdout.getvalue())
+        self.assertEqual(tc.main(['close-stale', '--hours', '-1']), 0)
+        self.assertIn("Closed 1 stale shifts", sys.stdout.getvalue())
+        self.assertEqual(tc.main(['clock-out', '1']), 1)
+
+    def test_jobs(self):
+        """jobs should list the jobs matching a search"""
+        self.assertEqual(tc.main(['jobs', 'python']), 0)
+        self.assertIn("PYTIME", sys.stdout.getvalue())
+        self.assertEqual(tc.main(['jobs', 'nothing like it']), 0)
+        self.assertIn("No jobs match", sys.stdout.getvalue())
+
+    def test_durations(self):
+        """durations should print each job's median and p90 shift
+
+        The sketches' bins are 2% wide, so 1:30 may read as 1:29.
+        """
+        tc.main(['clock-in', '1', 'PYTIME', '--at', '0:00'])
+        tc.main(['clock-out', '1', '--at', '1:30'])
+        self.assertEqual(tc.main(['durations', '--kind', 'shift']), 0)
+        self.assertRegexpMatches(sys.stdout.getvalue(),
+                                 r"PYTIME +1 +1:[23]\d +1:[23]\d")
+        self.assertEqual(tc.main(['durations', '--kind', 'break',
+                                  '--by', 'employee']), 0)
+        self.assertIn("No breaks", sys.stdout.getvalue())
+
+    def test_unknown_employee_or_job(self):
+        """clock-in should refuse unknown employees and jobs"""
+        self.assertEqual(tc.main(['clock-in', '2', 'PYTIME']), 1)
+        self.assertEqual(tc.main(['clock-in', '1', 'NOPE']), 1)
+        self.assertEqual(self.session.query(Clocktime).count(), 0)
+
+    def test_invalid_arguments(self):
+        """bad arguments should exit before touching the database"""
+        self.assertRaises(SystemExit, tc.main, ['clock-in', 'x', 'PYTIME'])
+        self.assertRaises(SystemExit, tc.main,
+                          ['clock-out', '1', '--at', '25:00'])
+
+    def test_stats_and_profile(self):
+        """--stats should dump timings as JSON; --profile cProfile stats"""
+        directory = tempfile.mkdtemp()
+        try:
+            stats = os.path.join(directory, "stats.json")
+            profile = os.path.join(directory, "profile")
+            self.assertEqual(tc.main(['--stats', stats, '--slow-ms', '1e6',
+                                      '--profile', profile, 'who']), 0)
+            with open(stats) as f:
+                histograms = json.load(f)['histograms']
+            self.assertEqual(histograms['command.who']['count'], 1)
+            self.assertGreater(histograms['sql']['count'], 0)
+            self.assertTrue(pstats.Stats(profile).total_calls)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_lazy_import(self):
+        """importing tc shouldn't import SQLAlchemy"""
+        code = "import sys, tc; sys.exit('sqlalchemy' in sys.modules)"
+        self.assertEqual(subprocess.call([sys.executable, '-c', code]), 0)
+
+
+def frame_depth():
+    frame, depth = sys._getframe(1), 0
+    while frame is not None:
+        frame, depth = frame.f_back, depth + 1
+    return depth
+
+
+class Test_TC_Menu(TCSessionTestBase):
+
+    TRANSITIONS = 100000
+    # one clock in, break, resume and clock out: 3 menu transitions
+    CLOCK_CYCLE = ['1', 'PYTIME', '1', '2', '2', '', 'y', '3']
+    # 3 cheap transitions: formatter, total time and a bad selection
+    IDLE_CYCLE = ['5', '01:30', '6', '9:00 AM', '5:00 PM', '', 'x']
+
+    def script(self):
+        """Yields menu input for TRANSITIONS transitions, then quits"""
+        for n in range(self.TRANSITIONS // 3):
+            if n % 100 == 0:
+                answers = self.CLOCK_CYCLE
+            else:
+                answers = self.IDLE_CYCLE
+            for answer in answers:
+                yield answer
+        yield '9'
+
+    def test_project_start_search(self):
+        """an unknown abbreviation should offer matching jobs to pick"""
+        answers = iter(['python', '1', '1'])
+        tc.raw_input = lambda prompt="": next(answers)
+        try:
+            state = tc.ClockState()
+            tc.project_start(state)
+        finally:
+            del tc.raw_input
+        self.assertIn("1. PYTIME (Python Time)", sys.stdout.getvalue())
+        self.assertEqual(state.job.abbr, "PYTIME")
+        self.assertEqual(self.session.query(Job).count(), 1)
+
+    def test_menu_soak(self):
+        """the menu loop should run flat: no recursion and no leaks"""
+        script = self.script()
+        depths = set()
+        sizes = []
+
+        def fake_input(prompt=""):
+            depths.add(frame_depth())
+            if len(depths) > 10:
+                self.fail("menu stack keeps growing: {}".format(
+                    sorted(depths)))
+            answer = next(script)
+            if answer == 'x' and len(sizes) < 10:
+                gc.collect()
+                sizes.append(len(gc.get_objects()))
+            return answer
+
+        tc.raw_input = fake_input
+        try:
+            state = tc.main_menu()
+        finally:
+            del tc.raw_input
+        gc.collect()
+        self.assertFalse(state.running)
+        self.assertEqual(state.status, 0)
+        self.assertEqual(self.session.query(Clocktime).count(),
+                         2 * (self.TRANSITIONS // 300 + 1))
+        self.assertLess(len(gc.get_objects()) - max(sizes), 1000)
+
+
+class Test_TC_Soak(TCSessionTestBase):
+
+    PUNCHES = 1000
+
+    def test_punch_soak(self):
+        """punches shouldn't leave objects behind between units of work"""
+        start = datetime(2014, 9, 1, 8)
+        sizes = []
+        for n in range(self.PUNCHES):
+            at = start + timedelta(hours=n)
+            if n % 2:
+                reply = tc._punch('clock-out', 1, at=at)
+            else:
+                reply = tc._punch('clock-in', 1, 'PYTIME', at)
+            self.assertTrue(reply['ok'], reply)
+            if n % (self.PUNCHES // 10) == self.PUNCHES // 10 - 1:
+                gc.collect()
+                sizes.append(len(gc.get_objects()))
+        self.assertEqual(self.session.query(Clocktime).count(),
+                         self.PUNCHES // 2)
+        self.assertLess(sizes[-1] - sizes[1], 200)
+
 if __name__ == "__main__":
     unittest.main()
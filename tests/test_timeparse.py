@@ -0,0 +1,40 @@
+import datetime
+import unittest
+import timeparse
+import tc
+
+
+class Test_Timeparse(unittest.TestCase):
+
+    def test_parse_time(self):
+        """parse_time should accept every form get_time used to"""
+        cases = {"3": 180, "3:05": 185, "15:05": 905, "0:00": 0,
+                 "3:05 p": 905, "3:05 P": 905, "03:05 PM": 905,
+                 "3:5 pm": 905, "12:00 AM": 0, "12:30 p": 750,
+                 "3 PM": 900, "3pm": 900, " 11:59 am ": 719}
+        for text, minute in cases.items():
+            self.assertEqual(timeparse.parse_time(text), minute, text)
+        self.assertEqual(timeparse.parse_times(list(cases)),
+                         list(cases.values()))
+
+    def test_parse_time_errors(self):
+        """parse_time should say what is wrong with bad input"""
+        cases = {"13:00 PM": "1-12", "24:00": "0-23", "3:60": "00-59",
+                 "3:05 XM": "AM or PM", "noon": "expected a time", "": ""}
+        for text, message in cases.items():
+            self.assertRaisesRegexp(timeparse.TimeFormatError, message,
+                                    timeparse.parse_time, text)
+        self.assertRaisesRegexp(timeparse.TimeFormatError, "Value 1",
+                                timeparse.parse_times, ["3:05", "25:00"])
+        self.assertRaisesRegexp(timeparse.TimeFormatError, "Value 1",
+                                timeparse.parse_times,
+                                iter(["3:05", "25:00"]))
+
+    def test_get_time(self):
+        """get_time should match the strptime result it replaces"""
+        self.assertEqual(tc.get_time("3:05 p"),
+                         datetime.datetime.strptime("3:05 PM", "%I:%M %p"))
+        self.assertRaises(ValueError, tc.get_time, "whenever")
+
+if __name__ == "__main__":
+    unittest.main()
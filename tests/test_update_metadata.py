@@ -0,0 +1,70 @@
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.exc import IntegrityError
+import unittest
+import update_metadata
+from tests.db.legacy import OLD_SCHEMA
+
+
+class Test_UpdateMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///')
+        for statement in OLD_SCHEMA:
+            self.engine.execute(statement)
+        self.engine.execute("INSERT INTO jobs (name, abbr, rate) "
+                            "VALUES ('Python Time', 'PYTIME', 20000)")
+
+    def index_names(self, table_name):
+        return {ix['name'] for ix in
+                inspect(self.engine).get_indexes(table_name)}
+
+    def test_migrate(self):
+        """migrate should add missing indexes without touching data"""
+        created = update_metadata.migrate(self.engine)
+        self.assertIn('ix_clocktimes_employee_time_in', created)
+        self.assertIn('ix_clocktimes_open', created)
+        self.assertIn('ix_jobs_abbr', self.index_names('jobs'))
+        self.assertEqual(
+            self.engine.execute("SELECT abbr FROM jobs").scalar(), "PYTIME")
+        # running it again is a no-op
+        self.assertEqual(update_metadata.migrate(self.engine), [])
+
+    def test_migrate_adds_columns(self):
+        """migrate should add change_seq and stamp the existing rows"""
+        update_metadata.migrate(self.engine)
+        self.assertIn('change_seq', [column['name'] for column in
+                                     inspect(self.engine).get_columns('jobs')])
+        self.assertEqual(self.engine.execute(
+            "SELECT change_seq FROM jobs").fetchall(), [(1,)])
+        self.assertEqual(update_metadata.missing_columns(self.engine), [])
+
+    def test_migrate_backfills_rollup(self):
+        """migrate should fill daily_totals from existing clocktimes"""
+        self.engine.execute(
+            "INSERT INTO employees (firstname, lastname) "
+            "VALUES ('Adam', 'Smith')")
+        self.engine.execute(
+            "INSERT INTO clocktimes (time_in, time_out, employee_id, job_id) "
+            "VALUES ('2014-09-01 08:00:00.000000', "
+            "'2014-09-01 10:00:00.000000', 1, 1)")
+        update_metadata.migrate(self.engine)
+        self.assertEqual(self.engine.execute(
+            "SELECT seconds FROM daily_totals").fetchall(), [(7200,)])
+
+    def test_migrate_duplicate_abbr(self):
+        """migrate should refuse to build ix_jobs_abbr over duplicates"""
+        self.engine.execute("INSERT INTO jobs (name, abbr, rate) "
+                            "VALUES ('Other', 'PYTIME', 100)")
+        self.assertRaises(IntegrityError, update_metadata.migrate,
+                          self.engine)
+
+    def test_open_shift_query_plan(self):
+        """open shift lookups should use the partial index"""
+        update_metadata.migrate(self.engine)
+        plan = self.engine.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM clocktimes "
+            "WHERE employee_id = 1 AND time_out IS NULL").fetchall()
+        self.assertIn('ix_clocktimes_open', str(plan))
+
+if __name__ == "__main__":
+    unittest.main()
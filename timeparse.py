@@ -0,0 +1,128 @@
+"""Parsing of the times of day and hh:mm durations users type in
+
+Every accepted spelling of a time of day -- "3", "3:05", "3:05 p",
+"03:05 PM", "3pm", "15:05" -- is precomputed into one table mapping it to
+a minute of the day, so parsing is a strip, a lower and a dict lookup.
+Times with an AM/PM suffix use the 12 hour clock, times without one
+the 24 hour clock. Only failed lookups do any more work, to say what was
+wrong with the input.
+"""
+
+import datetime
+
+
+class TimeFormatError(ValueError):
+    """Raised for a time or duration that can't be parsed"""
+
+
+def _hour_spellings(hours):
+    for hour in hours:
+        yield str(hour), hour
+        if hour < 10:
+            yield "0" + str(hour), hour
+
+
+def _minute_spellings():
+    for minute in range(60):
+        yield "{:02d}".format(minute), minute
+        if minute < 10:
+            yield str(minute), minute
+
+
+def _build_table():
+    table = {}
+    minutes = list(_minute_spellings())
+    for hour_text, hour in _hour_spellings(range(24)):
+        table[hour_text] = hour * 60
+        for minute_text, minute in minutes:
+            table[hour_text + ":" + minute_text] = hour * 60 + minute
+    suffixes = [(suffix, offset)
+                for base, offset in (("a", 0), ("am", 0),
+                                     ("p", 12 * 60), ("pm", 12 * 60))
+                for suffix in (" " + base, base)]
+    for hour_text, hour in _hour_spellings(range(1, 13)):
+        clocks = [(hour_text, 0)] + [(hour_text + ":" + minute_text, minute)
+                                     for minute_text, minute in minutes]
+        for clock, minute in clocks:
+            for suffix, offset in suffixes:
+                table[clock + suffix] = (hour % 12) * 60 + offset + minute
+    return table
+
+_TABLE = _build_table()
+
+
+def _diagnose(text):
+    """Explains why text isn't in _TABLE"""
+    clock, _, suffix = text.strip().lower().partition(" ")
+    if not suffix and clock[-2:] in ("am", "pm"):
+        clock, suffix = clock[:-2], clock[-2:]
+    elif not suffix and clock[-1:] in ("a", "p"):
+        clock, suffix = clock[:-1], clock[-1:]
+    hour_text, colon, minute_text = clock.partition(":")
+    if not hour_text.isdigit():
+        return "{!r}: expected a time like 3:05 PM or 15:05".format(text)
+    if colon and not (minute_text.isdigit() and len(minute_text) <= 2 and
+                      int(minute_text) < 60):
+        return "{!r}: minutes must be 00-59".format(text)
+    if suffix.strip() not in ("", "a", "am", "p", "pm"):
+        return "{!r}: expected AM or PM, not {!r}".format(text, suffix)
+    if suffix and not 1 <= int(hour_text) <= 12:
+        return "{!r}: hours must be 1-12 with AM/PM".format(text)
+    if not suffix and int(hour_text) > 23:
+        return "{!r}: hours must be 0-23 without AM/PM".format(text)
+    return "{!r}: unrecognized time".format(text)
+
+
+def parse_time(text):
+    """Returns the minute of the day text refers to
+
+    parse_time("3:05 PM") -> 905
+    Raises TimeFormatError for anything else.
+    """
+    try:
+        return _TABLE[text.strip().lower()]
+    except (KeyError, AttributeError):
+        raise TimeFormatError(_diagnose(str(text)))
+
+
+def parse_times(texts):
+    """parse_time over a whole column of strings, returning a list
+
+    texts can be any iterable. The error for a bad value says which one
+    it was.
+    """
+    texts = list(texts)  # read twice if there's a bad one
+    table = _TABLE
+    try:
+        return [table[text.strip().lower()] for text in texts]
+    except (KeyError, AttributeError):
+        for index, text in enumerate(texts):
+            try:
+                parse_time(text)
+            except TimeFormatError as e:
+                raise TimeFormatError("Value {}: {}".format(index, e))
+        raise
+
+
+def to_datetime(minute_of_day, date=datetime.date(1900, 1, 1)):
+    """Returns minute_of_day on date as a datetime
+
+    The default date matches what strptime gives for a bare time.
+    """
+    hour, minute = divmod(minute_of_day, 60)
+    return datetime.datetime(date.year, date.month, date.day, hour, minute)
+
+
+def parse_duration(text):
+    """Splits an hh:mm duration into (hours, minutes) integers
+
+    Neither part is range checked: parse_duration("00:67") -> (0, 67)
+    """
+    hours, colon, minutes = text.partition(":")
+    try:
+        if not colon or ":" in minutes:
+            raise ValueError
+        return int(hours), int(minutes)
+    except ValueError:
+        raise TimeFormatError(
+            "Please check input format and try again. (00:00)")
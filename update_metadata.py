@@ -1,7 +1,103 @@
-from sqlalchemy import create_engine
-from models import Employee, Job, Clocktime, Base
-from tc import DB_NAME
+"""Brings an existing timesheet database up to the current schema
 
-engine = create_engine('sqlite:///{}'.format(DB_NAME))
+Safe to run any number of times. New tables are created (and the daily
+rollup and duration sketches backfilled from existing clocktimes), new
+columns are added with ALTER TABLE (existing rows are stamped with one
+change sequence number when change_seq is added), and any indexes
+declared on the models but missing from the database are added in
+place, so existing timesheet.db files never need to be rebuilt.
+"""
 
-Base.metadata.create_all(engine)
+import logging
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+
+from models import Base, DailySketch, DailyTotal, changes, durations, rollup
+
+
+def missing_indexes(engine):
+    """Returns the model Indexes that don't exist in the database yet"""
+    inspector = inspect(engine)
+    existing = set()
+    for table_name in inspector.get_table_names():
+        existing.update(ix['name'] for ix in
+                        inspector.get_indexes(table_name))
+    return [index for table in Base.metadata.sorted_tables
+            for index in table.indexes
+            if index.name not in existing]
+
+
+def missing_columns(engine):
+    """Returns the model Columns of existing tables that they lack"""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name in tables:
+            existing = set(column['name'] for column in
+                           inspector.get_columns(table.name))
+            missing.extend(column for column in table.columns
+                           if column.name not in existing)
+    return missing
+
+
+def add_column(connection, column):
+    """ALTER TABLE ... ADD COLUMN for a nullable, non-key Column"""
+    connection.execute("ALTER TABLE {} ADD COLUMN {} {}".format(
+        column.table.name, column.name,
+        column.type.compile(dialect=connection.dialect)))
+
+
+def migrate(engine):
+    """Upgrades the database behind engine in place
+
+    Returns a list of the names of the indexes that were created.
+    Raises IntegrityError if a unique index can't be built because of
+    duplicate data (e.g. two jobs sharing an abbreviation).
+    """
+
+    new_tables = set(Base.metadata.tables) - \
+        set(inspect(engine).get_table_names())
+    # create_all skips tables that already exist -- and their indexes
+    # along with them -- so those are added separately below.
+    Base.metadata.create_all(engine)
+    columns = missing_columns(engine)
+    if columns:
+        with engine.begin() as connection:
+            for column in columns:
+                logging.info("Adding column {}.{}".format(
+                    column.table.name, column.name))
+                add_column(connection, column)
+            stamp = [column.table for column in columns
+                     if column.name == 'change_seq']
+            if stamp:
+                seq = changes.next_sequence(connection)
+                for table in stamp:
+                    connection.execute(table.update().values(change_seq=seq))
+    if DailyTotal.__tablename__ in new_tables:
+        logging.info("Backfilling {}".format(DailyTotal.__tablename__))
+        with engine.begin() as connection:
+            rollup.rebuild(connection)
+    if DailySketch.__tablename__ in new_tables:
+        logging.info("Backfilling {}".format(DailySketch.__tablename__))
+        with engine.begin() as connection:
+            durations.rebuild(connection)
+    created = []
+    for index in missing_indexes(engine):
+        logging.info("Creating index {}".format(index.name))
+        try:
+            index.create(engine)
+        except IntegrityError as e:
+            logging.error("Could not create index {}: {}".format(
+                index.name, e))
+            raise
+        created.append(index.name)
+    return created
+
+
+if __name__ == "__main__":
+    from database import get_engine
+
+    for name in migrate(get_engine()):
+        print("Created index {}".format(name))